@@ -54,7 +54,7 @@ echo "[2/3] 准备启动..."
 echo ""
 
 # Run the translation script
-$PYTHON scripts/translate_to_result.py
+$PYTHON scripts/translate_to_result.py "$@"
 
 # Check exit code
 if [ $? -ne 0 ]; then
@@ -0,0 +1,142 @@
+"""
+<names> 块解析微基准：对比旧的多次正则扫描实现与预编译单次扫描实现
+
+用法: python scripts/bench_names_parser.py [样本数] [重复次数]
+
+旧实现原样保留在本文件中作为参照，运行时会先校验两者输出完全一致。
+"""
+
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import translate_to_result as current  # noqa: E402
+
+CONFIG = {"source_lang_priority": ["en", "fr"]}
+
+
+def legacy_extract_source_text(xml_text, config):
+    names_match = re.search(r"<names>.*?</names>", xml_text, re.DOTALL)
+    if not names_match:
+        return None
+
+    names_block = names_match.group(0)
+    if re.search(r"<name\s+lang=\"zh\">", names_block):
+        return None
+
+    for lang in config.get("source_lang_priority", ["en", "fr"]):
+        lang_match = re.search(
+            rf"<name\s+lang=\"{re.escape(lang)}\">\s*(.*?)\s*</name>",
+            names_block,
+            re.DOTALL,
+        )
+        if lang_match:
+            return lang_match.group(1).strip()
+
+    return None
+
+
+def legacy_insert_zh_name_with_translation(xml_text, translated):
+    names_match = re.search(r"<names>.*?</names>", xml_text, re.DOTALL)
+    if not names_match:
+        return xml_text, False
+
+    names_block = names_match.group(0)
+    if re.search(r"<name\s+lang=\"zh\">", names_block):
+        return xml_text, False
+
+    indent_match = re.search(r"\n([ \t]*)<name", names_block)
+    name_indent = indent_match.group(1) if indent_match else "    "
+    closing_indent_match = re.search(r"\n([ \t]*)</names>", names_block)
+    closing_indent = closing_indent_match.group(1) if closing_indent_match else ""
+
+    new_block = re.sub(
+        r"</names>",
+        f"\n{name_indent}<name lang=\"zh\">{translated}</name>\n{closing_indent}</names>",
+        names_block,
+        count=1,
+    )
+
+    new_text = xml_text.replace(names_block, new_block, 1)
+    return new_text, True
+
+
+def make_samples(count, body_size=4000):
+    random.seed(20260210)
+    langs = ["ar", "cs", "de", "en", "es", "fr", "it", "nl", "pl", "pt", "ru"]
+    samples = []
+    for index in range(count):
+        indent = random.choice(["    ", "  ", "\t", ""])
+        present = random.sample(langs, random.randint(1, len(langs)))
+        if index % 5 == 0:
+            present.append("zh")
+        lines = [f'{indent}<name lang="{lang}">Name {index} {lang}</name>' for lang in present]
+        if index % 17 == 0:
+            names = "<names>" + "".join(lines) + "</names>"
+        else:
+            names = "<names>\n" + "\n".join(lines) + f"\n{indent[:2]}</names>"
+        if index % 23 == 0:
+            names = ""
+        body = "<line x1=\"0\" y1=\"0\" x2=\"10\" y2=\"10\"/>\n" * (body_size // 40)
+        samples.append(
+            f'<definition type="element" width="20" height="20">\n'
+            f"  <uuid uuid=\"{{{index:08d}}}\"/>\n  {names}\n"
+            f"  <description>\n{body}  </description>\n</definition>\n"
+        )
+    return samples
+
+
+def check_equivalence(samples):
+    for text in samples:
+        assert current.extract_source_text(text, CONFIG) == legacy_extract_source_text(text, CONFIG)
+        assert current.insert_zh_name_with_translation(text, "译文") == legacy_insert_zh_name_with_translation(
+            text, "译文"
+        )
+
+
+def bench(label, fn, samples, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in samples:
+            fn(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    per_file = best / len(samples) * 1e6
+    print(f"  {label:<40} {best * 1000:8.1f} ms  {per_file:6.2f} us/file")
+    return best
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 5000
+    repeat = int(argv[2]) if len(argv) > 2 else 5
+    samples = make_samples(count)
+    check_equivalence(samples)
+    print(f"✓ 输出一致（{count} 个样本），最优耗时取 {repeat} 次中的最小值\n")
+
+    pairs = [
+        (
+            "extract_source_text",
+            lambda text: legacy_extract_source_text(text, CONFIG),
+            lambda text: current.extract_source_text(text, CONFIG),
+        ),
+        (
+            "insert_zh_name_with_translation",
+            lambda text: legacy_insert_zh_name_with_translation(text, "译文"),
+            lambda text: current.insert_zh_name_with_translation(text, "译文"),
+        ),
+    ]
+    for name, legacy_fn, current_fn in pairs:
+        print(name)
+        legacy_time = bench("legacy (re.search per tag)", legacy_fn, samples, repeat)
+        current_time = bench("compiled single pass", current_fn, samples, repeat)
+        print(f"  speedup: {legacy_time / current_time:.2f}x\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
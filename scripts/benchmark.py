@@ -0,0 +1,454 @@
+"""
+离线基准测试：合成元件库 + 本地模拟翻译服务
+
+不需要安装 QElectroTech，也不需要真实 API。每种模式先冷启动（空缓存、空 result）
+再热启动（沿用缓存、重新生成 result）、再原样重跑（沿用 result 和跳过索引）各跑一次，
+报告耗时、files/s 和 API 调用次数。
+
+用法:
+    python scripts/benchmark.py --files 2000 --unique 300 --latency 0.05
+    python scripts/benchmark.py --modes serial,batch --error-rate 0.02 --rate-429 0.01
+"""
+
+import argparse
+import collections
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import translate_to_result as ttr  # noqa: E402
+
+SOURCE_LANGS = ["ar", "cs", "de", "en", "es", "fr", "it", "nl", "pl", "pt", "ru"]
+WORDS = [
+    "relay", "switch", "contact", "coil", "terminal", "motor", "fuse", "breaker",
+    "sensor", "lamp", "button", "transformer", "valve", "cable", "socket", "diode",
+]
+
+
+def generate_library(
+    root, files=1000, unique_names=200, zh_ratio=0.1, body_size=8000, seed=20260210, variant_ratio=0.0
+):
+    """
+    生成类似 QET 的 elements 目录：每层带 qet_directory，.elmt 之间共享名称，
+    部分文件已有 zh 名称，<description> 为较大的正文；
+    variant_ratio 比例的名称写成大小写/空白不同的变体（用于测量翻译记忆）
+    """
+    rng = random.Random(seed)
+    names = [
+        " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).capitalize() + f" {index}"
+        for index in range(max(1, unique_names))
+    ]
+    categories = ["10_electric", "20_logic", "30_hydraulic", "40_pneumatic", "50_building"]
+    body_line = '    <line x1="0" y1="0" x2="10" y2="10" antialias="false" style="line-style:normal"/>\n'
+    body = body_line * max(1, body_size // len(body_line))
+
+    for category in categories:
+        write_qet_directory(os.path.join(root, category), category)
+
+    for index in range(files):
+        category = categories[index % len(categories)]
+        folder = os.path.join(root, category, f"{index // 100:03d}")
+        if not os.path.exists(os.path.join(folder, "qet_directory")):
+            write_qet_directory(folder, os.path.basename(folder))
+
+        name = names[rng.randrange(len(names))]
+        if rng.random() < variant_ratio:
+            name = rng.choice([name.upper(), name.lower(), name.replace(" ", "  "), f"{name}."])
+        present = rng.sample(SOURCE_LANGS, rng.randint(1, 5))
+        if "en" not in present:
+            present.append("en")
+        lines = [f'    <name lang="{lang}">{name}</name>' for lang in present]
+        if rng.random() < zh_ratio:
+            lines.append('    <name lang="zh">已有译文</name>')
+        text = (
+            f'<definition width="20" hotspot_x="10" hotspot_y="10" height="20" type="element" version="0.80">\n'
+            f'  <uuid uuid="{{{index:08d}-0000-0000-0000-000000000000}}"/>\n'
+            f"  <names>\n" + "\n".join(lines) + "\n  </names>\n"
+            f"  <informations></informations>\n"
+            f"  <description>\n{body}  </description>\n"
+            f"</definition>\n"
+        )
+        with open(os.path.join(folder, f"element_{index:06d}.elmt"), "w", encoding="utf-8", newline="\n") as f:
+            f.write(text)
+
+
+def write_qet_directory(folder, label):
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "qet_directory"), "w", encoding="utf-8") as f:
+        f.write(f'<qet-directory>\n  <names>\n    <name lang="en">{label}</name>\n  </names>\n</qet-directory>\n')
+
+
+def fake_translation(text, lang):
+    return f"{text} [{lang}]"
+
+
+class MockTranslationServer:
+    """
+    本地模拟翻译服务：
+    - POST /translate             {ToLang, text} -> {translate}
+    - POST /v1/chat/completions   单条 / 批量 / 多语言批量提示词
+    latency 为每次请求的延迟（秒），error_rate 概率返回 500，rate_429 概率返回 429 + Retry-After；
+    "stream": true 的 chat 请求以 server-sent events 返回，latency 分摊到各个片段之间，
+    stall_rate 概率在输出一半后停顿 stall_seconds（模拟流式响应中途超时）；
+    tail_rate 概率额外延迟 tail_latency 秒（模拟长尾延迟）
+    """
+
+    def __init__(
+        self,
+        latency=0.0,
+        error_rate=0.0,
+        rate_429=0.0,
+        retry_after=0.2,
+        seed=1,
+        stall_rate=0.0,
+        stall_seconds=2.0,
+        tail_rate=0.0,
+        tail_latency=1.0,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.counts = {
+            "requests": 0, "translate": 0, "chat": 0, "errors": 0, "throttled": 0, "stalled": 0, "slow": 0,
+        }
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_counts(self):
+        with self._lock:
+            for key in self.counts:
+                self.counts[key] = 0
+
+    def _roll(self, kind):
+        with self._lock:
+            self.counts["requests"] += 1
+            self.counts[kind] += 1
+            roll = self._rng.random()
+            if roll < self.rate_429:
+                self.counts["throttled"] += 1
+                return 429
+            if roll < self.rate_429 + self.error_rate:
+                self.counts["errors"] += 1
+                return 500
+        return 200
+
+    def _roll_tail(self):
+        with self._lock:
+            if self._rng.random() < self.tail_rate:
+                self.counts["slow"] += 1
+                return self.tail_latency
+        return 0.0
+
+    def _roll_stall(self):
+        with self._lock:
+            if self._rng.random() < self.stall_rate:
+                self.counts["stalled"] += 1
+                return True
+        return False
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # 响应头和正文分两次写出，不关闭 Nagle 会遇到 40ms 延迟确认
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                kind = "chat" if self.path.endswith("/chat/completions") else "translate"
+                status = server._roll(kind)
+                streaming = kind == "chat" and status == 200 and request.get("stream")
+                delay = (server.latency + server._roll_tail()) if not streaming else 0.0
+                if delay:
+                    time.sleep(delay)
+
+                if streaming:
+                    self._stream(chat_reply(request))
+                elif status == 429:
+                    self._send(429, {"error": "rate limited"}, {"Retry-After": str(server.retry_after)})
+                elif status != 200:
+                    self._send(status, {"error": "injected failure"})
+                elif kind == "chat":
+                    self._send(200, {"choices": [{"message": {"content": chat_reply(request)}}]})
+                else:
+                    self._send(200, {"translate": fake_translation(request["text"], request.get("ToLang", ""))})
+
+            def _stream(self, content):
+                pieces = [content[i:i + 16] for i in range(0, len(content), 16)] or [""]
+                delay = server.latency / len(pieces)
+                stall_at = len(pieces) // 2 if server._roll_stall() else -1
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for index, piece in enumerate(pieces):
+                        if index == stall_at:
+                            time.sleep(server.stall_seconds)
+                        if delay:
+                            time.sleep(delay)
+                        event = {"choices": [{"delta": {"content": piece}}]}
+                        self._chunk(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self._chunk(b"data: [DONE]\n\n")
+                    self._chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+
+            def _chunk(self, data):
+                self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _send(self, status, body, headers=None):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+def chat_reply(request):
+    """按 translate_to_result 的三种提示词格式生成回复"""
+    messages = request.get("messages", [])
+    system = messages[0]["content"] if messages else ""
+    content = messages[-1]["content"] if messages else ""
+    if content.startswith("Target languages:"):
+        header, _, items = content.partition("\nItems: ")
+        langs = json.loads(header.split("\n", 1)[0].split(": ", 1)[1])
+        return json.dumps(
+            [{lang: fake_translation(item, lang) for lang in langs} for item in json.loads(items)],
+            ensure_ascii=False,
+        )
+    if content.startswith("Target language:"):
+        header, _, items = content.partition("\nItems: ")
+        lang = header.split("\n", 1)[0].split(": ", 1)[1]
+        return json.dumps([fake_translation(item, lang) for item in json.loads(items)], ensure_ascii=False)
+    lang = system.split(" to ", 1)[1].split(".", 1)[0] if " to " in system else ""
+    return fake_translation(content, lang)
+
+
+MODES = {
+    "serial": {"translate_mode": "api", "max_workers": 0},
+    "parallel": {"translate_mode": "api"},
+    "openai": {"translate_mode": "openai", "openai_batch_size": 1},
+    "batch": {"translate_mode": "openai"},
+    "stream": {"translate_mode": "openai", "openai_stream": True},
+    "process": {"translate_mode": "api", "process_workers": "auto"},
+}
+
+
+def mode_config(mode, servers, workdir, args):
+    server = servers[0]
+    config = {
+        "endpoint": f"{server.base_url}/translate",
+        "openai_base_url": f"{server.base_url}/v1",
+        "openai_api_key": "benchmark",
+        "openai_model": "benchmark",
+        "to_lang": args.to_lang if len(args.to_lang) > 1 else args.to_lang[0],
+        "source_lang_priority": ["en", "fr"],
+        "max_workers": args.workers,
+        "openai_batch_size": args.batch_size,
+        "sleep_seconds": 0,
+        "max_retries": args.max_retries,
+        "timeout_seconds": 10,
+        "cache_file": os.path.join(workdir, "translate_cache.json"),
+        "failed_log_file": os.path.join(workdir, "translate_failed.jsonl"),
+        "sync_manifest_file": os.path.join(workdir, "sync_manifest.json"),
+        "skip_index_file": os.path.join(workdir, "skip_index.json"),
+        "glossary_file": os.path.join(workdir, "glossary.json"),
+    }
+    config.update(MODES[mode])
+    if len(servers) > 1:
+        config["providers"] = [
+            {
+                "name": f"mock-{index}",
+                "endpoint": f"{backup.base_url}/translate",
+                "openai_base_url": f"{backup.base_url}/v1",
+            }
+            for index, backup in enumerate(servers)
+        ]
+    config.update(args.extra_config)
+    return config
+
+
+def run_once(config, elements_dir, workdir, servers, verbose):
+    for server in servers:
+        server.reset_counts()
+    src_dir = os.path.join(workdir, "src")
+    result_dir = os.path.join(workdir, "result")
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    metrics = ttr.reset_metrics()
+    with output:
+        with metrics.phase("sync"):
+            sync_report = ttr.sync_elements(elements_dir, src_dir, config["sync_manifest_file"])
+        stats = ttr.translate_tree(config, src_dir, result_dir, sync_report)
+    wall = time.perf_counter() - start
+    counts = collections.Counter()
+    for server in servers:
+        counts.update(server.counts)
+    return {
+        "wall": wall,
+        "files": stats["total_files"],
+        "updated": stats["updated"],
+        "files_per_second": stats["total_files"] / wall if wall > 0 else 0.0,
+        "api_calls": counts["requests"],
+        "errors": counts["errors"],
+        "throttled": counts["throttled"],
+        "connections": (stats["http"] or {}).get("connections", 0),
+    }
+
+
+def print_table(rows):
+    header = f"{'mode':<10} {'run':<5} {'wall(s)':>8} {'files/s':>9} {'updated':>8} {'API calls':>10} {'5xx':>5} {'429':>5} {'conns':>6}"
+    print(header)
+    print("-" * len(header))
+    for mode, phase, row in rows:
+        print(
+            f"{mode:<10} {phase:<5} {row['wall']:8.2f} {row['files_per_second']:9.1f} {row['updated']:8d} "
+            f"{row['api_calls']:10d} {row['errors']:5d} {row['throttled']:5d} {row['connections']:6d}"
+        )
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="QET 元件翻译离线基准测试")
+    parser.add_argument("--files", type=int, default=1000, help="合成元件文件数")
+    parser.add_argument("--unique", type=int, default=200, help="不同名称数（决定缓存命中率）")
+    parser.add_argument("--variant-ratio", type=float, default=0.0, help="大小写/空白变体名称的比例")
+    parser.add_argument("--zh-ratio", type=float, default=0.1, help="已有 zh 名称的文件比例")
+    parser.add_argument("--body-size", type=int, default=8000, help="每个文件正文字节数")
+    parser.add_argument("--latency", type=float, default=0.02, help="模拟服务每次请求的延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="流式响应中途停顿 2 秒的概率（配合 timeout_seconds 测试超时重排）")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="请求额外延迟 --tail-latency 秒的概率（长尾）")
+    parser.add_argument("--tail-latency", type=float, default=1.0)
+    parser.add_argument(
+        "--providers", type=int, default=1, help="模拟服务个数；>1 时配置 providers，只有第一个注入错误和延迟"
+    )
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=5, help="并行模式和批量模式的 max_workers")
+    parser.add_argument("--batch-size", type=int, default=20, help="批量模式的 openai_batch_size")
+    parser.add_argument("--to-lang", default="zh-CHS", help="目标语言，逗号分隔")
+    parser.add_argument("--modes", default="serial,parallel,batch", help=f"逗号分隔: {','.join(MODES)}")
+    parser.add_argument("--config", action="append", default=[], metavar="KEY=JSON", help="额外配置项，可重复")
+    parser.add_argument("--workdir", help="工作目录（默认临时目录，运行结束后删除）")
+    parser.add_argument("--keep", action="store_true", help="保留工作目录")
+    parser.add_argument("--verbose", action="store_true", help="显示翻译脚本自身的输出")
+    args = parser.parse_args(argv)
+
+    args.modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = [mode for mode in args.modes if mode not in MODES]
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(unknown)}")
+    args.to_lang = [lang.strip() for lang in args.to_lang.split(",") if lang.strip()]
+    args.extra_config = {}
+    for item in args.config:
+        key, _, value = item.partition("=")
+        try:
+            args.extra_config[key] = json.loads(value)
+        except ValueError:
+            args.extra_config[key] = value
+    return args
+
+
+def main(argv):
+    args = parse_args(argv)
+    root = args.workdir or tempfile.mkdtemp(prefix="qet-bench-")
+    os.makedirs(root, exist_ok=True)
+    elements_dir = os.path.join(root, "elements")
+
+    print(f"生成合成元件库: {args.files} 个文件, {args.unique} 个不同名称 -> {elements_dir}")
+    shutil.rmtree(elements_dir, ignore_errors=True)
+    generate_library(
+        elements_dir, args.files, args.unique, args.zh_ratio, args.body_size, variant_ratio=args.variant_ratio
+    )
+
+    servers = [
+        MockTranslationServer(
+            args.latency,
+            args.error_rate,
+            args.rate_429,
+            args.retry_after,
+            stall_rate=args.stall_rate,
+            tail_rate=args.tail_rate,
+            tail_latency=args.tail_latency,
+        ).start()
+    ]
+    servers += [MockTranslationServer(args.latency).start() for _ in range(args.providers - 1)]
+    print(
+        f"模拟服务: {', '.join(server.base_url for server in servers)} (latency={args.latency}s, "
+        f"error_rate={args.error_rate}, rate_429={args.rate_429}, tail_rate={args.tail_rate})\n"
+    )
+
+    rows = []
+    try:
+        for mode in args.modes:
+            workdir = os.path.join(root, mode)
+            shutil.rmtree(workdir, ignore_errors=True)
+            os.makedirs(workdir)
+            config = mode_config(mode, servers, workdir, args)
+            for phase in ("cold", "warm", "rerun"):
+                if phase == "warm":
+                    # 热启动：保留缓存，重新生成 result，测量纯缓存命中的重写速度
+                    shutil.rmtree(os.path.join(workdir, "result"), ignore_errors=True)
+                config["run_report_file"] = os.path.join(workdir, f"run_report.{phase}.json")
+                rows.append((mode, phase, run_once(config, elements_dir, workdir, servers, args.verbose)))
+                print(f"  ✓ {mode} {phase}: {rows[-1][2]['wall']:.2f}s")
+    finally:
+        for server in servers:
+            server.stop()
+        if not args.keep and not args.workdir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    print()
+    print_table(rows)
+    if args.keep or args.workdir:
+        print(f"\n工作目录: {root}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,501 @@
+"""
+翻译缓存存储后端
+
+- json:    旧格式，整份 translate_cache.json 重写（原子替换）
+- journal: translate_cache.json 快照 + 追加写日志，定期压缩回快照（默认）
+- sqlite:  标准库 sqlite3，WAL 模式，每条翻译一次提交
+
+所有后端都在内存中保留一份字典，读取为 O(1)；
+旧的 translate_cache.json 会被自动导入，并可随时导出回原格式。
+
+命名空间：每个 (翻译模式, 接口/模型, 目标语言, 提示词版本) 的指纹对应一个缓存文件，
+登记在 <cache_file>.namespaces.json 中；切换配置时启用新的命名空间，旧的保留不动。
+"""
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+REGISTRY_VERSION = 1
+FALLBACK_POLICIES = ("none", "reuse", "consensus")
+# 未配置 openai_model 时翻译和命名空间指纹都使用这个模型
+DEFAULT_OPENAI_MODEL = "gpt-5.2"
+
+
+def load_json_cache(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json_cache(path, cache):
+    """写入临时文件后替换，写入过程中崩溃不会损坏原缓存"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class TranslationCache:
+    """
+    内存字典 + 持久化后端，子类实现 _persist / flush / close；
+    fallback 为其他命名空间借来的只读译文，未命中自身条目时查找，不写入本命名空间
+    """
+
+    backend = "memory"
+
+    def __init__(self, path):
+        self.path = path
+        self._data = {}
+        self.fallback = {}
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._data or key in self.fallback
+
+    def __getitem__(self, key):
+        if key in self._data:
+            return self._data[key]
+        return self.fallback[key]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            if self._data.get(key) == value:
+                return
+            self._data[key] = value
+            self._persist(key, value)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        if key in self._data:
+            return self._data[key]
+        return self.fallback.get(key, default)
+
+    def items(self):
+        return self._data.items()
+
+    def keys(self):
+        return self._data.keys()
+
+    def snapshot(self):
+        """自身条目 + fallback，供进程池 worker 使用"""
+        with self.lock:
+            merged = dict(self.fallback)
+            merged.update(self._data)
+            return merged
+
+    def export_json(self, path):
+        with self.lock:
+            data = dict(self._data)
+        save_json_cache(path, data)
+
+    def _persist(self, key, value):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class JsonCache(TranslationCache):
+    backend = "json"
+
+    def __init__(self, path):
+        super().__init__(path)
+        self._data = load_json_cache(path)
+        self._dirty = False
+
+    def _persist(self, key, value):
+        self._dirty = True
+
+    def flush(self):
+        with self.lock:
+            if not self._dirty:
+                return
+            save_json_cache(self.path, self._data)
+            self._dirty = False
+
+
+class JournalCache(TranslationCache):
+    """
+    每条新翻译以一行 JSON 追加到 <cache_file>.journal，
+    日志条数达到 compact_every 或关闭时压缩回 translate_cache.json
+    """
+
+    backend = "journal"
+
+    def __init__(self, path, journal_path=None, compact_every=1000):
+        super().__init__(path)
+        self.journal_path = journal_path or f"{path}.journal"
+        self.compact_every = int(compact_every or 0)
+        self._data = load_json_cache(path)
+        self._journal_entries = self._replay()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+    def _replay(self):
+        if not os.path.exists(self.journal_path):
+            return 0
+        count = 0
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    key, value = json.loads(line)
+                except (ValueError, TypeError):
+                    # 崩溃时最后一行可能只写了一半
+                    continue
+                self._data[key] = value
+                count += 1
+        return count
+
+    def _persist(self, key, value):
+        self._journal.write(json.dumps([key, value], ensure_ascii=False) + "\n")
+        self._journal.flush()
+        self._journal_entries += 1
+        if self.compact_every > 0 and self._journal_entries >= self.compact_every:
+            self._compact()
+
+    def _compact(self):
+        # 先原子替换快照再清空日志；两步之间崩溃时重放日志是幂等的
+        save_json_cache(self.path, self._data)
+        self._journal.close()
+        self._journal = open(self.journal_path, "w", encoding="utf-8")
+        self._journal_entries = 0
+
+    def flush(self):
+        with self.lock:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+
+    def close(self):
+        with self.lock:
+            if self._journal_entries or not os.path.exists(self.path):
+                self._compact()
+            self._journal.close()
+        if os.path.exists(self.journal_path) and os.path.getsize(self.journal_path) == 0:
+            os.remove(self.journal_path)
+
+
+class SqliteCache(TranslationCache):
+    backend = "sqlite"
+
+    def __init__(self, path, db_path=None):
+        import sqlite3
+
+        super().__init__(path)
+        self.db_path = db_path or f"{os.path.splitext(path)[0]}.sqlite"
+        self._conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations (source TEXT PRIMARY KEY, target TEXT NOT NULL)"
+        )
+        self._data = dict(self._conn.execute("SELECT source, target FROM translations"))
+        if not self._data and os.path.exists(path):
+            self._import_json(path)
+
+    def _import_json(self, path):
+        legacy = load_json_cache(path)
+        with self._conn:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations (source, target) VALUES (?, ?)",
+                legacy.items(),
+            )
+        self._data.update(legacy)
+        print(f"✓ 已导入 {len(legacy)} 条缓存: {path} -> {self.db_path}")
+
+    def _persist(self, key, value):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO translations (source, target) VALUES (?, ?)",
+            (key, value),
+        )
+
+    def close(self):
+        with self.lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.close()
+
+
+def open_cache(config, path=None):
+    path = path or config.get("cache_file", "translate_cache.json")
+    backend = config.get("cache_backend", "journal").lower()
+    if backend == "json":
+        return JsonCache(path)
+    if backend == "sqlite":
+        db_path = config.get("cache_db") if path == config.get("cache_file", path) else None
+        return SqliteCache(path, db_path)
+    if backend == "journal":
+        return JournalCache(path, None, config.get("cache_compact_every", 1000))
+    raise ValueError(f"Unknown cache_backend: {backend}")
+
+
+def lang_cache_path(cache_file, lang):
+    """translate_cache.json + es -> translate_cache.es.json"""
+    stem, ext = os.path.splitext(cache_file)
+    safe_lang = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in lang)
+    return f"{stem}.{safe_lang}{ext or '.json'}"
+
+
+def namespace_fingerprint(config, lang, prompt_version=1):
+    """
+    返回 (指纹, 描述)：翻译模式、接口地址或 OpenAI 模型、目标语言、提示词版本
+    决定了译文的来源，任一项变化都使用新的命名空间；地址只取主机和路径，不含查询参数中的密钥。
+    配置了多个翻译后端（providers）时按第一个后端计算
+    """
+    if config.get("providers"):
+        config = dict(config, **config["providers"][0])
+    mode = config.get("translate_mode", "api").lower()
+    if mode == "openai":
+        base_url = urlsplit(config.get("openai_base_url", "https://api.openai.com/v1"))
+        info = {
+            "mode": mode,
+            "provider": f"{base_url.netloc}{base_url.path}".rstrip("/"),
+            "model": config.get("openai_model", DEFAULT_OPENAI_MODEL),
+            "to_lang": lang,
+            "prompt_version": prompt_version,
+        }
+    else:
+        endpoint = urlsplit(config.get("endpoint", ""))
+        info = {
+            "mode": mode,
+            "provider": f"{endpoint.netloc}{endpoint.path}".rstrip("/"),
+            "to_lang": lang,
+        }
+    digest = hashlib.sha1(json.dumps(info, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return digest, info
+
+
+def registry_path(config):
+    cache_file = config.get("cache_file", "translate_cache.json")
+    return config.get("cache_registry_file") or f"{os.path.splitext(cache_file)[0]}.namespaces.json"
+
+
+def load_registry(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        registry = json.load(f)
+    registry.setdefault("namespaces", {})
+    return registry
+
+
+def save_registry(path, registry):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(registry, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def namespace_cache_path(cache_file, lang, fingerprint):
+    """translate_cache.json + zh-CHS + 指纹 -> translate_cache.zh-CHS.<指纹>.json"""
+    stem, ext = os.path.splitext(lang_cache_path(cache_file, lang))
+    return f"{stem}.{fingerprint}{ext}"
+
+
+def resolve_namespaces(config, prompt_version=1, registry=None):
+    """
+    返回 (registry, [(lang, 指纹, 缓存文件)])。
+    没有登记文件时（旧版本升级上来），现有的 cache_paths 文件直接归入当前配置的命名空间；
+    之后出现的新指纹使用 translate_cache.<lang>.<指纹>.json
+    """
+    adopt = registry is None
+    if adopt:
+        registry = {"version": REGISTRY_VERSION, "namespaces": {}}
+    namespaces = registry["namespaces"]
+    cache_file = config.get("cache_file", "translate_cache.json")
+    resolved = []
+    for lang, legacy_path in cache_paths(config):
+        fingerprint, info = namespace_fingerprint(config, lang, prompt_version)
+        entry = namespaces.get(fingerprint)
+        if entry is None:
+            path = legacy_path if adopt else namespace_cache_path(cache_file, lang, fingerprint)
+            entry = dict(info, file=path, created=time.strftime("%Y-%m-%dT%H:%M:%S"))
+            namespaces[fingerprint] = entry
+        resolved.append((lang, fingerprint, entry["file"]))
+    return registry, resolved
+
+
+def sibling_paths(registry, fingerprint):
+    """同一目标语言的其他命名空间的缓存文件，最近使用的在前"""
+    namespaces = registry["namespaces"]
+    lang = namespaces[fingerprint]["to_lang"]
+    siblings = [
+        entry
+        for key, entry in namespaces.items()
+        if key != fingerprint and entry.get("to_lang") == lang
+    ]
+    siblings.sort(key=lambda entry: entry.get("last_used", entry.get("created", "")), reverse=True)
+    return [entry["file"] for entry in siblings]
+
+
+def build_fallback(config, paths, policy):
+    """
+    reuse:     取最近使用的命名空间中的译文
+    consensus: 只借用各命名空间一致的译文，不一致的原文留空，由当前配置重新翻译
+    返回 (fallback 字典, 不一致的条数)
+    """
+    fallback = {}
+    conflicts = set()
+    for path in paths:
+        for key, value in read_cache(config, path).items():
+            if not value or key in conflicts:
+                continue
+            existing = fallback.get(key)
+            if existing is None:
+                fallback[key] = value
+            elif existing != value and policy == "consensus":
+                del fallback[key]
+                conflicts.add(key)
+    return fallback, len(conflicts)
+
+
+def open_caches(config, prompt_version=1):
+    """
+    每个目标语言一份缓存，即按 (目标语言, 原文) 区分译文，文件由命名空间登记决定；
+    cache_fallback 为 reuse / consensus 时从同语言的其他命名空间借用译文
+    """
+    path = registry_path(config)
+    registry, resolved = resolve_namespaces(config, prompt_version, load_registry(path))
+    policy = config.get("cache_fallback", "none").lower()
+    if policy not in FALLBACK_POLICIES:
+        raise ValueError(f"Unknown cache_fallback: {policy}")
+
+    caches = {}
+    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+    for lang, fingerprint, cache_path in resolved:
+        cache = open_cache(config, cache_path)
+        cache.namespace = fingerprint
+        if policy != "none":
+            siblings = [p for p in sibling_paths(registry, fingerprint) if p != cache_path]
+            cache.fallback, conflicts = build_fallback(config, siblings, policy)
+            borrowed = sum(1 for key in cache.fallback if key not in cache._data)
+            if borrowed or conflicts:
+                print(
+                    f"✓ {lang}: 从其他命名空间借用 {borrowed} 条译文"
+                    + (f"，{conflicts} 条译文不一致将重新翻译" if conflicts else "")
+                )
+        registry["namespaces"][fingerprint]["last_used"] = now
+        caches[lang] = cache
+    save_registry(path, registry)
+    return caches
+
+
+def read_cache(config, path=None):
+    """
+    只读加载缓存内容为字典，不创建、不修改任何文件（plan / verify 使用）
+    """
+    path = path or config.get("cache_file", "translate_cache.json")
+    backend = config.get("cache_backend", "journal").lower()
+    if backend == "sqlite":
+        db_path = config.get("cache_db") if path == config.get("cache_file", path) else None
+        db_path = db_path or f"{os.path.splitext(path)[0]}.sqlite"
+        if os.path.exists(db_path):
+            import sqlite3
+
+            conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+            try:
+                data = dict(conn.execute("SELECT source, target FROM translations"))
+            finally:
+                conn.close()
+            if data:
+                return data
+    data = load_json_cache(path)
+    journal_path = f"{path}.journal"
+    if backend == "journal" and os.path.exists(journal_path):
+        with open(journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    key, value = json.loads(line)
+                except (ValueError, TypeError):
+                    continue
+                data[key] = value
+    return data
+
+
+def cache_paths(config):
+    """[(目标语言, 缓存文件)]：未启用命名空间登记前的文件分配"""
+    to_langs = config.get("to_lang", "zh-CHS")
+    if isinstance(to_langs, str):
+        to_langs = [to_langs]
+    cache_file = config.get("cache_file", "translate_cache.json")
+    return [
+        (lang, cache_file if index == 0 else lang_cache_path(cache_file, lang))
+        for index, lang in enumerate(to_langs)
+    ]
+
+
+def read_caches(config, prompt_version=1):
+    """只读版本的 open_caches：不写登记文件，未登记的新命名空间视为空缓存"""
+    registry, resolved = resolve_namespaces(config, prompt_version, load_registry(registry_path(config)))
+    policy = config.get("cache_fallback", "none").lower()
+    caches = {}
+    for lang, fingerprint, path in resolved:
+        data = read_cache(config, path)
+        if policy in ("reuse", "consensus"):
+            siblings = [p for p in sibling_paths(registry, fingerprint) if p != path]
+            fallback, _ = build_fallback(config, siblings, policy)
+            fallback.update(data)
+            data = fallback
+        caches[lang] = data
+    return caches
+
+
+def list_namespaces(config):
+    """[(指纹, 登记信息, 条目数)]"""
+    registry = load_registry(registry_path(config))
+    if registry is None:
+        return []
+    return [
+        (fingerprint, entry, len(read_cache(config, entry["file"])))
+        for fingerprint, entry in registry["namespaces"].items()
+    ]
+
+
+def main(argv):
+    """
+    用法: python scripts/cache_store.py export [config] [output.json]
+          python scripts/cache_store.py namespaces [config]
+    export 把当前配置所用命名空间的缓存导出为 translate_cache.json 格式（默认写回各命名空间自己的文件，
+    多个目标语言时 output.json 之外的语言写到 output.<语言>.json），namespaces 列出已登记的命名空间
+    """
+    if len(argv) < 2 or argv[1] not in ("export", "namespaces"):
+        print(main.__doc__)
+        return 1
+    config_path = argv[2] if len(argv) > 2 else "translate_config.json"
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    if argv[1] == "namespaces":
+        for fingerprint, entry, count in list_namespaces(config):
+            model = f" {entry['model']}" if entry.get("model") else ""
+            print(
+                f"{fingerprint}  {entry['to_lang']:<8} {entry['mode']:<7} {entry['provider']}{model}"
+                f"  {count} 条  {entry['file']}  (last used {entry.get('last_used', '-')})"
+            )
+        return 0
+    from translate_to_result import PROMPT_VERSION
+
+    caches = open_caches(config, PROMPT_VERSION)
+    for index, (lang, cache) in enumerate(caches.items()):
+        if len(argv) > 3:
+            output = argv[3] if index == 0 else lang_cache_path(argv[3], lang)
+        else:
+            output = cache.path
+        cache.export_json(output)
+        cache.close()
+        print(f"✓ 已导出 {lang} [{cache.namespace}] {len(cache)} 条缓存到 {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
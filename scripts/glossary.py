@@ -0,0 +1,229 @@
+"""
+术语表：Aho-Corasick 多模式匹配 + 本地预翻译
+
+glossary.json 格式（两种都可以）:
+    {"Ground": "接地", "Chassis": "机壳"}                       # 第一个目标语言
+    {"zh-CHS": {"Ground": "接地"}, "es": {"Ground": "Tierra"}}  # 按目标语言
+
+- 匹配不区分大小写，只匹配完整单词，取最左最长且不重叠的术语，耗时与输入长度成线性
+- 整条文本都由术语和分隔符（空白、+ - / , ( ) 数字等）组成时直接在本地拼出译文
+- 部分覆盖时返回命中的术语，由调用方固定到提示词里
+- 编译好的自动机（goto / fail / out 表）按术语表内容哈希以 JSON 缓存到 <glossary_file>.cache，
+  内容不变时下次直接加载；缓存只含数据，不会执行其中的任何内容
+"""
+
+import collections
+import hashlib
+import json
+import os
+import re
+
+GLOSSARY_CACHE_VERSION = 2
+_GAP_RE = re.compile(r"[\s+\-/,;:()\[\]&.\d]*")
+# 目标语言为中日韩时，两个术语之间的纯空白不保留
+_NO_SPACE_LANGS = ("zh", "ja", "ko")
+
+
+def fold(text):
+    """逐字符转小写，保持长度不变以便用下标回到原文"""
+    return "".join(ch.lower() if len(ch.lower()) == 1 else ch for ch in text)
+
+
+class Automaton:
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for pattern in patterns:
+            self._insert(pattern)
+        self._build()
+
+    def to_tables(self):
+        return {"goto": self.goto, "fail": self.fail, "out": self.out}
+
+    @classmethod
+    def from_tables(cls, tables):
+        """由 to_tables() 的结果（经 JSON 往返）还原，表的形状不对时抛出 ValueError"""
+        goto, fail, out = tables["goto"], tables["fail"], tables["out"]
+        if not (len(goto) == len(fail) == len(out)) or not goto:
+            raise ValueError("Inconsistent automaton tables")
+        states = len(goto)
+        for edges, fallback, lengths in zip(goto, fail, out):
+            if not all(type(state) is int and 0 < state < states for state in edges.values()):
+                raise ValueError("Invalid goto table")
+            if type(fallback) is not int or not 0 <= fallback < states:
+                raise ValueError("Invalid fail table")
+            if not all(type(length) is int and length > 0 for length in lengths):
+                raise ValueError("Invalid output table")
+        automaton = cls.__new__(cls)
+        automaton.goto, automaton.fail, automaton.out = goto, fail, out
+        return automaton
+
+    def _insert(self, pattern):
+        state = 0
+        for ch in pattern:
+            next_state = self.goto[state].get(ch)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][ch] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            state = next_state
+        self.out[state].append(len(pattern))
+
+    def _build(self):
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(ch, 0)
+                self.fail[next_state] = target if target != next_state else 0
+                self.out[next_state] = self.out[next_state] + self.out[self.fail[next_state]]
+
+    def longest_at(self, text):
+        """返回 {起始下标: 最长匹配长度}"""
+        longest = {}
+        state = 0
+        for end, ch in enumerate(text, 1):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for length in self.out[state]:
+                start = end - length
+                if length > longest.get(start, 0):
+                    longest[start] = length
+        return longest
+
+
+class Glossary:
+    def __init__(self, entries, automaton=None):
+        # entries: {to_lang: {术语小写: 译文}}
+        self.entries = entries
+        terms = sorted({term for table in entries.values() for term in table})
+        self.automaton = automaton or Automaton(terms)
+
+    def __len__(self):
+        return len({term for table in self.entries.values() for term in table})
+
+    def matches(self, text):
+        """[(start, end, 术语小写)]：完整单词、最左最长、不重叠"""
+        folded = fold(text)
+        candidates = self.automaton.longest_at(folded)
+        result = []
+        position = 0
+        for start in range(len(text)):
+            if start < position or start not in candidates:
+                continue
+            length = candidates[start]
+            # 最长的匹配不在单词边界上时，尝试同一起点更短的术语
+            while length:
+                end = start + length
+                if (start == 0 or not text[start - 1].isalnum()) and (
+                    end == len(text) or not text[end].isalnum()
+                ):
+                    break
+                length = self._shorter(folded, start, length)
+            if not length:
+                continue
+            result.append((start, start + length, folded[start:start + length]))
+            position = start + length
+        return result
+
+    def _shorter(self, folded, start, length):
+        for shorter in range(length - 1, 0, -1):
+            if any(folded[start:start + shorter] in table for table in self.entries.values()):
+                return shorter
+        return 0
+
+    def translate(self, text, to_lang):
+        """整条文本都能由术语和分隔符组成时返回本地译文，否则返回 None"""
+        table = self.entries.get(to_lang)
+        if not table:
+            return None
+        parts = []
+        position = 0
+        previous_term = False
+        for start, end, term in self.matches(text):
+            gap = text[position:start]
+            if _GAP_RE.fullmatch(gap) is None or term not in table:
+                return None
+            parts.append(self._join(gap, previous_term, to_lang))
+            parts.append(table[term])
+            position = end
+            previous_term = True
+        if not previous_term or _GAP_RE.fullmatch(text[position:]) is None:
+            return None
+        parts.append(text[position:])
+        return "".join(parts).strip()
+
+    @staticmethod
+    def _join(gap, previous_term, to_lang):
+        if previous_term and gap and not gap.strip() and to_lang.lower().startswith(_NO_SPACE_LANGS):
+            return ""
+        return gap
+
+    def pinned_terms(self, text, to_lang):
+        """文本中出现的术语 -> 译文，用于固定到提示词"""
+        table = self.entries.get(to_lang) or {}
+        return {
+            text[start:end]: table[term]
+            for start, end, term in self.matches(text)
+            if term in table
+        }
+
+
+def parse_glossary(data, default_lang):
+    if data and all(isinstance(value, dict) for value in data.values()):
+        tables = data
+    else:
+        tables = {default_lang: data}
+    return {
+        lang: {fold(term.strip()): translated for term, translated in table.items() if term.strip() and translated}
+        for lang, table in tables.items()
+    }
+
+
+def load_glossary(path, default_lang, persist=True):
+    """
+    加载并编译术语表；<path>.cache 中的自动机与术语表内容哈希一致时直接复用，
+    persist=False 时不写 .cache（plan 模式不写任何文件）
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha1(raw + default_lang.encode("utf-8")).hexdigest()
+    cache_path = f"{path}.cache"
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("version") == GLOSSARY_CACHE_VERSION and cached.get("digest") == digest:
+            return Glossary(cached["entries"], Automaton.from_tables(cached["automaton"]))
+    except (OSError, ValueError, AttributeError, KeyError, TypeError):
+        # 缓存缺失、损坏或是旧版本的 pickle 文件：重新编译并覆盖
+        pass
+
+    glossary = Glossary(parse_glossary(json.loads(raw.decode("utf-8")), default_lang))
+    if not persist:
+        return glossary
+    tmp_path = f"{cache_path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": GLOSSARY_CACHE_VERSION,
+                    "digest": digest,
+                    "entries": glossary.entries,
+                    "automaton": glossary.automaton.to_tables(),
+                },
+                f,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return glossary
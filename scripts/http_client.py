@@ -0,0 +1,245 @@
+"""
+基于 http.client 的共享 HTTP 传输层
+
+- 按 (scheme, host, port) 维护 keep-alive 连接池，多线程复用
+- 请求默认携带 Accept-Encoding: gzip，自动解压响应
+- 支持 HTTP(S)_PROXY 环境变量
+- 统计请求数、新建连接数和连接复用次数
+- post_stream 逐行读取响应体（server-sent events），读完后连接照常放回连接池
+"""
+
+import gzip
+import http.client
+import json
+import threading
+import urllib.parse
+import urllib.request
+
+# 复用的连接可能已被服务端关闭，这些异常会换新连接重试一次
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+
+class HTTPStatusError(RuntimeError):
+    def __init__(self, code, body, headers=None):
+        super().__init__(f"HTTP {code}: {body}")
+        self.code = code
+        self.body = body
+        self.headers = headers or {}
+
+
+class HttpResponse:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def text(self):
+        return self.body.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.text())
+
+
+class HttpStream:
+    """
+    流式响应：按行迭代响应体。读到结尾时连接放回连接池，中途关闭（超时、异常）时断开连接
+    """
+
+    def __init__(self, client, key, conn, response):
+        self.client = client
+        self.status = response.status
+        self.headers = dict(response.getheaders())
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self._finished = False
+
+    def getheader(self, name, default=None):
+        return self._response.getheader(name, default)
+
+    def __iter__(self):
+        if self._response.getheader("Content-Encoding", "").lower() == "gzip":
+            # 服务端忽略了 Accept-Encoding: identity，只能整体解压
+            lines = gzip.decompress(self._response.read()).splitlines(True)
+        else:
+            lines = iter(self._response.readline, b"")
+        for line in lines:
+            yield line.rstrip(b"\r\n")
+        self._finished = True
+
+    def close(self):
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if self._finished and not self._response.will_close:
+            self.client._release(self._key, conn)
+        else:
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class HttpClient:
+    def __init__(self, pool_size=4, timeout=20):
+        self.pool_size = max(1, int(pool_size))
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "connections": 0, "reused": 0, "stale_retries": 0}
+
+    def _route(self, parsed):
+        scheme = parsed.scheme.lower()
+        port = parsed.port or (443 if scheme == "https" else 80)
+        proxy = None
+        proxies = urllib.request.getproxies()
+        if scheme in proxies and not urllib.request.proxy_bypass(parsed.hostname):
+            proxy = urllib.parse.urlsplit(proxies[scheme])
+        return (scheme, parsed.hostname, port), proxy
+
+    def _connect(self, key, proxy, timeout):
+        scheme, host, port = key
+        if proxy is None:
+            conn_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = conn_class(host, port, timeout=timeout)
+        elif scheme == "https":
+            conn = http.client.HTTPSConnection(proxy.hostname, proxy.port or 80, timeout=timeout)
+            conn.set_tunnel(host, port)
+        else:
+            conn = http.client.HTTPConnection(proxy.hostname, proxy.port or 80, timeout=timeout)
+        with self._lock:
+            self._stats["connections"] += 1
+        return conn
+
+    def _acquire(self, key, proxy, timeout):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                self._stats["reused"] += 1
+                conn = idle.pop()
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                conn.timeout = timeout
+                return conn, True
+        return self._connect(key, proxy, timeout), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.pool_size:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _open(self, method, url, body, headers, timeout):
+        """发送请求并读取响应头，返回 (连接池键, 连接, 响应)；复用的连接已失效时换新连接重试"""
+        timeout = self.timeout if timeout is None else timeout
+        parsed = urllib.parse.urlsplit(url)
+        key, proxy = self._route(parsed)
+        if proxy is not None and key[0] == "http":
+            target = url
+        else:
+            target = parsed.path or "/"
+            if parsed.query:
+                target = f"{target}?{parsed.query}"
+
+        request_headers = {"Accept-Encoding": "gzip", "Connection": "keep-alive"}
+        request_headers.update(headers or {})
+
+        with self._lock:
+            self._stats["requests"] += 1
+
+        while True:
+            conn, reused = self._acquire(key, proxy, timeout)
+            try:
+                conn.request(method, target, body=body, headers=request_headers)
+                return key, conn, conn.getresponse()
+            except STALE_CONNECTION_ERRORS:
+                conn.close()
+                if not reused:
+                    raise
+                with self._lock:
+                    self._stats["stale_retries"] += 1
+                continue
+            except BaseException:
+                conn.close()
+                raise
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        key, conn, response = self._open(method, url, body, headers, timeout)
+        data = self._drain(key, conn, response)
+        return HttpResponse(response.status, dict(response.getheaders()), data)
+
+    def post_json(self, url, payload, headers=None, timeout=None):
+        request_headers = {"Content-Type": "application/json"}
+        request_headers.update(headers or {})
+        response = self.request(
+            "POST",
+            url,
+            body=json.dumps(payload).encode("utf-8"),
+            headers=request_headers,
+            timeout=timeout,
+        )
+        if response.status >= 400:
+            raise HTTPStatusError(
+                response.status,
+                response.body.decode("utf-8", errors="replace"),
+                response.headers,
+            )
+        return response.json()
+
+    def post_stream(self, url, payload, headers=None, timeout=None):
+        """
+        POST JSON 并返回 HttpStream（配合 with 使用）；timeout 是两次读取之间的最长等待。
+        状态码 >= 400 时读完响应体并抛出 HTTPStatusError
+        """
+        request_headers = {
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+            "Accept-Encoding": "identity",
+        }
+        request_headers.update(headers or {})
+        body = json.dumps(payload).encode("utf-8")
+        key, conn, response = self._open("POST", url, body, request_headers, timeout)
+        if response.status >= 400:
+            data = self._drain(key, conn, response)
+            raise HTTPStatusError(
+                response.status,
+                data.decode("utf-8", errors="replace"),
+                dict(response.getheaders()),
+            )
+        return HttpStream(self, key, conn, response)
+
+    def _drain(self, key, conn, response):
+        try:
+            data = response.read()
+        except BaseException:
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+        if response.getheader("Content-Encoding", "").lower() == "gzip":
+            data = gzip.decompress(data)
+        return data
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
@@ -0,0 +1,364 @@
+"""
+打包输出与安装：把翻译结果直接写成压缩包，以及把压缩包安装到 elements 目录（apply 子命令）
+
+- 压缩包按扩展名选择格式：.zip / .tar / .tar.gz(.tgz) / .tar.bz2 / .tar.xz；
+  每个文件边读边写入压缩包，不在磁盘上生成 result 目录，写完后原子替换目标文件
+- 压缩包最后一项为 MANIFEST_NAME：每个文件的 sha1、原文件的 sha1（base_sha1）和大小；
+  delta 包只包含内容与原文件不同（插入了译文）的文件
+- apply 先把全部文件解压到目标目录下的临时目录并校验，确认目标文件仍是打包时的原文件后
+  才创建缺少的目录并逐个替换；替换中途失败时用备份回滚（包括删除新建的目录），
+  进程中断时下次 apply 根据 APPLY_JOURNAL 恢复
+"""
+
+import hashlib
+import io
+import json
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+
+MANIFEST_NAME = "qet_translate_manifest.json"
+MANIFEST_VERSION = 1
+APPLY_JOURNAL = ".qet_translate_apply.json"
+STAGING_PREFIX = ".qet-apply-"
+BACKUP_SUFFIX = ".qet-apply-bak"
+COPY_CHUNK_SIZE = 1024 * 1024
+
+TAR_MODES = (
+    (".tar.gz", "gz"),
+    (".tgz", "gz"),
+    (".tar.bz2", "bz2"),
+    (".tar.xz", "xz"),
+    (".tar", ""),
+)
+
+
+class PackageError(RuntimeError):
+    """压缩包无效或与目标目录冲突"""
+
+
+def archive_format(path):
+    """返回 ("zip", None) 或 ("tar", 压缩方式)；不支持的扩展名抛出 PackageError"""
+    lower = path.lower()
+    if lower.endswith(".zip"):
+        return "zip", None
+    for suffix, compression in TAR_MODES:
+        if lower.endswith(suffix):
+            return "tar", compression
+    raise PackageError(f"Unsupported archive type (use .zip, .tar, .tar.gz, .tar.bz2 or .tar.xz): {path}")
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(COPY_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _HashingReader:
+    """依次读出 header 字节和文件 offset 之后的内容，同时计算 sha1（tarfile.addfile 用）"""
+
+    def __init__(self, header, f):
+        self.header = io.BytesIO(header)
+        self.f = f
+        self.digest = hashlib.sha1()
+
+    def read(self, size=-1):
+        data = self.header.read(size)
+        if size < 0:
+            data += self.f.read()
+        elif len(data) < size:
+            data += self.f.read(size - len(data))
+        self.digest.update(data)
+        return data
+
+
+class ArchiveWriter:
+    """
+    流式写入压缩包：add_element() 写入新文件头 + 原文件 tail_offset 之后的字节，
+    add_file() 原样复制；close() 写入清单后把临时文件替换为目标文件
+    """
+
+    def __init__(self, path, kind="full", meta=None):
+        self.path = path
+        self.kind = kind
+        self.meta = meta or {}
+        self.files = {}
+        self.bytes = 0
+        self.format, compression = archive_format(path)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.tmp_path = f"{path}.tmp"
+        if self.format == "zip":
+            self.archive = zipfile.ZipFile(self.tmp_path, "w", zipfile.ZIP_DEFLATED)
+        else:
+            self.archive = tarfile.open(self.tmp_path, f"w:{compression}", format=tarfile.PAX_FORMAT)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add_element(self, rel_path, header, src_file, tail_offset, base_sha1):
+        """header 为新文件头（str）；tail_offset 为 None 时 header 即整个文件"""
+        header = header.encode("utf-8")
+        with open(src_file, "rb") as f:
+            if tail_offset is None:
+                f.seek(0, os.SEEK_END)
+            else:
+                f.seek(tail_offset)
+            size = len(header) + os.fstat(f.fileno()).st_size - f.tell()
+            sha1 = self._write(rel_path, header, f, size, os.fstat(f.fileno()).st_mtime)
+        self._record(rel_path, sha1, base_sha1, size)
+
+    def add_file(self, rel_path, src_file):
+        with open(src_file, "rb") as f:
+            st = os.fstat(f.fileno())
+            sha1 = self._write(rel_path, b"", f, st.st_size, st.st_mtime)
+        self._record(rel_path, sha1, sha1, st.st_size)
+
+    def _write(self, rel_path, header, f, size, mtime):
+        reader = _HashingReader(header, f)
+        if self.format == "zip":
+            info = zipfile.ZipInfo(rel_path, time.localtime(max(mtime, 315532800))[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.file_size = size
+            with self.archive.open(info, "w") as dst:
+                while True:
+                    chunk = reader.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+        else:
+            info = tarfile.TarInfo(rel_path)
+            info.size = size
+            info.mtime = mtime
+            info.mode = 0o644
+            self.archive.addfile(info, reader)
+        return reader.digest.hexdigest()
+
+    def _record(self, rel_path, sha1, base_sha1, size):
+        self.files[rel_path] = {"sha1": sha1, "base_sha1": base_sha1, "size": size}
+        self.bytes += size
+
+    def close(self):
+        manifest = dict(self.meta)
+        manifest.update(
+            {
+                "version": MANIFEST_VERSION,
+                "kind": self.kind,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "files": self.files,
+            }
+        )
+        data = json.dumps(manifest, ensure_ascii=False, indent=1).encode("utf-8")
+        if self.format == "zip":
+            self.archive.writestr(MANIFEST_NAME, data)
+        else:
+            info = tarfile.TarInfo(MANIFEST_NAME)
+            info.size = len(data)
+            info.mtime = time.time()
+            info.mode = 0o644
+            self.archive.addfile(info, io.BytesIO(data))
+        self.archive.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        try:
+            self.archive.close()
+        finally:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+
+def safe_member_path(name):
+    """压缩包内的路径必须是相对路径且不含 ..，防止写到目标目录之外"""
+    normalized = posixpath.normpath(name.replace("\\", "/"))
+    if (
+        not name
+        or normalized.startswith(("/", "../"))
+        or normalized == ".."
+        or ":" in normalized.split("/")[0]
+    ):
+        raise PackageError(f"Unsafe path in archive: {name}")
+    return normalized
+
+
+def iter_archive(path):
+    """依次返回 (相对路径, 可读文件对象)；跳过目录项"""
+    kind, _ = archive_format(path)
+    if kind == "zip":
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                with archive.open(info) as f:
+                    yield safe_member_path(info.filename), f
+    else:
+        with tarfile.open(path, "r:*") as archive:
+            for member in archive:
+                if member.isdir():
+                    continue
+                if not member.isfile():
+                    raise PackageError(f"Unsupported archive member: {member.name}")
+                f = archive.extractfile(member)
+                yield safe_member_path(member.name), f
+
+
+def recover_apply(target_dir):
+    """
+    处理上次中断的 apply：清单状态为 prepared 时把备份恢复回原位、删除新建的文件和目录（整体回滚），
+    为 committed 时只清理剩下的备份。返回处理的文件数
+    """
+    journal_path = os.path.join(target_dir, APPLY_JOURNAL)
+    try:
+        with open(journal_path, "r", encoding="utf-8") as f:
+            journal = json.load(f)
+    except FileNotFoundError:
+        return 0
+    rollback = journal.get("state") != "committed"
+    for rel_path in journal.get("files", []):
+        target = os.path.join(target_dir, rel_path)
+        backup = f"{target}{BACKUP_SUFFIX}"
+        if os.path.exists(backup):
+            if rollback:
+                os.replace(backup, target)
+            else:
+                os.remove(backup)
+        elif rollback and rel_path in journal.get("created", []) and os.path.exists(target):
+            os.remove(target)
+    if rollback:
+        # 由深到浅删除本次新建的目录；不为空（有别人写入的文件）时保留
+        for rel_dir in reversed(journal.get("dirs", [])):
+            try:
+                os.rmdir(os.path.join(target_dir, rel_dir))
+            except OSError:
+                pass
+    if journal.get("staging"):
+        shutil.rmtree(os.path.join(target_dir, journal["staging"]), ignore_errors=True)
+    os.remove(journal_path)
+    return len(journal.get("files", []))
+
+
+def _write_journal(target_dir, journal):
+    path = os.path.join(target_dir, APPLY_JOURNAL)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(journal, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(f"{path}.tmp", path)
+
+
+def apply_package(archive_path, target_dir, force=False):
+    """
+    把压缩包安装到 target_dir，全部成功或全部不变。
+    force=False 时目标文件必须仍是打包时的原文件（base_sha1），否则整体放弃；
+    已经是新内容的文件跳过。返回 {"installed", "unchanged", "conflicts", "bytes"}
+    """
+    if not os.path.isdir(target_dir):
+        raise PackageError(f"Target directory does not exist: {target_dir}")
+    recovered = recover_apply(target_dir)
+    if recovered:
+        print(f"  ↻ 已恢复上次中断的安装（{recovered} 个文件）")
+    # 在解压阶段被中断的安装没有清单，只留下临时目录
+    for entry in os.scandir(target_dir):
+        if entry.name.startswith(STAGING_PREFIX) and entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    staged = {}
+    manifest = None
+    stats = {"installed": 0, "unchanged": 0, "conflicts": [], "bytes": 0}
+    # 临时目录与目标在同一文件系统，提交时可以直接 os.replace；校验通过之前不在目标目录中创建其他目录
+    staging_dir = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=target_dir)
+    try:
+        # 1. 解压到临时目录（按序号命名，不需要子目录），同时计算 sha1
+        for rel_path, f in iter_archive(archive_path):
+            if rel_path == MANIFEST_NAME:
+                manifest = json.loads(f.read().decode("utf-8"))
+                continue
+            tmp_path = os.path.join(staging_dir, str(len(staged)))
+            digest = hashlib.sha1()
+            with open(tmp_path, "wb") as dst:
+                while True:
+                    chunk = f.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    dst.write(chunk)
+                dst.flush()
+                os.fsync(dst.fileno())
+            staged[rel_path] = (tmp_path, digest.hexdigest())
+        if manifest is None or manifest.get("version") != MANIFEST_VERSION:
+            raise PackageError(f"{archive_path} has no {MANIFEST_NAME} (not created by this tool?)")
+
+        # 2. 校验：内容完整，目标文件仍是原文件
+        files = manifest.get("files", {})
+        install = []
+        created = []
+        for rel_path, (tmp_path, sha1) in staged.items():
+            entry = files.get(rel_path)
+            if entry is None or entry["sha1"] != sha1:
+                raise PackageError(f"Corrupt archive entry: {rel_path}")
+            target = os.path.join(target_dir, *rel_path.split("/"))
+            current = file_sha1(target) if os.path.isfile(target) else None
+            if current == sha1:
+                stats["unchanged"] += 1
+                continue
+            if current != entry.get("base_sha1") and not force:
+                stats["conflicts"].append(rel_path)
+            if current is None:
+                created.append(rel_path)
+            install.append(rel_path)
+            stats["bytes"] += entry["size"]
+        missing = sorted(set(files) - set(staged))
+        if missing:
+            raise PackageError(f"Archive is missing {len(missing)} files listed in its manifest, e.g. {missing[0]}")
+        if stats["conflicts"]:
+            return stats
+
+        # 3. 提交：先记录清单（包括要新建的目录），再创建目录、备份原文件并替换；任何一步失败都回滚
+        dirs = set()
+        for rel_path in install:
+            parent = posixpath.dirname(rel_path)
+            while parent and not os.path.isdir(os.path.join(target_dir, parent)):
+                dirs.add(parent)
+                parent = posixpath.dirname(parent)
+        journal = {
+            "state": "prepared",
+            "files": install,
+            "created": created,
+            "dirs": sorted(dirs, key=lambda rel_dir: (rel_dir.count("/"), rel_dir)),
+            "staging": os.path.basename(staging_dir),
+        }
+        _write_journal(target_dir, journal)
+        try:
+            for rel_dir in journal["dirs"]:
+                os.makedirs(os.path.join(target_dir, *rel_dir.split("/")), exist_ok=True)
+            for rel_path in install:
+                target = os.path.join(target_dir, *rel_path.split("/"))
+                if os.path.exists(target):
+                    os.replace(target, f"{target}{BACKUP_SUFFIX}")
+                os.replace(staged[rel_path][0], target)
+        except BaseException:
+            recover_apply(target_dir)
+            raise
+        journal["state"] = "committed"
+        _write_journal(target_dir, journal)
+        recover_apply(target_dir)
+        stats["installed"] = len(install)
+        return stats
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
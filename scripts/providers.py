@@ -0,0 +1,280 @@
+"""
+翻译后端注册表：多个后端按顺序故障转移、对冲请求、熔断
+
+- providers 配置为有序列表，每项覆盖顶层配置（translate_mode、endpoint、openai_base_url、
+  openai_model、max_concurrency 等），未配置时顶层配置本身就是唯一的后端
+- 熔断：连续 circuit_failures 次失败后暂停使用该后端 circuit_reset_seconds 秒，
+  之后放行一个试探请求，成功即恢复
+- 对冲：请求超过该后端近期延迟的 hedge_percentile 分位数仍未返回时，
+  向下一个可用后端再发一份，取先成功的结果
+"""
+
+import collections
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_seconds = float(reset_seconds)
+        self.failures = 0
+        self.opened_at = None
+        self.opens = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_seconds:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        """关闭时放行；打开超过 reset_seconds 后只放行一个试探请求"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        """连续失败达到阈值或试探请求失败时（重新）打开"""
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    self.opens += 1
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+
+class Provider:
+    def __init__(self, name, config, breaker, window=200):
+        self.name = name
+        self.config = config
+        self.breaker = breaker
+        self._latencies = {}
+        self._window = window
+        self._lock = threading.Lock()
+        self.stats = collections.Counter()
+
+    def observe(self, op, seconds):
+        with self._lock:
+            samples = self._latencies.get(op)
+            if samples is None:
+                samples = self._latencies[op] = collections.deque(maxlen=self._window)
+            samples.append(seconds)
+
+    def percentile(self, op, fraction, min_samples):
+        """近期成功请求延迟的分位数；样本不足时返回 None"""
+        with self._lock:
+            samples = sorted(self._latencies.get(op, ()))
+        if len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+
+class AllProvidersUnavailable(RuntimeError):
+    """所有后端都已熔断"""
+
+
+class ProviderRegistry:
+    """
+    is_failure(异常) 判断是否换后端；service_time() 返回当前线程累计的请求耗时（不含限流排队），
+    对冲延迟按它统计，否则后端拥塞时排队时间会把分位数越推越高
+    """
+
+    def __init__(
+        self, providers, is_failure, hedge_percentile=0.0, hedge_min_delay=0.5, hedge_min_samples=20, service_time=None
+    ):
+        self.providers = providers
+        self.is_failure = is_failure
+        self.service_time = service_time
+        self.hedge_percentile = float(hedge_percentile or 0)
+        self.hedge_min_delay = float(hedge_min_delay)
+        self.hedge_min_samples = int(hedge_min_samples)
+
+    def candidates(self, kinds=None):
+        """按配置顺序返回可处理该请求的、熔断器未打开的后端"""
+        return [
+            provider
+            for provider in self.providers
+            if (kinds is None or provider.config.get("translate_mode", "api").lower() in kinds)
+            and provider.breaker.state != "open"
+        ]
+
+    def call(self, fn, op="text", kinds=None, hedge=True):
+        """
+        fn(provider) 完成一次请求。后端不可用（is_failure 为真）时换下一个后端，
+        其他异常（内容格式、4xx 等）直接抛出；所有后端都失败时抛出最后一个异常
+        """
+        providers = self.candidates(kinds)
+        if hedge and self.hedge_percentile > 0 and len(providers) > 1:
+            return self._call_hedged(fn, op, providers)
+
+        error = None
+        for provider in providers:
+            if not provider.breaker.allow():
+                continue
+            try:
+                return self._attempt(fn, op, provider)
+            except Exception as e:
+                if not self.is_failure(e):
+                    raise
+                error = e
+                provider.incr("failovers")
+        raise error or AllProvidersUnavailable("All translation providers are unavailable (circuit open)")
+
+    def _elapsed(self):
+        return self.service_time() if self.service_time else time.perf_counter()
+
+    def _attempt(self, fn, op, provider):
+        provider.incr("requests")
+        start = self._elapsed()
+        try:
+            result = fn(provider)
+        except Exception as e:
+            if self.is_failure(e):
+                provider.incr("failures")
+                provider.breaker.record_failure()
+            else:
+                provider.breaker.record_success()
+            raise
+        provider.observe(op, self._elapsed() - start)
+        provider.breaker.record_success()
+        return result
+
+    def _hedge_delay(self, provider, op):
+        delay = provider.percentile(op, self.hedge_percentile, self.hedge_min_samples)
+        if delay is None:
+            return None
+        return max(delay, self.hedge_min_delay)
+
+    def _start(self, fn, op, provider):
+        """
+        在独立线程中请求，不用固定大小的线程池：落后的慢请求仍占着线程时不能挡住新的请求，
+        并发由各后端自己的限流器约束
+        """
+        future = Future()
+
+        def run():
+            try:
+                future.set_result(self._attempt(fn, op, provider))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def _call_hedged(self, fn, op, providers):
+        """
+        先请求第一个后端；超过它的对冲延迟仍未返回时再请求下一个，失败时立即换下一个。
+        返回最先成功的结果，落后的请求在后台完成后丢弃
+        """
+        waiting = list(providers)
+        running = {}
+        hedges = set()
+        error = None
+
+        def launch(hedged):
+            while waiting:
+                provider = waiting.pop(0)
+                if not provider.breaker.allow():
+                    continue
+                future = self._start(fn, op, provider)
+                running[future] = provider
+                if hedged:
+                    provider.incr("hedged")
+                    hedges.add(future)
+                return
+
+        launch(False)
+        while running:
+            timeout = None
+            if waiting:
+                delays = [self._hedge_delay(provider, op) for provider in running.values()]
+                delays = [delay for delay in delays if delay is not None]
+                timeout = min(delays) if delays else None
+            done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                launch(True)
+                continue
+            for future in done:
+                provider = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if not self.is_failure(e):
+                        raise
+                    error = e
+                    provider.incr("failovers")
+                    continue
+                if future in hedges:
+                    provider.incr("hedge_wins")
+                return result
+            if not running:
+                launch(False)
+        raise error or AllProvidersUnavailable("All translation providers are unavailable (circuit open)")
+
+    def stats(self):
+        return {
+            provider.name: dict(
+                provider.stats,
+                breaker=provider.breaker.state,
+                breaker_opens=provider.breaker.opens,
+            )
+            for provider in self.providers
+        }
+
+
+def provider_configs(config):
+    """[(名称, 合并后的配置)]；每个后端的配置为顶层配置加上该项的覆盖"""
+    entries = config.get("providers") or [{}]
+    configs = []
+    for index, entry in enumerate(entries):
+        name = entry.get("name") or f"{entry.get('translate_mode', config.get('translate_mode', 'api'))}-{index}"
+        merged = dict(config)
+        merged.pop("providers", None)
+        merged.update(entry)
+        merged["provider_name"] = name
+        configs.append((name, merged))
+    return configs
+
+
+def build_registry(config, is_failure, service_time=None):
+    providers = [
+        Provider(
+            name,
+            provider_config,
+            CircuitBreaker(
+                provider_config.get("circuit_failures", 5),
+                provider_config.get("circuit_reset_seconds", 30),
+            ),
+        )
+        for name, provider_config in provider_configs(config)
+    ]
+    return ProviderRegistry(
+        providers,
+        is_failure,
+        config.get("hedge_percentile", 0),
+        config.get("hedge_min_delay", 0.5),
+        config.get("hedge_min_samples", 20),
+        service_time,
+    )
@@ -0,0 +1,145 @@
+"""
+QElectroTech 安装路径检测
+
+只在需要自动检测时才由 translate_to_result 导入；winreg 和 PowerShell
+只在 Windows 上使用，其他系统只读取配置文件中的 qet_elements_path。
+"""
+
+import json
+import os
+import subprocess
+from pathlib import Path
+
+CONFIG_PATH = "translate_config.json"
+
+
+def resolve_shortcut_target(lnk_path):
+    try:
+        escaped_path = str(lnk_path).replace("'", "''")
+        command = [
+            "powershell",
+            "-NoProfile",
+            "-Command",
+            f"$s=(New-Object -ComObject WScript.Shell).CreateShortcut('{escaped_path}'); $s.TargetPath",
+        ]
+        result = subprocess.run(command, capture_output=True, text=True)
+        target = result.stdout.strip()
+        return target if target else None
+    except Exception:
+        return None
+
+
+def confirm_path(candidate_path, source_label):
+    while True:
+        answer = input(
+            f"检测到{source_label}: {candidate_path}\n是否使用这个路径？[Y/n]: "
+        ).strip().lower()
+        if answer in ("", "y", "yes"):
+            return True
+        if answer in ("n", "no"):
+            return False
+        print("请输入 Y 或 N。")
+
+
+def find_qet_installation(config_path=CONFIG_PATH, interactive=True):
+    """
+    自动检测QElectroTech安装路径
+    优先级：
+    1. 从注册表读取（Windows）
+    2. 从桌面快捷方式解析安装位置（Windows，需要确认；interactive=False 时跳过）
+    3. 检查常见安装位置（Windows）
+    4. 从配置文件读取用户自定义路径
+    """
+    print("[检测] QElectroTech 安装路径...")
+
+    if os.name == "nt":
+        path = find_windows_installation(interactive)
+        if path:
+            return path
+
+    # 4. 从配置文件读取（如果有）
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+            custom_path = config.get("qet_elements_path")
+            if custom_path:
+                path = Path(custom_path)
+                if path.exists():
+                    print(f"✓ 使用配置文件路径: {path}")
+                    return str(path)
+                else:
+                    print(f"⚠ 配置文件中的路径不存在: {path}")
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+
+    print("✗ 未找到QElectroTech安装路径")
+    return None
+
+
+def find_windows_installation(interactive=True):
+    # 1. 尝试从注册表读取（最准确）
+    try:
+        import winreg
+
+        key_paths = [
+            r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall\QElectroTech",
+            r"SOFTWARE\WOW6432Node\Microsoft\Windows\CurrentVersion\Uninstall\QElectroTech",
+        ]
+
+        for key_path in key_paths:
+            try:
+                with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, key_path) as key:
+                    install_location, _ = winreg.QueryValueEx(key, "InstallLocation")
+                    elements_path = Path(install_location) / "elements"
+                    if elements_path.exists():
+                        print(f"✓ 从注册表找到: {elements_path}")
+                        return str(elements_path)
+            except FileNotFoundError:
+                continue
+    except Exception as e:
+        print(f"  注册表检测失败: {e}")
+
+    # 2. 从桌面快捷方式解析安装位置（每个快捷方式启动一次 PowerShell，并等待用户确认）
+    shortcut_candidates = []
+    if interactive:
+        desktop_paths = [
+            Path(os.path.expanduser("~")) / "Desktop",
+            Path(r"C:\Users\Public\Desktop"),
+        ]
+        for desktop in desktop_paths:
+            if not desktop.exists():
+                continue
+            for shortcut in desktop.glob("*.lnk"):
+                if "qelectrotech" in shortcut.name.lower():
+                    shortcut_candidates.append(shortcut)
+
+    for shortcut in shortcut_candidates:
+        target = resolve_shortcut_target(shortcut)
+        if not target:
+            continue
+        target_path = Path(target)
+        if not target_path.exists():
+            continue
+        install_dir = target_path.parent
+        elements_path = install_dir / "elements"
+        if elements_path.exists():
+            if confirm_path(elements_path, f"桌面快捷方式 ({shortcut.name})"):
+                print(f"✓ 使用快捷方式路径: {elements_path}")
+                return str(elements_path)
+            break
+
+    # 3. 检查常见安装位置
+    common_paths = [
+        Path(r"C:\Program Files\QElectroTech\elements"),
+        Path(r"C:\Program Files (x86)\QElectroTech\elements"),
+        Path(os.environ.get("ProgramFiles", "C:\\Program Files")) / "QElectroTech" / "elements",
+        Path(os.environ.get("ProgramFiles(x86)", "C:\\Program Files (x86)")) / "QElectroTech" / "elements",
+    ]
+
+    print("  检查常见安装位置...")
+    for path in common_paths:
+        if path.exists():
+            print(f"✓ 找到安装路径: {path}")
+            return str(path)
+
+    return None
@@ -0,0 +1,112 @@
+"""
+共享限流调度器
+
+- 请求数令牌桶（requests_per_second）和 token 令牌桶（tokens_per_minute）
+- 并发上限按 AIMD 调整：成功时加性增加，429/5xx 时乘性减半
+- 遵守服务端返回的 Retry-After，暂停期间所有线程一起等待
+"""
+
+import email.utils
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate or 0)
+        self.capacity = float(capacity if capacity is not None else max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount, now):
+        """返回还需等待的秒数；0 表示现在就可以取走 amount 个令牌"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        if self.rate > 0:
+            self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        requests_per_second=0,
+        tokens_per_minute=0,
+        max_concurrency=1,
+        min_concurrency=1,
+    ):
+        self.request_bucket = TokenBucket(requests_per_second)
+        self.token_bucket = TokenBucket(
+            (tokens_per_minute or 0) / 60.0, tokens_per_minute or None
+        )
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.min_concurrency = max(1, min(int(min_concurrency), self.max_concurrency))
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.pause_until = 0.0
+        self.throttled = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, tokens=0):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self.pause_until:
+                    self._cond.wait(self.pause_until - now)
+                    continue
+                if self.in_flight >= int(self.limit):
+                    self._cond.wait()
+                    continue
+                wait = max(
+                    self.request_bucket.delay(1, now),
+                    self.token_bucket.delay(tokens, now),
+                )
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                self.request_bucket.take(1)
+                self.token_bucket.take(tokens)
+                self.in_flight += 1
+                return
+
+    def release(self, throttled=False, retry_after=None):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self.limit = max(float(self.min_concurrency), self.limit / 2)
+                if retry_after:
+                    self.pause_until = max(self.pause_until, time.monotonic() + retry_after)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+
+def parse_retry_after(headers):
+    """Retry-After 可以是秒数或 HTTP 日期"""
+    value = None
+    for name, header_value in (headers or {}).items():
+        if name.lower() == "retry-after":
+            value = header_value
+            break
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
@@ -0,0 +1,246 @@
+"""
+运行指标与 JSON 运行报告
+
+- 各阶段耗时：detect / sync / copy / scan / translate（墙钟时间）
+- 累计耗时：write、cache_lock_wait（各线程相加，可能超过墙钟时间）
+- 缓存命中/未命中、API 请求数、延迟直方图、重试和限流次数
+- 读取/写入字节数、cache_lock 等待时间
+- 可选的翻译阶段性能分析：cProfile（仅主线程）或采样（覆盖全部线程）
+"""
+
+import bisect
+import collections
+import contextlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+REPORT_VERSION = 1
+# 延迟直方图的桶上界（秒），最后一个桶收集超出上界的请求
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class LatencyHistogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        """按桶上界估计分位数"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self):
+        labels = [f"<={bound:g}s" for bound in self.buckets] + [f">{self.buckets[-1]:g}s"]
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class RunMetrics:
+    """一次运行的全部计数器，线程安全"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.phases = collections.OrderedDict()
+        self.timers = collections.OrderedDict()
+        self.counters = collections.Counter()
+        self.latency = LatencyHistogram()
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """主流程的阶段，记录墙钟时间"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + elapsed
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        """工作线程中的操作，各线程耗时累加"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def observe_latency(self, seconds):
+        with self._lock:
+            self.latency.observe(seconds)
+
+    def report(self, extra=None):
+        with self._lock:
+            report = {
+                "version": REPORT_VERSION,
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+                "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+                "timers": {name: round(seconds, 6) for name, seconds in self.timers.items()},
+                "counters": dict(sorted(self.counters.items())),
+                "api_latency": self.latency.to_dict(),
+            }
+        report.update(extra or {})
+        return report
+
+    def write_report(self, path, extra=None):
+        """写入临时文件后替换，返回实际路径；path 中可用 {timestamp}"""
+        path = path.format(timestamp=time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at)))
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(extra), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+
+class TimedLock:
+    """threading.Lock 的包装，把获取锁的等待时间累计到 metrics"""
+
+    def __init__(self, metrics, name):
+        self._lock = threading.Lock()
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self._lock.acquire()
+        self.metrics.add_time(self.name, time.perf_counter() - start)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._lock.release()
+
+
+class SamplingProfiler:
+    """
+    每 interval 秒采样一次所有线程的调用栈，输出折叠栈格式（可直接用于火焰图工具）
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def top(self, limit=20):
+        leaf_counts = collections.Counter()
+        for stack, count in self.stacks.items():
+            leaf_counts[stack.rsplit(";", 1)[-1]] += count
+        return [{"function": name, "samples": count} for name, count in leaf_counts.most_common(limit)]
+
+
+class StageProfiler:
+    """
+    profile = "cprofile" | "sample"，包住翻译阶段；未配置时什么也不做
+    """
+
+    def __init__(self, mode, output=None, interval=0.005):
+        self.mode = (mode or "").lower()
+        self.output = output
+        self.interval = interval
+        self._profiler = None
+        self.summary = None
+
+    def __enter__(self):
+        if self.mode == "cprofile":
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        elif self.mode == "sample":
+            self._profiler = SamplingProfiler(self.interval)
+            self._profiler.start()
+        elif self.mode:
+            raise ValueError(f"Unknown profile mode: {self.mode}")
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._profiler is None:
+            return
+        if self.mode == "cprofile":
+            self._profiler.disable()
+            output = self.output or "translate_profile.prof"
+            self._profiler.dump_stats(output)
+            import pstats
+
+            stream = io.StringIO()
+            pstats.Stats(self._profiler, stream=stream).sort_stats("cumulative").print_stats(20)
+            self.summary = {"mode": "cprofile", "output": output, "top": stream.getvalue().splitlines()}
+        else:
+            self._profiler.stop()
+            output = self.output or "translate_profile.folded"
+            self._profiler.write(output)
+            self.summary = {
+                "mode": "sample",
+                "output": output,
+                "samples": self._profiler.samples,
+                "top": self._profiler.top(),
+            }
+
@@ -1,179 +1,501 @@
+import argparse
+import functools
+import hashlib
 import json
 import os
+import queue
 import re
 import shutil
-import subprocess
+import sys
+import socket
 import time
-import urllib.request
-import winreg
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from pathlib import Path
 import threading
 
+from cache_store import DEFAULT_OPENAI_MODEL, open_caches
+from glossary import load_glossary
+from run_metrics import RunMetrics, StageProfiler, TimedLock
+from translation_memory import build_memories
+
 CONFIG_PATH = "translate_config.json"
 SRC_DIR = "src"
 RESULT_DIR = "result"
+# OpenAI 提示词版本，修改提示词时加一；缓存按此版本区分命名空间（见 cache_store.py）
+PROMPT_VERSION = 1
+
+# 当前运行的指标（阶段耗时、缓存命中、API 延迟、读写字节等），见 run_metrics.py
+_metrics = RunMetrics()
+
+
+def reset_metrics():
+    global _metrics
+    _metrics = RunMetrics()
+    return _metrics
+
+
+def is_element_file(filename):
+    return filename == "qet_directory" or filename.lower().endswith(".elmt")
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
-def resolve_shortcut_target(lnk_path):
+def load_sync_manifest(path):
+    if not path or not os.path.exists(path):
+        return {}
     try:
-        escaped_path = str(lnk_path).replace("'", "''")
-        command = [
-            "powershell",
-            "-NoProfile",
-            "-Command",
-            f"$s=(New-Object -ComObject WScript.Shell).CreateShortcut('{escaped_path}'); $s.TargetPath",
-        ]
-        result = subprocess.run(command, capture_output=True, text=True)
-        target = result.stdout.strip()
-        return target if target else None
-    except Exception:
-        return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
 
 
-def confirm_path(candidate_path, source_label):
-    while True:
-        answer = input(
-            f"检测到{source_label}: {candidate_path}\n是否使用这个路径？[Y/n]: "
-        ).strip().lower()
-        if answer in ("", "y", "yes"):
-            return True
-        if answer in ("n", "no"):
-            return False
-        print("请输入 Y 或 N。")
+def save_sync_manifest(path, manifest):
+    if not path:
+        return
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
 
 
-def find_qet_installation():
+def copy_file_replace(src_file, dst_file):
     """
-    自动检测QElectroTech安装路径（Windows）
-    优先级：
-    1. 从注册表读取
-    2. 从桌面快捷方式解析安装位置
-    3. 检查常见安装位置
-    4. 从配置文件读取用户自定义路径
+    复制到临时文件后原子替换目标文件；
+    不在原位截断写入，避免改动与目标共享 inode 的硬链接
     """
-    print("[检测] QElectroTech 安装路径...")
+    tmp_path = f"{dst_file}.sync-tmp"
+    shutil.copy2(src_file, tmp_path)
+    os.replace(tmp_path, dst_file)
 
-    # 1. 尝试从注册表读取（最准确）
-    try:
-        key_paths = [
-            r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall\QElectroTech",
-            r"SOFTWARE\WOW6432Node\Microsoft\Windows\CurrentVersion\Uninstall\QElectroTech",
-        ]
 
-        for key_path in key_paths:
-            try:
-                with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, key_path) as key:
-                    install_location, _ = winreg.QueryValueEx(key, "InstallLocation")
-                    elements_path = Path(install_location) / "elements"
-                    if elements_path.exists():
-                        print(f"✓ 从注册表找到: {elements_path}")
-                        return str(elements_path)
-            except FileNotFoundError:
-                continue
-    except Exception as e:
-        print(f"  注册表检测失败: {e}")
+class SyncReport:
+    def __init__(self):
+        self.files = []
+        self.added = []
+        self.changed = []
+        self.removed = []
+        self.hashes = {}
+        self.element_count = 0
+        # 上次生成 result 之后累计的变更（可能跨多次 sync），stage_result 据此更新 result
+        self.restage = []
+        self.unstage = []
 
-    # 2. 从桌面快捷方式解析安装位置
-    desktop_paths = [
-        Path(os.path.expanduser("~")) / "Desktop",
-        Path(r"C:\Users\Public\Desktop"),
-    ]
-    shortcut_candidates = []
-    for desktop in desktop_paths:
-        if not desktop.exists():
-            continue
-        for shortcut in desktop.glob("*.lnk"):
-            if "qelectrotech" in shortcut.name.lower():
-                shortcut_candidates.append(shortcut)
+    @property
+    def delta_count(self):
+        return len(self.added) + len(self.changed) + len(self.removed)
+
+
+def sync_elements(qet_path, src_path, manifest_path=None):
+    """
+    增量同步QElectroTech的elements文件夹到src目录
+    通过清单（相对路径、大小、修改时间、内容哈希）只复制新增/变更的文件，
+    只删除已移除的文件，并在同一次遍历中统计元件数量
+    """
+    print(f"\n[同步] 开始同步元件库...")
+    print(f"  源路径: {qet_path}")
+    print(f"  目标路径: {src_path}")
+
+    manifest = load_sync_manifest(manifest_path)
+    old_files = manifest.get("files", {})
+    # 源路径变化时不能信任大小+修改时间的快速判断，只按哈希比较
+    trust_stat = manifest.get("source") == os.path.abspath(qet_path)
+    first_run = not old_files
+
+    report = SyncReport()
+    new_files = {}
+    os.makedirs(src_path, exist_ok=True)
+
+    for root, dirs, files in os.walk(qet_path):
+        dirs.sort()
+        rel_root = os.path.relpath(root, qet_path)
+        dst_root = src_path if rel_root == "." else os.path.join(src_path, rel_root)
+        os.makedirs(dst_root, exist_ok=True)
+
+        for filename in sorted(files):
+            src_file = os.path.join(root, filename)
+            dst_file = os.path.join(dst_root, filename)
+            rel_path = filename if rel_root == "." else f"{rel_root}/{filename}".replace(os.sep, "/")
+
+            st = os.stat(src_file)
+            entry = old_files.get(rel_path)
+            dst_exists = os.path.isfile(dst_file)
+
+            if (
+                trust_stat
+                and entry
+                and dst_exists
+                and entry[0] == st.st_size
+                and entry[1] == st.st_mtime_ns
+            ):
+                digest = entry[2]
+            else:
+                digest = file_digest(src_file)
+                if entry and dst_exists and entry[2] == digest:
+                    pass
+                elif not entry and dst_exists and file_digest(dst_file) == digest:
+                    # 首次使用清单时复用已有的src文件，避免整库重写
+                    pass
+                else:
+                    copy_file_replace(src_file, dst_file)
+                    if entry or dst_exists:
+                        report.changed.append(rel_path)
+                    else:
+                        report.added.append(rel_path)
+
+            new_files[rel_path] = [st.st_size, st.st_mtime_ns, digest]
+            report.files.append(rel_path)
+            report.hashes[rel_path] = digest
+            if is_element_file(filename):
+                report.element_count += 1
+
+    if first_run:
+        # 没有旧清单时，只能遍历src查找多余文件
+        stale = []
+        for root, _, files in os.walk(src_path):
+            for filename in files:
+                rel_path = os.path.relpath(os.path.join(root, filename), src_path).replace(os.sep, "/")
+                if rel_path not in new_files:
+                    stale.append(rel_path)
+    else:
+        stale = [rel_path for rel_path in old_files if rel_path not in new_files]
+
+    for rel_path in sorted(stale):
+        stale_file = os.path.join(src_path, rel_path)
+        if os.path.isfile(stale_file):
+            os.remove(stale_file)
+        report.removed.append(rel_path)
+        remove_empty_parents(os.path.dirname(stale_file), src_path)
+
+    pending = manifest.get("pending", {})
+    removed = set(report.removed)
+    report.restage = sorted(
+        (set(pending.get("restage", [])) | set(report.added) | set(report.changed)) - removed
+    )
+    report.unstage = sorted(
+        (set(pending.get("unstage", [])) | removed) - set(new_files)
+    )
+    save_sync_manifest(
+        manifest_path,
+        {
+            "version": 1,
+            "source": os.path.abspath(qet_path),
+            "files": new_files,
+            "pending": {"restage": report.restage, "unstage": report.unstage},
+        },
+    )
+
+    print(
+        f"✓ 同步完成！共 {report.element_count} 个元件文件"
+        f"（新增 {len(report.added)}，变更 {len(report.changed)}，删除 {len(report.removed)}）"
+    )
+    return report
+
+
+def sync_changes(qet_path, src_path, manifest_path, changed, removed):
+    """
+    watch 模式的增量同步：只处理监视到的新增/修改（changed）和删除（removed）的相对路径，
+    清单中其余条目保持不变；内容哈希与清单一致的文件（例如只改了修改时间）不复制。
+    变更与清单中之前累计（例如上次处理失败）的待暂存变更合并后写入清单，
+    调用方更新并翻译 result 成功后再用 mark_staged 清空
+    """
+    manifest = load_sync_manifest(manifest_path)
+    files = manifest.get("files", {})
+    report = SyncReport()
 
-    for shortcut in shortcut_candidates:
-        target = resolve_shortcut_target(shortcut)
-        if not target:
+    for rel_path in changed:
+        src_file = os.path.join(qet_path, rel_path)
+        dst_file = os.path.join(src_path, rel_path)
+        try:
+            st = os.stat(src_file)
+            digest = file_digest(src_file)
+        except FileNotFoundError:
+            # 监视到变化之后又被删除
+            removed = list(removed) + [rel_path]
             continue
-        target_path = Path(target)
-        if not target_path.exists():
+        entry = files.get(rel_path)
+        dst_exists = os.path.isfile(dst_file)
+        files[rel_path] = [st.st_size, st.st_mtime_ns, digest]
+        if entry and dst_exists and entry[2] == digest:
+            continue
+        os.makedirs(os.path.dirname(dst_file), exist_ok=True)
+        copy_file_replace(src_file, dst_file)
+        if entry or dst_exists:
+            report.changed.append(rel_path)
+        else:
+            report.added.append(rel_path)
+        report.files.append(rel_path)
+        report.hashes[rel_path] = digest
+        if is_element_file(rel_path.rsplit("/", 1)[-1]):
+            report.element_count += 1
+
+    for rel_path in removed:
+        stale_file = os.path.join(src_path, rel_path)
+        if files.pop(rel_path, None) is None and not os.path.isfile(stale_file):
             continue
-        install_dir = target_path.parent
-        elements_path = install_dir / "elements"
-        if elements_path.exists():
-            if confirm_path(elements_path, f"桌面快捷方式 ({shortcut.name})"):
-                print(f"✓ 使用快捷方式路径: {elements_path}")
-                return str(elements_path)
+        if os.path.isfile(stale_file):
+            os.remove(stale_file)
+            remove_empty_parents(os.path.dirname(stale_file), src_path)
+        report.removed.append(rel_path)
+
+    pending = manifest.get("pending", {})
+    removed = set(report.removed)
+    report.restage = sorted(
+        (set(pending.get("restage", [])) | set(report.added) | set(report.changed)) - removed
+    )
+    report.unstage = sorted((set(pending.get("unstage", [])) | removed) - set(files))
+    # 之前累计的文件同样要放入 result
+    for rel_path in report.restage:
+        if rel_path not in report.hashes and rel_path in files:
+            report.files.append(rel_path)
+            report.hashes[rel_path] = files[rel_path][2]
+    if changed or removed:
+        # 只改了修改时间的文件也更新清单，下次完整同步不必重新计算哈希
+        manifest.update(
+            {
+                "version": 1,
+                "source": os.path.abspath(qet_path),
+                "files": files,
+                "pending": {"restage": report.restage, "unstage": report.unstage},
+            }
+        )
+        save_sync_manifest(manifest_path, manifest)
+    return report
+
+
+def load_sync_report(manifest_path):
+    """
+    不同步、只翻译时，从同步清单还原 src 的文件列表和尚未反映到 result 的变更；
+    没有清单时返回 None（translate 子命令据此提示先运行 sync）
+    """
+    manifest = load_sync_manifest(manifest_path)
+    if not manifest.get("files"):
+        return None
+    report = SyncReport()
+    for rel_path, entry in manifest["files"].items():
+        report.files.append(rel_path)
+        report.hashes[rel_path] = entry[2]
+        if is_element_file(rel_path.rsplit("/", 1)[-1]):
+            report.element_count += 1
+    pending = manifest.get("pending", {})
+    report.restage = pending.get("restage", [])
+    report.unstage = pending.get("unstage", [])
+    return report
+
+
+def mark_staged(manifest_path, keep=()):
+    """result 已按清单更新，清空累计的变更；keep 中的相对路径留在 restage 中下次重试"""
+    manifest = load_sync_manifest(manifest_path)
+    pending = {"restage": sorted(keep), "unstage": []}
+    if manifest.get("pending", {"restage": [], "unstage": []}) != pending:
+        manifest["pending"] = pending
+        save_sync_manifest(manifest_path, manifest)
+
+
+def remove_empty_parents(path, stop_dir):
+    stop_dir = os.path.abspath(stop_dir)
+    path = os.path.abspath(path)
+    while path != stop_dir and path.startswith(stop_dir):
+        try:
+            os.rmdir(path)
+        except OSError:
             break
+        path = os.path.dirname(path)
 
-    # 3. 检查常见安装位置
-    common_paths = [
-        Path(r"C:\Program Files\QElectroTech\elements"),
-        Path(r"C:\Program Files (x86)\QElectroTech\elements"),
-        Path(os.environ.get("ProgramFiles", "C:\\Program Files")) / "QElectroTech" / "elements",
-        Path(os.environ.get("ProgramFiles(x86)", "C:\\Program Files (x86)")) / "QElectroTech" / "elements",
-    ]
 
-    print("  检查常见安装位置...")
-    for path in common_paths:
-        if path.exists():
-            print(f"✓ 找到安装路径: {path}")
-            return str(path)
+# Linux FICLONE ioctl（btrfs / xfs 等支持写时复制的文件系统）
+FICLONE = 0x40049409
 
-    # 4. 从配置文件读取（如果有）
-    try:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            config = json.load(f)
-            custom_path = config.get("qet_elements_path")
-            if custom_path:
-                path = Path(custom_path)
-                if path.exists():
-                    print(f"✓ 使用配置文件路径: {path}")
-                    return str(path)
-                else:
-                    print(f"⚠ 配置文件中的路径不存在: {path}")
-    except (FileNotFoundError, json.JSONDecodeError):
-        pass
 
-    print("✗ 未找到QElectroTech安装路径")
-    return None
+def reflink_file(src_file, dst_file):
+    import fcntl
+
+    with open(src_file, "rb") as src, open(dst_file, "wb") as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(dst_file)
+            raise
+    shutil.copystat(src_file, dst_file)
 
 
-def sync_elements(qet_path, src_path):
+class ResultStager:
     """
-    同步QElectroTech的elements文件夹到src目录
+    把src中的文件放入result：优先reflink/硬链接，失败时回退为复制
+    link_mode: auto / reflink / hardlink / copy
     """
-    print(f"\n[同步] 开始同步元件库...")
-    print(f"  源路径: {qet_path}")
-    print(f"  目标路径: {src_path}")
 
-    if os.path.exists(src_path):
-        print("  清空现有src目录...")
-        shutil.rmtree(src_path)
+    def __init__(self, link_mode="auto"):
+        link_mode = (link_mode or "auto").lower()
+        if link_mode == "auto":
+            self.methods = ["reflink", "hardlink", "copy"]
+        elif link_mode in ("reflink", "hardlink"):
+            self.methods = [link_mode, "copy"]
+        else:
+            self.methods = ["copy"]
+        self.counts = {"reflink": 0, "hardlink": 0, "copy": 0}
+        # True 表示 result 被整体重建，其中的文件都还没有插入译文
+        self.rebuilt = False
+        # 本次从 src 放入（新建或替换）的相对路径，这些文件同样还没有插入译文
+        self.placed = set()
+
+    def place(self, src_file, dst_file):
+        if os.path.lexists(dst_file):
+            os.remove(dst_file)
+        while True:
+            method = self.methods[0]
+            try:
+                if method == "reflink":
+                    reflink_file(src_file, dst_file)
+                elif method == "hardlink":
+                    os.link(src_file, dst_file)
+                else:
+                    shutil.copy2(src_file, dst_file)
+                self.counts[method] += 1
+                return method
+            except (OSError, ImportError, NotImplementedError):
+                if method == "copy":
+                    raise
+                # 当前文件系统不支持，后续文件不再尝试该方式
+                self.methods.pop(0)
+
+    def summary(self):
+        return "，".join(f"{name} {count}" for name, count in self.counts.items() if count)
 
-    print("  复制文件中...")
-    shutil.copytree(qet_path, src_path)
 
-    file_count = 0
-    for root, _, files in os.walk(src_path):
+def stage_result(src_dir, result_dir, link_mode="auto", sync_report=None):
+    """
+    生成result目录：未修改的文件通过reflink/硬链接引用src，
+    有同步报告且result已存在时只处理上次生成result之后新增/变更/删除的文件。
+    返回的 stager.placed 为本次放入的相对路径（整体重建时 stager.rebuilt 为 True）
+    """
+    stager = ResultStager(link_mode)
+
+    if sync_report is not None and os.path.isdir(result_dir):
+        for rel_path in sync_report.unstage:
+            stale_file = os.path.join(result_dir, rel_path)
+            if os.path.lexists(stale_file):
+                os.remove(stale_file)
+                remove_empty_parents(os.path.dirname(stale_file), result_dir)
+
+        delta = set(sync_report.restage)
+        for rel_path in sync_report.files:
+            dst_file = os.path.join(result_dir, rel_path)
+            if rel_path in delta or not os.path.lexists(dst_file):
+                os.makedirs(os.path.dirname(dst_file), exist_ok=True)
+                stager.place(os.path.join(src_dir, rel_path), dst_file)
+                stager.placed.add(rel_path)
+        return stager
+
+    if os.path.exists(result_dir):
+        shutil.rmtree(result_dir)
+    stager.rebuilt = True
+    for root, dirs, files in os.walk(src_dir):
+        rel_root = os.path.relpath(root, src_dir)
+        dst_root = result_dir if rel_root == "." else os.path.join(result_dir, rel_root)
+        os.makedirs(dst_root, exist_ok=True)
         for filename in files:
-            if filename == "qet_directory" or filename.lower().endswith(".elmt"):
-                file_count += 1
+            stager.place(os.path.join(root, filename), os.path.join(dst_root, filename))
+    return stager
+
+
+def write_text_replace(path, text):
+    """
+    写入临时文件后替换，result中的硬链接不会把修改写回src
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        _metrics.incr("bytes_written", os.fstat(f.fileno()).st_size)
+    os.replace(tmp_path, path)
+
+
+HEADER_CHUNK_SIZE = 8192
+NAMES_OPEN_BYTES = b"<names>"
+NAMES_CLOSE_BYTES = b"</names>"
+
+
+def read_element_header(path, chunk_size=HEADER_CHUNK_SIZE):
+    """
+    按块读取文件开头直到 </names>，返回 (header_text, tail_offset)；
+    <description>、端子和图元等后续内容不读取也不解码
+    """
+    data = bytearray()
+    open_pos = -1
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            search_from = max(0, len(data) - len(NAMES_CLOSE_BYTES))
+            data += chunk
+            if open_pos == -1:
+                open_pos = data.find(NAMES_OPEN_BYTES, search_from)
+                if open_pos == -1:
+                    continue
+                search_from = open_pos
+            close_pos = data.find(NAMES_CLOSE_BYTES, max(search_from, open_pos))
+            if close_pos != -1:
+                end = close_pos + len(NAMES_CLOSE_BYTES)
+                _metrics.incr("bytes_read", len(data))
+                return data[:end].decode("utf-8"), end
+    _metrics.incr("bytes_read", len(data))
+    return data.decode("utf-8"), len(data)
+
+
+def read_element(path, config):
+    """
+    返回 (text, tail_offset)。header_only_reads 开启时 text 只包含到 </names> 为止的文件头，
+    tail_offset 是其后未读取部分的字节偏移；关闭时按旧方式读取整个文件，tail_offset 为 None
+    """
+    if config.get("header_only_reads", True):
+        return read_element_header(path, int(config.get("header_chunk_size", HEADER_CHUNK_SIZE)))
+    with open(path, "r", encoding="utf-8") as f:
+        _metrics.incr("bytes_read", os.fstat(f.fileno()).st_size)
+        return f.read(), None
+
 
-    print(f"✓ 同步完成！共 {file_count} 个元件文件")
-    return file_count
+def write_element(path, text, tail_offset):
+    """写入新的文件头，并把原文件 tail_offset 之后的字节原样流式复制过去"""
+    with _metrics.timed("write"):
+        if tail_offset is None:
+            write_text_replace(path, text)
+            return
+        tmp_path = f"{path}.tmp"
+        with open(path, "rb") as src, open(tmp_path, "wb") as dst:
+            dst.write(text.encode("utf-8"))
+            src.seek(tail_offset)
+            shutil.copyfileobj(src, dst)
+            _metrics.incr("bytes_written", dst.tell())
+        os.replace(tmp_path, path)
 
 
-def add_path_to_config(qet_path):
+def add_path_to_config(qet_path, config_path=CONFIG_PATH):
     """
     将QElectroTech路径保存到配置文件中，方便下次使用
     """
     try:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+        with open(config_path, "r", encoding="utf-8") as f:
             config = json.load(f)
     except (FileNotFoundError, json.JSONDecodeError):
         config = {}
 
+    if config.get("qet_elements_path") == qet_path:
+        return
     config["qet_elements_path"] = qet_path
 
-    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
+    with open(config_path, "w", encoding="utf-8") as f:
         json.dump(config, f, ensure_ascii=False, indent=2)
 
     print("✓ QElectroTech路径已保存到配置文件")
@@ -184,21 +506,10 @@ def load_config(path):
         return json.load(f)
 
 
-def load_cache(path):
-    if not os.path.exists(path):
-        return {}
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-
-def save_cache(path, cache):
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(cache, f, ensure_ascii=False, indent=2)
-
-
 class CacheSaveState:
-    def __init__(self, cache_path, save_every):
-        self.cache_path = cache_path
+    """每翻译 save_every 条把缓存刷到磁盘（journal 后端为 fsync，json 后端为整份重写）"""
+
+    def __init__(self, save_every):
         self.save_every = int(save_every) if save_every is not None else 0
         self.counter = 0
         self.lock = threading.Lock()
@@ -210,11 +521,7 @@ class CacheSaveState:
             self.counter += 1
             if self.counter % self.save_every != 0:
                 return
-        if cache_lock:
-            with cache_lock:
-                save_cache(self.cache_path, cache)
-        else:
-            save_cache(self.cache_path, cache)
+        cache.flush()
 
 
 def escape_xml(text):
@@ -227,50 +534,415 @@ def escape_xml(text):
     )
 
 
-def extract_source_text(xml_text, config):
-    names_match = re.search(r"<names>.*?</names>", xml_text, re.DOTALL)
-    if not names_match:
+NAMES_OPEN = "<names>"
+NAMES_CLOSE = "</names>"
+_NAME_LANG_RE = re.compile(r'<name\s+lang="([^"]*)">')
+_NAME_INDENT_RE = re.compile(r"\n([ \t]*)<name")
+
+
+@functools.lru_cache(maxsize=None)
+def _name_content_re(lang):
+    return re.compile(rf"<name\s+lang=\"{re.escape(lang)}\">\s*(.*?)\s*</name>", re.DOTALL)
+
+
+class NamesBlock:
+    """
+    <names> 块在原文中的位置和已有语言；所有查找都用预编译正则
+    限定在 [start, end) 范围内进行，不复制块文本
+    """
+
+    __slots__ = ("start", "close_pos", "end", "langs")
+
+    def __init__(self, start, close_pos, end, langs):
+        self.start = start
+        self.close_pos = close_pos
+        self.end = end
+        self.langs = langs
+
+    def has_lang(self, lang):
+        return lang in self.langs
+
+    def source_text(self, xml_text, source_lang_priority):
+        for lang in source_lang_priority:
+            if lang not in self.langs:
+                continue
+            content_match = _name_content_re(lang).search(xml_text, self.start, self.end)
+            if content_match:
+                return content_match.group(1).strip()
         return None
 
-    names_block = names_match.group(0)
-    if re.search(r"<name\s+lang=\"zh\">", names_block):
+    def name_indent(self, xml_text):
+        indent_match = _NAME_INDENT_RE.search(xml_text, self.start, self.end)
+        return indent_match.group(1) if indent_match else "    "
+
+    def closing_indent(self, xml_text):
+        pos = self.close_pos
+        while pos > self.start and xml_text[pos - 1] in " \t":
+            pos -= 1
+        if pos > self.start and xml_text[pos - 1] == "\n":
+            return xml_text[pos : self.close_pos]
+        return ""
+
+
+def scan_names_block(xml_text):
+    start = xml_text.find(NAMES_OPEN)
+    if start == -1:
         return None
+    close_pos = xml_text.find(NAMES_CLOSE, start)
+    if close_pos == -1:
+        return None
+    end = close_pos + len(NAMES_CLOSE)
+    langs = set(_NAME_LANG_RE.findall(xml_text, start, end))
+    return NamesBlock(start, close_pos, end, langs)
 
-    for lang in config.get("source_lang_priority", ["en", "fr"]):
-        lang_match = re.search(
-            rf"<name\s+lang=\"{re.escape(lang)}\">\s*(.*?)\s*</name>",
-            names_block,
-            re.DOTALL,
-        )
-        if lang_match:
-            return lang_match.group(1).strip()
 
-    return None
+def splice_names(xml_text, block, entries):
+    """
+    在 </names> 前按原有缩进依次插入 <name lang="..."> 行，按偏移拼接；
+    entries 为 [(qet_lang, escaped_text), ...]。按字节读取的 CRLF 文件插入 CRLF 换行
+    """
+    newline = "\r\n" if xml_text.find("\r\n", block.start, block.end) != -1 else "\n"
+    name_indent = block.name_indent(xml_text)
+    insertion = "".join(
+        f"{newline}{name_indent}<name lang=\"{lang}\">{translated}</name>" for lang, translated in entries
+    )
+    insertion += f"{newline}{block.closing_indent(xml_text)}"
+    return xml_text[: block.close_pos] + insertion + xml_text[block.close_pos :]
+
+
+def splice_name(xml_text, block, translated, lang="zh"):
+    return splice_names(xml_text, block, [(lang, translated)])
+
+
+# 翻译接口语言代码 -> QET <name lang="..."> 代码；可用 qet_lang_map 覆盖或补充
+QET_LANG_CODES = {
+    "zh-CHS": "zh",
+    "zh-CN": "zh",
+    "zh-Hans": "zh",
+    "pt-BR": "pt_BR",
+}
+
+
+def target_langs(config):
+    """
+    返回 [(to_lang, qet_lang), ...]；to_lang 可以是字符串或列表。
+    两个目标语言对应同一个 QET 代码（如 zh-CHS 和 zh-TW 都是 zh）时抛出 ValueError
+    """
+    to_langs = config.get("to_lang", "zh-CHS")
+    if isinstance(to_langs, str):
+        to_langs = [to_langs]
+    lang_map = dict(QET_LANG_CODES)
+    lang_map.update(config.get("qet_lang_map", {}))
+    pairs = [(lang, lang_map.get(lang) or lang.split("-")[0].lower()) for lang in to_langs]
+    seen = {}
+    for lang, qet_lang in pairs:
+        if qet_lang in seen:
+            raise ValueError(
+                f"to_lang {seen[qet_lang]} and {lang} both map to QET lang code '{qet_lang}'; "
+                f"set distinct codes for them in qet_lang_map"
+            )
+        seen[qet_lang] = lang
+    return pairs
+
+
+def primary_lang(config):
+    return target_langs(config)[0][0]
+
+
+def missing_target_langs(block, config):
+    return [lang for lang, qet_lang in target_langs(config) if not block.has_lang(qet_lang)]
+
+
+def extract_missing(xml_text, config):
+    """返回 (source_text, 缺失的目标语言列表)；无需处理时返回 (None, [])"""
+    block = scan_names_block(xml_text)
+    if block is None:
+        return None, []
+    missing = missing_target_langs(block, config)
+    if not missing:
+        return None, []
+    source_text = block.source_text(xml_text, config.get("source_lang_priority", ["en", "fr"]))
+    if not source_text:
+        return None, []
+    return source_text, missing
+
+
+def extract_source_text(xml_text, config):
+    return extract_missing(xml_text, config)[0]
 
 
 def insert_zh_name_with_translation(xml_text, translated):
-    names_match = re.search(r"<names>.*?</names>", xml_text, re.DOTALL)
-    if not names_match:
+    block = scan_names_block(xml_text)
+    if block is None or block.has_lang("zh"):
         return xml_text, False
+    return splice_name(xml_text, block, translated), True
+
 
-    names_block = names_match.group(0)
-    if re.search(r"<name\s+lang=\"zh\">", names_block):
+def insert_names_with_translations(xml_text, config, translations):
+    """translations: {to_lang: 未转义译文}，只插入文件中缺失的语言"""
+    block = scan_names_block(xml_text)
+    if block is None:
         return xml_text, False
+    entries = []
+    for lang, qet_lang in target_langs(config):
+        if block.has_lang(qet_lang) or not translations.get(lang):
+            continue
+        entries.append((qet_lang, escape_xml(translations[lang])))
+    if not entries:
+        return xml_text, False
+    return splice_names(xml_text, block, entries), True
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client(config):
+    """所有翻译请求共用一个带连接池的 HTTP 客户端"""
+    from http_client import HttpClient
+
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            pool_size = config.get("http_pool_size") or max(4, int(config.get("max_workers", 0) or 0))
+            _http_client = HttpClient(pool_size, config.get("timeout_seconds", 20))
+        return _http_client
+
+
+_rate_limiters = {}
+
+
+def get_rate_limiter(config):
+    """
+    所有工作线程共用的限流器，每个翻译后端（provider_name）一个；未配置 requests_per_second 时
+    按旧的 sleep_seconds 换算（每个线程每 sleep_seconds 秒一个请求）
+    """
+    from rate_limit import RateLimiter
+
+    key = config.get("provider_name", "")
+    with _http_client_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            workers = max(1, int(config.get("max_workers", 0) or 0))
+            requests_per_second = config.get("requests_per_second")
+            if requests_per_second is None:
+                sleep_seconds = float(config.get("sleep_seconds", 0) or 0)
+                requests_per_second = workers / sleep_seconds if sleep_seconds > 0 else 0
+            limiter = _rate_limiters[key] = RateLimiter(
+                requests_per_second,
+                config.get("tokens_per_minute", 0),
+                config.get("max_concurrency") or workers,
+                config.get("min_concurrency", 1),
+            )
+        return limiter
+
+
+_providers = None
+
+
+def get_providers(config):
+    """翻译后端注册表（providers 配置），未配置时只有顶层配置这一个后端，见 providers.py"""
+    from providers import build_registry
+
+    global _providers
+    with _http_client_lock:
+        if _providers is None:
+            _providers = build_registry(config, is_provider_failure, thread_service_time)
+        return _providers
+
+
+# 每个线程累计的请求耗时（不含限流排队），供对冲延迟统计
+_request_timing = threading.local()
+
+
+def thread_service_time():
+    return getattr(_request_timing, "total", 0.0)
+
+
+def is_provider_failure(error):
+    """
+    后端不可用（超时、连接错误、重试后仍然 429/5xx）时换下一个后端；
+    响应内容有问题（格式错误、4xx）时不切换，交给拆分重试处理
+    """
+    import http.client
+    from http_client import HTTPStatusError
+
+    while error is not None:
+        if isinstance(error, HTTPStatusError):
+            return error.code == 429 or error.code >= 500
+        if isinstance(error, TranslationRequestError) and error.code is not None:
+            return error.code == 429 or error.code >= 500
+        if isinstance(error, (OSError, http.client.HTTPException)):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+# 每个目标语言的翻译记忆，translate_tree 开始时由缓存构建，见 translation_memory.py
+_memories = {}
+
+
+def reuse_from_memory(text, config, to_lang):
+    """
+    翻译记忆中可复用的译文：规范化后完全相同的条目总会复用，
+    近似条目只在 tm_fuzzy_mode=reuse 时复用；没有时返回 None
+    """
+    memory = _memories.get(to_lang)
+    if memory is None:
+        return None
+    if config.get("tm_fuzzy_mode", "off") == "reuse":
+        translated, match = memory.reusable(text)
+    else:
+        translated, match = memory.exact(text), "exact"
+    if not translated:
+        return None
+    _metrics.incr(f"tm_{match}")
+    _metrics.incr("api_calls_saved")
+    return translated
+
+
+# 用户术语表（glossary_file），translate_tree 开始时加载，见 glossary.py
+_glossary = None
+
+
+def load_configured_glossary(config, persist=True):
+    path = config.get("glossary_file", "glossary.json")
+    if not path or not os.path.exists(path):
+        return None
+    glossary = load_glossary(path, primary_lang(config), persist)
+    print(f"✓ Glossary: {len(glossary)} terms ({path})")
+    return glossary
+
+
+def local_translation(text, config, to_lang):
+    """
+    不联网的译文：整条文本都由术语表覆盖时在本地拼出，其次查翻译记忆；都没有时返回 None
+    """
+    if _glossary is not None:
+        translated = _glossary.translate(text, to_lang)
+        if translated:
+            _metrics.incr("glossary_local")
+            _metrics.incr("api_calls_saved")
+            return translated
+    return reuse_from_memory(text, config, to_lang)
+
+
+def glossary_terms(texts, to_langs):
+    """部分被术语表覆盖的文本：{to_lang: {术语: 译文}}，固定到提示词中"""
+    if _glossary is None:
+        return {}
+    pinned = {}
+    for lang in to_langs:
+        terms = {}
+        for text in texts:
+            terms.update(_glossary.pinned_terms(text, lang))
+        if terms:
+            pinned[lang] = terms
+    if pinned:
+        _metrics.incr("glossary_pinned")
+    return pinned
+
+
+def remember(to_lang, text, translated):
+    memory = _memories.get(to_lang)
+    if memory is not None:
+        memory.add(text, translated)
+
+
+def memory_examples(texts, config, to_langs):
+    """
+    tm_fuzzy_mode=context 时为每条文本找近似的已有译文，作为 few-shot 参考：
+    返回 {to_lang: [[原文, 译文], ...]}
+    """
+    if config.get("tm_fuzzy_mode", "off") != "context":
+        return {}
+    limit = int(config.get("tm_context_examples", 3) or 0)
+    threshold = float(config.get("tm_context_threshold", 0.6))
+    examples = {}
+    for lang in to_langs:
+        memory = _memories.get(lang)
+        if memory is None or limit <= 0:
+            continue
+        found = {}
+        for text in texts:
+            for _, source, translated in memory.similar(text, limit, threshold):
+                found.setdefault(source, translated)
+        if found:
+            examples[lang] = [[source, translated] for source, translated in found.items()]
+            _metrics.incr("tm_context", len(found))
+    return examples
+
+
+def estimate_tokens(text):
+    # 粗略估计：英文约4字符/token，中文约1字符/token，取中间值
+    return max(1, len(text) // 3)
+
 
-    indent_match = re.search(r"\n([ \t]*)<name", names_block)
-    name_indent = indent_match.group(1) if indent_match else "    "
-    closing_indent_match = re.search(r"\n([ \t]*)</names>", names_block)
-    closing_indent = closing_indent_match.group(1) if closing_indent_match else ""
+def estimate_request_tokens(payload):
+    prompt = "".join(message["content"] for message in payload.get("messages", []))
+    # 输出长度与输入相当，一起计入 tokens_per_minute
+    return estimate_tokens(prompt) * 2
 
-    new_block = re.sub(
-        r"</names>",
-        f"\n{name_indent}<name lang=\"zh\">{translated}</name>\n{closing_indent}</names>",
-        names_block,
-        count=1,
+
+def post_json(config, url, payload, headers=None, tokens=0):
+    return send_request(
+        config, lambda client, timeout: client.post_json(url, payload, headers, timeout), tokens
     )
 
-    new_text = xml_text.replace(names_block, new_block, 1)
-    return new_text, True
+
+def send_request(config, send, tokens=0):
+    """
+    经限流器发送请求，send(client, timeout) 完成一次请求并返回结果；
+    429/5xx 时降低并发、遵守 Retry-After 并重试
+    """
+    from http_client import HTTPStatusError
+    from rate_limit import parse_retry_after
+
+    limiter = get_rate_limiter(config)
+    client = get_http_client(config)
+    max_retries = int(config.get("max_retries", 3))
+    attempt = 0
+    while True:
+        limiter.acquire(tokens)
+        _metrics.incr("api_requests")
+        start = time.perf_counter()
+        try:
+            result = send(client, config.get("timeout_seconds", 20))
+        except HTTPStatusError as e:
+            _request_timing.total = thread_service_time() + time.perf_counter() - start
+            _metrics.observe_latency(time.perf_counter() - start)
+            _metrics.incr("api_throttled" if e.code == 429 else "api_errors")
+            retryable = e.code == 429 or e.code >= 500
+            will_retry = retryable and attempt < max_retries
+            retry_after = parse_retry_after(e.headers) if retryable else None
+            if will_retry and retry_after is None:
+                # 不再重试时不设退避暂停，否则排队的线程要白等，也拖慢换后端
+                retry_after = min(2 ** attempt, 30)
+            limiter.release(throttled=retryable, retry_after=retry_after)
+            if not will_retry:
+                raise
+            attempt += 1
+            _metrics.incr("retries")
+            print(f"\n  HTTP {e.code}, retry {attempt}/{max_retries} in {retry_after:.1f}s")
+            continue
+        except BaseException:
+            _metrics.incr("api_errors")
+            limiter.release()
+            raise
+        _request_timing.total = thread_service_time() + time.perf_counter() - start
+        _metrics.observe_latency(time.perf_counter() - start)
+        limiter.release()
+        return result
+
+
+class TranslationResponseError(RuntimeError):
+    """响应格式不对（不是 JSON 数组、条数不一致等），拆小批次重试通常能解决"""
+
+
+class TranslationRequestError(RuntimeError):
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
 
 
 def parse_json_array(text):
@@ -284,165 +956,512 @@ def parse_json_array(text):
     start = text.find("[")
     end = text.rfind("]")
     if start == -1 or end == -1 or end <= start:
-        raise RuntimeError("OpenAI response is not a JSON array")
+        raise TranslationResponseError("OpenAI response is not a JSON array")
 
     try:
         parsed = json.loads(text[start : end + 1])
     except json.JSONDecodeError as e:
-        raise RuntimeError(f"Failed to parse OpenAI JSON array: {e}")
+        raise TranslationResponseError(f"Failed to parse OpenAI JSON array: {e}")
 
     if not isinstance(parsed, list):
-        raise RuntimeError("OpenAI response JSON is not an array")
+        raise TranslationResponseError("OpenAI response JSON is not an array")
     return parsed
 
 
-def translate_texts_openai(texts, config):
+class JsonArrayStream:
+    """
+    增量解析模型输出的 JSON 数组：feed() 传入片段，返回其中已完整的元素；
+    数组之前的 ```json 等前缀被忽略
+    """
+
+    def __init__(self):
+        self.started = False
+        self.closed = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._element = []
+        self.count = 0
+
+    def feed(self, chunk):
+        items = []
+        for ch in chunk:
+            if self.closed:
+                break
+            if not self.started:
+                self.started = ch == "["
+                continue
+            if self._in_string:
+                self._element.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if self._depth == 0 and ch in ",]":
+                element = "".join(self._element).strip()
+                self._element = []
+                if element:
+                    items.append(self._parse(element))
+                    self.count += 1
+                elif ch == "," or self.count:
+                    raise TranslationResponseError("Empty element in OpenAI JSON array")
+                self.closed = ch == "]"
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+            self._element.append(ch)
+        return items
+
+    @staticmethod
+    def _parse(element):
+        try:
+            return json.loads(element)
+        except json.JSONDecodeError as e:
+            raise TranslationResponseError(f"Failed to parse OpenAI JSON array element: {e}")
+
+    def finish(self):
+        if not self.closed:
+            raise TranslationResponseError("OpenAI response ended before the JSON array was complete")
+
+
+def openai_batch_request(texts, config, to_langs):
+    """返回批量翻译请求的 (url, payload, headers)"""
     api_key = config.get("openai_api_key")
     if not api_key:
         raise RuntimeError("Missing openai_api_key in translate_config.json")
 
     base_url = config.get("openai_base_url", "https://api.openai.com/v1").rstrip("/")
-    model = config.get("openai_model", "gpt-5.2")
-    to_lang = config.get("to_lang", "zh-CHS")
+    payload = openai_batch_payload(texts, config, to_langs)
+    return f"{base_url}/chat/completions", payload, {"Authorization": f"Bearer {api_key}"}
+
+
+def openai_batch_payload(texts, config, to_langs):
+    """批量翻译的请求体（plan 也用它估算 token）"""
+    model = config.get("openai_model", DEFAULT_OPENAI_MODEL)
+    to_langs = to_langs or [primary_lang(config)]
 
     prompt_payload = json.dumps(texts, ensure_ascii=False)
+    if len(to_langs) == 1:
+        system_prompt = (
+            "Translate each item to the target language.These items are all related to industry. "
+            "Return ONLY a JSON array of translated strings in the same order."
+        )
+        user_prompt = f"Target language: {to_langs[0]}"
+    else:
+        system_prompt = (
+            "Translate each item into every target language. These items are all related to industry. "
+            "Return ONLY a JSON array with one object per item in the same order; "
+            "each object maps every target language code to the translated string."
+        )
+        user_prompt = f"Target languages: {json.dumps(to_langs, ensure_ascii=False)}"
+    examples = memory_examples(texts, config, to_langs)
+    if examples:
+        system_prompt += " Keep terminology consistent with the reference translations."
+        user_prompt += f"\nReference translations: {json.dumps(examples, ensure_ascii=False)}"
+    terms = glossary_terms(texts, to_langs)
+    if terms:
+        system_prompt += " Always translate the glossary terms exactly as given."
+        user_prompt += f"\nGlossary: {json.dumps(terms, ensure_ascii=False)}"
+    user_prompt += f"\nItems: {prompt_payload}"
+
     payload = {
         "model": model,
         "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "Translate each item to the target language.These items are all related to industry. "
-                    "Return ONLY a JSON array of translated strings in the same order."
-                ),
-            },
-            {
-                "role": "user",
-                "content": f"Target language: {to_lang}\nItems: {prompt_payload}",
-            },
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
         ],
         "temperature": 0,
     }
+    return payload
+
+
+def batch_item_translations(item, to_langs):
+    """JSON 数组中的一个元素 -> {to_lang: 译文}"""
+    if len(to_langs) == 1:
+        return {to_langs[0]: str(item).strip()}
+    if not isinstance(item, dict) or any(lang not in item for lang in to_langs):
+        raise TranslationResponseError("OpenAI response is missing target languages")
+    return {lang: str(item[lang]).strip() for lang in to_langs}
 
-    data = json.dumps(payload).encode("utf-8")
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}",
-    }
-    request = urllib.request.Request(
-        f"{base_url}/chat/completions",
-        data=data,
-        headers=headers,
-        method="POST",
-    )
 
+def translate_texts_openai(texts, config, to_langs=None):
+    """
+    批量翻译，返回 {to_lang: [译文, ...]}；多个目标语言时一次请求返回全部语言
+    """
+    from http_client import HTTPStatusError
+
+    to_langs = to_langs or [primary_lang(config)]
+    url, payload, headers = openai_batch_request(texts, config, to_langs)
     try:
-        with urllib.request.urlopen(request, timeout=config.get("timeout_seconds", 20)) as response:
-            body = response.read().decode("utf-8")
-            result = json.loads(body)
-    except urllib.error.HTTPError as e:
-        error_body = e.read().decode("utf-8")
-        print(f"OpenAI Error {e.code}: {error_body}")
-        raise RuntimeError(f"OpenAI translation failed: {error_body}")
+        result = post_json(config, url, payload, headers, tokens=estimate_request_tokens(payload))
+    except HTTPStatusError as e:
+        print(f"OpenAI Error {e.code}: {e.body}")
+        raise TranslationRequestError(f"OpenAI translation failed: {e.body}", e.code)
 
     choices = result.get("choices", [])
     if not choices:
-        raise RuntimeError("Empty OpenAI response")
+        raise TranslationResponseError("Empty OpenAI response")
 
     content = choices[0].get("message", {}).get("content", "")
     translations = parse_json_array(content)
     if len(translations) != len(texts):
-        raise RuntimeError("OpenAI response size mismatch")
+        raise TranslationResponseError("OpenAI response size mismatch")
 
-    time.sleep(config.get("sleep_seconds", 0))
-    return [str(item).strip() for item in translations]
+    by_lang = {lang: [] for lang in to_langs}
+    for item in translations:
+        for lang, translated in batch_item_translations(item, to_langs).items():
+            by_lang[lang].append(translated)
+    return by_lang
 
 
-def translate_text_openai(text, config):
-    api_key = config.get("openai_api_key")
-    if not api_key:
-        raise RuntimeError("Missing openai_api_key in translate_config.json")
+def stream_texts_openai(texts, config, to_langs, on_item):
+    """
+    流式批量翻译（openai_stream=true）：按 server-sent events 读取增量输出，
+    数组中每个元素一完整就回调 on_item(序号, {to_lang: 译文})。
+    中途超时或出错时已回调的元素保持有效，由调用方只重试剩下的文本
+    """
+    from http_client import HTTPStatusError
+
+    url, payload, headers = openai_batch_request(texts, config, to_langs)
+    payload["stream"] = True
+
+    def receive(client, timeout):
+        parser = JsonArrayStream()
+        received = 0
+        with client.post_stream(url, payload, headers, timeout) as stream:
+            if "text/event-stream" in stream.getheader("Content-Type", ""):
+                fragments = sse_content(stream)
+            else:
+                # 接口不支持流式时返回普通的 JSON 响应
+                body = json.loads(b"\n".join(stream).decode("utf-8"))
+                choices = body.get("choices") or [{}]
+                fragments = [choices[0].get("message", {}).get("content", "")]
+            for fragment in fragments:
+                for item in parser.feed(fragment):
+                    if received >= len(texts):
+                        raise TranslationResponseError("OpenAI response size mismatch")
+                    on_item(received, batch_item_translations(item, to_langs))
+                    received += 1
+                    _metrics.incr("stream_items")
+        parser.finish()
+        if received != len(texts):
+            raise TranslationResponseError("OpenAI response size mismatch")
 
-    base_url = config.get("openai_base_url", "https://api.openai.com/v1").rstrip("/")
-    model = config.get("openai_model", "gpt-5.2")
-    to_lang = config.get("to_lang", "zh-CHS")
+    try:
+        send_request(config, receive, tokens=estimate_request_tokens(payload))
+    except HTTPStatusError as e:
+        print(f"OpenAI Error {e.code}: {e.body}")
+        raise TranslationRequestError(f"OpenAI translation failed: {e.body}", e.code)
 
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": f"Translate the user text to {to_lang}. Return only the translated text."},
-            {"role": "user", "content": text},
-        ],
-        "temperature": 0,
-    }
 
-    data = json.dumps(payload).encode("utf-8")
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}",
-    }
-    request = urllib.request.Request(
-        f"{base_url}/chat/completions",
-        data=data,
-        headers=headers,
-        method="POST",
-    )
+def sse_content(stream):
+    """从 chat completions 的事件流中逐个取出 delta.content"""
+    for line in stream:
+        if not line.startswith(b"data:"):
+            continue
+        data = line[5:].strip()
+        if data == b"[DONE]":
+            # 继续读到结尾，连接才能放回连接池
+            continue
+        try:
+            event = json.loads(data.decode("utf-8"))
+        except ValueError as e:
+            raise TranslationResponseError(f"Invalid OpenAI stream event: {e}")
+        choices = event.get("choices") or [{}]
+        content = (choices[0].get("delta") or {}).get("content")
+        if content:
+            yield content
 
-    try:
-        with urllib.request.urlopen(request, timeout=config.get("timeout_seconds", 20)) as response:
-            body = response.read().decode("utf-8")
-            result = json.loads(body)
-    except urllib.error.HTTPError as e:
-        error_body = e.read().decode("utf-8")
-        print(f"OpenAI Error {e.code}: {error_body}")
-        raise RuntimeError(f"OpenAI translation failed for '{text}': {error_body}")
 
-    choices = result.get("choices", [])
-    if not choices:
-        raise RuntimeError(f"Empty OpenAI response for: {text}")
+# 这些 HTTP 状态通常与批次内容或大小有关，拆小后可能成功
+BISECT_HTTP_CODES = (400, 413, 422)
 
-    translated = choices[0].get("message", {}).get("content", "").strip()
-    if not translated:
-        raise RuntimeError(f"Empty translation for: {text}")
 
-    time.sleep(config.get("sleep_seconds", 0))
-    return translated
+def is_bisectable_error(error):
+    if isinstance(error, TranslationResponseError):
+        return True
+    if isinstance(error, TranslationRequestError):
+        return error.code in BISECT_HTTP_CODES
+    return isinstance(error, (TimeoutError, socket.timeout))
 
 
-def translate_text(text, config, cache, cache_lock=None, save_state=None):
-    # Thread-safe cache read
-    if cache_lock:
+def translate_texts_bisect(texts, config, to_langs, failures, on_item=None):
+    """
+    批量翻译；失败时对半拆分递归重试直到单条，只有出错的文本被跳过。
+    返回 {to_lang: [译文或 None, ...]}，失败的文本记录到 failures；
+    每条译文得到后回调 on_item(原文, {to_lang: 译文})。
+    流式模式下请求中途中断时，已收到的译文照常回调，只重新排队尚未收到的文本
+    """
+    results = {lang: [None] * len(texts) for lang in to_langs}
+    received = set()
+
+    def emit(index, translations):
+        for lang in to_langs:
+            results[lang][index] = translations[lang]
+        received.add(index)
+        if on_item:
+            on_item(texts[index], translations)
+
+    def stream_remaining(provider):
+        # 换到下一个后端时只请求尚未收到的文本
+        part = [index for index in range(len(texts)) if index not in received]
+        stream_texts_openai(
+            [texts[index] for index in part],
+            provider.config,
+            to_langs,
+            lambda position, translations: emit(part[position], translations),
+        )
+
+    registry = get_providers(config)
+    try:
+        if config.get("openai_stream", False):
+            registry.call(stream_remaining, op="stream", kinds=("openai",), hedge=False)
+        else:
+            batch = registry.call(
+                lambda provider: translate_texts_openai(texts, provider.config, to_langs),
+                op="batch",
+                kinds=("openai",),
+            )
+            for index in range(len(texts)):
+                emit(index, {lang: batch[lang][index] for lang in to_langs})
+        return results
+    except Exception as e:
+        if not is_bisectable_error(e):
+            raise
+        error = e
+
+    remaining = [index for index in range(len(texts)) if index not in received]
+    if received:
+        print(f"\n  Stream interrupted after {len(received)}/{len(texts)} items ({error}), re-queueing {len(remaining)}")
+        _metrics.incr("stream_requeued", len(remaining))
+        parts = [remaining]
+    elif len(texts) == 1:
+        failures.append((texts[0], to_langs, str(error)))
+        return results
+    else:
+        middle = len(texts) // 2
+        print(f"\n  Batch of {len(texts)} failed ({error}), splitting into {middle} + {len(texts) - middle}")
+        parts = [remaining[:middle], remaining[middle:]]
+
+    for part in parts:
+        retried = translate_texts_bisect([texts[index] for index in part], config, to_langs, failures, on_item)
+        for lang in to_langs:
+            for index, translated in zip(part, retried[lang]):
+                results[lang][index] = translated
+    return results
+
+
+def log_failed_texts(config, failures):
+    """失败的文本追加到 failed_log_file，下次运行时仍会重新翻译"""
+    path = config.get("failed_log_file", "translate_failed.jsonl")
+    if not failures or not path:
+        return
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with open(path, "a", encoding="utf-8") as f:
+        for text, to_langs, error in failures:
+            record = {"time": timestamp, "to_lang": to_langs, "text": text, "error": error}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+class BatchPacker:
+    """
+    按条数上限 openai_batch_size 和估算 token 预算 openai_batch_tokens 组批；
+    每条文本的开销按原文 token 数 ×（1 + 目标语言数）估算
+    """
+
+    def __init__(self, config, lang_count=1):
+        self.max_items = max(1, int(config.get("openai_batch_size", 1) or 1))
+        self.token_budget = int(config.get("openai_batch_tokens", 2000) or 0)
+        self.lang_count = max(1, lang_count)
+        self.items = []
+        self.tokens = 0
+
+    def cost(self, text):
+        return estimate_tokens(text) * (1 + self.lang_count)
+
+    def add(self, text):
+        """加入一条文本，返回因此凑满的批次列表（可能为空）"""
+        ready = []
+        cost = self.cost(text)
+        if self.items and self.token_budget > 0 and self.tokens + cost > self.token_budget:
+            ready.append(self.flush())
+        self.items.append(text)
+        self.tokens += cost
+        if len(self.items) >= self.max_items:
+            ready.append(self.flush())
+        return ready
+
+    def flush(self):
+        batch, self.items, self.tokens = self.items, [], 0
+        return batch
+
+
+def openai_text_payload(text, config, to_lang):
+    """逐条翻译的请求体"""
+    system_prompt = f"Translate the user text to {to_lang}. Return only the translated text."
+    examples = memory_examples([text], config, [to_lang])
+    if examples:
+        system_prompt += (
+            " Keep terminology consistent with these reference translations: "
+            f"{json.dumps(examples[to_lang], ensure_ascii=False)}"
+        )
+    terms = glossary_terms([text], [to_lang])
+    if terms:
+        system_prompt += (
+            " Always translate these glossary terms exactly as given: "
+            f"{json.dumps(terms[to_lang], ensure_ascii=False)}"
+        )
+
+    return {
+        "model": config.get("openai_model", DEFAULT_OPENAI_MODEL),
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": text},
+        ],
+        "temperature": 0,
+    }
+
+
+def translate_text_openai(text, config, to_lang=None):
+    from http_client import HTTPStatusError
+
+    api_key = config.get("openai_api_key")
+    if not api_key:
+        raise RuntimeError("Missing openai_api_key in translate_config.json")
+
+    base_url = config.get("openai_base_url", "https://api.openai.com/v1").rstrip("/")
+    payload = openai_text_payload(text, config, to_lang or primary_lang(config))
+
+    headers = {"Authorization": f"Bearer {api_key}"}
+    try:
+        result = post_json(
+            config,
+            f"{base_url}/chat/completions",
+            payload,
+            headers,
+            tokens=estimate_request_tokens(payload),
+        )
+    except HTTPStatusError as e:
+        print(f"OpenAI Error {e.code}: {e.body}")
+        raise RuntimeError(f"OpenAI translation failed for '{text}': {e.body}")
+
+    choices = result.get("choices", [])
+    if not choices:
+        raise RuntimeError(f"Empty OpenAI response for: {text}")
+
+    translated = choices[0].get("message", {}).get("content", "").strip()
+    if not translated:
+        raise RuntimeError(f"Empty translation for: {text}")
+
+    return translated
+
+
+class SingleFlight:
+    """同一个键同时只执行一次，并发的调用者共享这次调用的结果或异常"""
+
+    class _Call:
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+
+_single_flight = SingleFlight()
+
+
+def translate_text(text, config, cache, cache_lock=None, save_state=None, to_lang=None):
+    """cache 为 to_lang 对应的缓存"""
+    to_lang = to_lang or primary_lang(config)
+    # Thread-safe cache read
+    if cache_lock:
         with cache_lock:
             if text in cache:
+                _metrics.incr("cache_hits")
                 return cache[text]
     else:
         if text in cache:
+            _metrics.incr("cache_hits")
             return cache[text]
 
-    mode = config.get("translate_mode", "api").lower()
-    if mode == "openai":
-        translated = translate_text_openai(text, config)
-    else:
-        payload = {
-            "ToLang": config["to_lang"],
-            "text": text,
-        }
-        data = json.dumps(payload).encode("utf-8")
-        headers = config.get("headers", {})
-        request = urllib.request.Request(config["endpoint"], data=data, headers=headers, method="POST")
+    _metrics.incr("cache_misses")
+    # 多个线程同时未命中同一文本时只发一次请求，其余线程等待结果
+    return _single_flight.do(
+        (to_lang, text),
+        lambda: _translate_uncached(text, config, cache, cache_lock, save_state, to_lang),
+    )
 
-        try:
-            with urllib.request.urlopen(request, timeout=config.get("timeout_seconds", 20)) as response:
-                body = response.read().decode("utf-8")
-                result = json.loads(body)
-        except urllib.error.HTTPError as e:
-            error_body = e.read().decode("utf-8")
-            print(f"API Error {e.code}: {error_body}")
-            raise RuntimeError(f"Translation API failed for '{text}': {error_body}")
-
-        translated = result.get("translate", "").strip()
-        if not translated:
-            raise RuntimeError(f"Empty translation for: {text}")
+
+def translate_with_provider(text, config, to_lang):
+    """用一个后端（providers 中的一项或顶层配置）翻译单条文本"""
+    from http_client import HTTPStatusError
+
+    if config.get("translate_mode", "api").lower() == "openai":
+        return translate_text_openai(text, config, to_lang)
+
+    payload = {
+        "ToLang": to_lang,
+        "text": text,
+    }
+    try:
+        result = post_json(config, config["endpoint"], payload, config.get("headers", {}))
+    except HTTPStatusError as e:
+        print(f"API Error {e.code}: {e.body}")
+        raise RuntimeError(f"Translation API failed for '{text}': {e.body}")
+
+    translated = result.get("translate", "").strip()
+    if not translated:
+        raise RuntimeError(f"Empty translation for: {text}")
+    return translated
+
+
+def _translate_uncached(text, config, cache, cache_lock, save_state, to_lang):
+    if cache_lock:
+        with cache_lock:
+            if text in cache:
+                return cache[text]
+    elif text in cache:
+        return cache[text]
+
+    translated = local_translation(text, config, to_lang)
+    if translated is None:
+        translated = get_providers(config).call(
+            lambda provider: translate_with_provider(text, provider.config, to_lang)
+        )
 
     # Thread-safe cache write
     if cache_lock:
@@ -450,66 +1469,42 @@ def translate_text(text, config, cache, cache_lock=None, save_state=None):
             cache[text] = translated
     else:
         cache[text] = translated
+    remember(to_lang, text, translated)
 
     if save_state:
         save_state.maybe_save(cache, cache_lock)
 
-    time.sleep(config.get("sleep_seconds", 0))
     return translated
 
 
-def insert_zh_name(xml_text, config, cache, cache_lock=None, save_state=None):
-    names_match = re.search(r"<names>.*?</names>", xml_text, re.DOTALL)
-    if not names_match:
+def insert_translated_names(xml_text, config, caches, cache_lock=None, save_state=None):
+    """为文件中缺失的每个目标语言翻译并插入 <name>，一次写入"""
+    block = scan_names_block(xml_text)
+    if block is None:
         return xml_text, False
-
-    names_block = names_match.group(0)
-    if re.search(r"<name\s+lang=\"zh\">", names_block):
+    missing = missing_target_langs(block, config)
+    if not missing:
         return xml_text, False
 
-    source_text = None
-    for lang in config.get("source_lang_priority", ["en", "fr"]):
-        lang_match = re.search(
-            rf"<name\s+lang=\"{re.escape(lang)}\">\s*(.*?)\s*</name>",
-            names_block,
-            re.DOTALL,
-        )
-        if lang_match:
-            source_text = lang_match.group(1).strip()
-            break
-
+    source_text = block.source_text(xml_text, config.get("source_lang_priority", ["en", "fr"]))
     if not source_text:
         return xml_text, False
 
-    translated = translate_text(source_text, config, cache, cache_lock, save_state)
-    translated = escape_xml(translated)
-
-    indent_match = re.search(r"\n([ \t]*)<name", names_block)
-    name_indent = indent_match.group(1) if indent_match else "    "
-    closing_indent_match = re.search(r"\n([ \t]*)</names>", names_block)
-    closing_indent = closing_indent_match.group(1) if closing_indent_match else ""
-
-    new_block = re.sub(
-        r"</names>",
-        f"\n{name_indent}<name lang=\"zh\">{translated}</name>\n{closing_indent}</names>",
-        names_block,
-        count=1,
-    )
-
-    new_text = xml_text.replace(names_block, new_block, 1)
-    return new_text, True
+    translations = {
+        lang: translate_text(source_text, config, caches[lang], cache_lock, save_state, lang)
+        for lang in missing
+    }
+    return insert_names_with_translations(xml_text, config, translations)
 
 
-def process_file(path, config, cache, save_state=None):
-    with open(path, "r", encoding="utf-8") as f:
-        original = f.read()
+def process_file(path, config, caches, save_state=None):
+    original, tail_offset = read_element(path, config)
 
-    updated, changed = insert_zh_name(original, config, cache, save_state=save_state)
+    updated, changed = insert_translated_names(original, config, caches, save_state=save_state)
     if not changed:
         return False
 
-    with open(path, "w", encoding="utf-8") as f:
-        f.write(updated)
+    write_element(path, updated, tail_offset)
     return True
 
 
@@ -530,164 +1525,995 @@ def print_progress(current, total, updated, start_time):
     print(f"\r[{bar}] {percentage:.1f}% ({current}/{total}) Updated: {updated} | Speed: {rate:.1f} files/s | ETA: {remaining:.0f}s", end="", flush=True)
 
 
-def process_file_wrapper(file_path, config, cache, cache_lock, save_state):
+class ProgressPrinter:
+    """进度条限频：两次刷新至少间隔 interval 秒，最后一个文件总会刷新"""
+
+    def __init__(self, interval=0.2):
+        self.interval = float(interval or 0)
+        self._last = 0.0
+
+    def update(self, current, total, updated, start_time):
+        now = time.monotonic()
+        if current < total and now - self._last < self.interval:
+            return
+        self._last = now
+        print_progress(current, total, updated, start_time)
+
+
+def process_file_wrapper(file_path, config, caches, cache_lock, save_state):
     """Wrapper for parallel processing with thread-safe cache access"""
-    with open(file_path, "r", encoding="utf-8") as f:
-        original = f.read()
+    original, tail_offset = read_element(file_path, config)
 
-    updated, changed = insert_zh_name(original, config, cache, cache_lock, save_state)
+    updated, changed = insert_translated_names(original, config, caches, cache_lock, save_state)
     if not changed:
         return False
 
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(updated)
+    write_element(file_path, updated, tail_offset)
     return True
 
 
-def main():
-    print("="*60)
-    print(f"QET Directory & Element Translator")
-    print(f"Start time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print("="*60)
+def collect_missing_texts(file_paths, config, caches):
+    """
+    扫描文件取出待翻译的源文本，返回 (file_texts, missing)；
+    missing 为去重后、缓存中没有的 (to_lang, text)
+    """
+    file_texts = []
+    missing = []
+    seen = set()
+
+    for file_path in file_paths:
+        header, _ = read_element(file_path, config)
+        source_text, langs = extract_missing(header, config)
+        if not source_text:
+            continue
+        file_texts.append((file_path, source_text))
+        for lang in langs:
+            key = (lang, source_text)
+            if source_text in caches[lang] or key in seen:
+                continue
+            seen.add(key)
+            missing.append(key)
+
+    return file_texts, missing
+
+
+def translate_unique_texts(missing, config, caches, cache_lock, save_state, workers):
+    if not missing:
+        return
+    print(f"  Translating {len(missing)} unique texts with {workers} workers...")
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(translate_text, text, config, caches[lang], cache_lock, save_state, lang)
+            for lang, text in missing
+        ]
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                print(f"\nError translating text: {e}")
+    print(f"  ✓ Translated {len(missing) - failed}/{len(missing)} unique texts")
+
+
+class PipelineProgress:
+    def __init__(self, total, start_time, printer=None):
+        self.total = total
+        self.start_time = start_time
+        self.printer = printer or ProgressPrinter(0)
+        self.processed = 0
+        self.updated = 0
+        self.lock = threading.Lock()
+
+    def done(self, updated=False):
+        with self.lock:
+            self.processed += 1
+            if updated:
+                self.updated += 1
+            self.printer.update(self.processed, self.total, self.updated, self.start_time)
+
+
+def run_batch_pipeline(file_paths, config, caches, workers, progress):
+    """
+    扫描 → 批量翻译 → 写入 的流式流水线（OpenAI 批量模式）
+
+    - 每个文件只读取一次（默认只读到 </names>）；缓存命中的文件立即写入
+    - 未命中的文本按条数/token 预算组批后交给线程池翻译，文件头暂存到翻译完成
+    - 批次失败时对半拆分重试，只跳过出错的文本并记录到 failed_log_file
+    - 多个目标语言在同一个请求中翻译，文件一次插入全部缺失语言
+    - 各阶段之间是有界队列/信号量，扫描速度受翻译和写入速度约束，内存保持平稳
+    """
+    write_queue = queue.Queue(maxsize=256)
+    inflight = threading.BoundedSemaphore(max(1, workers) * 2)
+    pending = {}
+    pending_lock = threading.Lock()
+    errors = []
+    failures = []
+    all_langs = [lang for lang, _ in target_langs(config)]
+    packer = BatchPacker(config, len(all_langs))
+
+    def cached_translations(source_text, langs):
+        translations = {}
+        for lang in langs:
+            translated = caches[lang].get(source_text)
+            if not translated:
+                return None
+            translations[lang] = translated
+        return translations
+
+    def reuse_translations(source_text, langs):
+        """术语表 / 翻译记忆能补齐全部缺失语言时写入缓存并返回译文"""
+        for lang in langs:
+            if source_text in caches[lang]:
+                continue
+            translated = local_translation(source_text, config, lang)
+            if not translated:
+                return None
+            caches[lang][source_text] = translated
+            remember(lang, source_text, translated)
+        return cached_translations(source_text, langs)
+
+    def writer():
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            file_path, original, tail_offset, translations = item
+            changed = False
+            try:
+                updated, changed = insert_names_with_translations(original, config, translations)
+                if changed:
+                    write_element(file_path, updated, tail_offset)
+            except Exception as e:
+                print(f"\nError writing file {file_path}: {e}")
+            progress.done(changed)
+
+    def release_waiting(text):
+        """译文到达（或确定失败）后，把等待这条文本的文件交给写入线程"""
+        with pending_lock:
+            waiting = pending.pop(text, [])
+        for file_path, original, tail_offset, missing in waiting:
+            translations = cached_translations(text, missing)
+            if translations:
+                write_queue.put((file_path, original, tail_offset, translations))
+            else:
+                progress.done(False)
+
+    def commit(text, translations):
+        """单条译文立即写入缓存并释放等待的文件（流式模式下不必等整批结束）"""
+        for lang, translated in translations.items():
+            if translated:
+                caches[lang][text] = translated
+                remember(lang, text, translated)
+        release_waiting(text)
+
+    def translate_batch(batch):
+        try:
+            langs = [lang for lang in all_langs if any(text not in caches[lang] for text in batch)]
+            batch_failures = []
+            try:
+                if langs:
+                    translate_texts_bisect(batch, config, langs, batch_failures, commit)
+            except Exception as e:
+                errors.append(e)
+                print(f"\nError translating batch: {e}")
+            failures.extend(batch_failures)
+            for lang in langs:
+                caches[lang].flush()
+            for text in batch:
+                release_waiting(text)
+        finally:
+            inflight.release()
+
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    writer_thread.start()
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+
+    def submit(batch):
+        inflight.acquire()
+        executor.submit(translate_batch, batch)
+
+    try:
+        for file_path in file_paths:
+            if errors:
+                # 与旧行为一致：某批失败后不再提交新的批次
+                break
+            original, tail_offset = read_element(file_path, config)
+            source_text, missing = extract_missing(original, config)
+            if not source_text:
+                progress.done(False)
+                continue
 
-    config = load_config(CONFIG_PATH)
+            new_text = False
+            translations = cached_translations(source_text, missing)
+            if translations:
+                _metrics.incr("cache_hits", len(missing))
+            else:
+                translations = reuse_translations(source_text, missing)
+            if not translations:
+                with pending_lock:
+                    # 批次完成时先写缓存再取走等待列表，所以在锁内复查缓存
+                    translations = cached_translations(source_text, missing)
+                    if not translations:
+                        waiting = pending.get(source_text)
+                        entry = (file_path, original, tail_offset, missing)
+                        if waiting is None:
+                            pending[source_text] = [entry]
+                            new_text = True
+                            _metrics.incr("cache_misses", len(missing))
+                        else:
+                            waiting.append(entry)
+                            _metrics.incr("coalesced")
+            if translations:
+                write_queue.put((file_path, original, tail_offset, translations))
+            elif new_text:
+                for batch in packer.add(source_text):
+                    submit(batch)
+
+        if packer.items and not errors:
+            submit(packer.flush())
+    finally:
+        executor.shutdown(wait=True)
+        write_queue.put(None)
+        writer_thread.join()
+        log_failed_texts(config, failures)
+
+    if failures:
+        print(f"\n  ⚠ {len(failures)} texts failed and were skipped (see {config.get('failed_log_file', 'translate_failed.jsonl')})")
+
+    if errors:
+        raise errors[0]
+
+
+def locate_elements(args, config):
+    """
+    返回 QElectroTech 的 elements 目录：--elements > 自动检测 > 手动输入（仅交互模式）
+    """
+    if args.elements:
+        return args.elements
+
+    from qet_locate import find_qet_installation
+
+    with _metrics.phase("detect"):
+        qet_path = find_qet_installation(args.config, interactive=not args.non_interactive)
+    if qet_path:
+        add_path_to_config(qet_path, args.config)
+        return qet_path
+
+    print("\n❌ 无法自动检测QElectroTech安装路径")
+    print("\n请手动指定路径：")
+    print(f"方法1: 在 {args.config} 中添加以下配置：")
+    print('  "qet_elements_path": "C:\\Program Files\\QElectroTech\\elements"')
+    print("方法2: 命令行参数 --elements <elements 文件夹路径>")
+    if args.non_interactive:
+        return None
 
+    print("\n方法3: 运行时指定路径：")
+    manual_path = input("请输入QElectroTech的elements文件夹路径（或按回车退出）: ").strip()
+    if not manual_path:
+        print("已取消")
+        return None
+    qet_path = manual_path.strip('"').strip("'")
+    add_path_to_config(qet_path, args.config)
+    return qet_path
+
+
+def run_sync(args, config, qet_path=None):
+    """检测 + 同步，返回 SyncReport；失败返回 None。qet_path 为已检测到的 elements 目录"""
     print("\n[1/4] 同步元件库...")
-    qet_path = find_qet_installation()
+    qet_path = qet_path or locate_elements(args, config)
     if not qet_path:
-        print("\n❌ 无法自动检测QElectroTech安装路径")
-        print("\n请手动指定路径：")
-        print("方法1: 在 translate_config.json 中添加以下配置：")
-        print('  "qet_elements_path": "C:\\Program Files\\QElectroTech\\elements"')
-        print("\n方法2: 运行时指定路径：")
-        manual_path = input("请输入QElectroTech的elements文件夹路径（或按回车退出）: ").strip()
-
-        if not manual_path:
-            print("已取消")
-            return 1
-
-        qet_path = manual_path.strip('"').strip("'")
-        if not os.path.exists(qet_path):
-            print(f"❌ 路径不存在: {qet_path}")
-            return 1
+        return None
+    if not os.path.isdir(qet_path):
+        print(f"❌ 路径不存在: {qet_path}")
+        return None
 
     try:
-        sync_elements(qet_path, SRC_DIR)
-        add_path_to_config(qet_path)
+        with _metrics.phase("sync"):
+            return sync_elements(
+                qet_path, args.src, config.get("sync_manifest_file", "sync_manifest.json")
+            )
     except Exception as e:
         print(f"\n❌ 同步失败: {e}")
         import traceback
         traceback.print_exc()
-        return 1
+        return None
 
-    cache_path = config.get("cache_file", "translate_cache.json")
-    cache = load_cache(cache_path)
 
-    # Clean and copy src to result
-    print("\n[2/4] Copying src to result directory...")
-    if os.path.exists(RESULT_DIR):
-        shutil.rmtree(RESULT_DIR)
-    shutil.copytree(SRC_DIR, RESULT_DIR)
-    print("✓ Copy completed")
+def latest_run_report(config):
+    """run_report_file 对应的最近一次运行报告（路径含 {timestamp} 时取最新的一个）；没有时返回 None"""
+    pattern = config.get("run_report_file", "run_report.json")
+    if not pattern:
+        return None
+    if "{timestamp}" in pattern:
+        import glob
+
+        paths = glob.glob(pattern.replace("{timestamp}", "*"))
+        paths = [path for path in paths if not path.endswith(".tmp")]
+        if not paths:
+            return None
+        pattern = max(paths, key=os.path.getmtime)
+    try:
+        with open(pattern, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return None
+    report["path"] = pattern
+    return report
+
+
+def estimate_wall_time(config, requests, tokens, latency):
+    """
+    按并发数和单个请求的延迟估算翻译耗时，再受 requests_per_second / tokens_per_minute 约束：
+    返回 (秒, 瓶颈)
+    """
+    workers = max(1, int(config.get("max_workers", 0) or 0))
+    concurrency = min(workers, int(config.get("max_concurrency") or workers))
+    requests_per_second = config.get("requests_per_second")
+    if requests_per_second is None:
+        sleep_seconds = float(config.get("sleep_seconds", 0) or 0)
+        requests_per_second = workers / sleep_seconds if sleep_seconds > 0 else 0
+    tokens_per_minute = float(config.get("tokens_per_minute", 0) or 0)
+    bounds = [(requests * latency / concurrency, f"latency x {concurrency} workers")]
+    if requests_per_second:
+        bounds.append((requests / float(requests_per_second), f"requests_per_second={requests_per_second}"))
+    if tokens_per_minute:
+        bounds.append((tokens * 60.0 / tokens_per_minute, f"tokens_per_minute={tokens_per_minute:g}"))
+    return max(bounds)
+
+
+def plan_tree(config, src_dir, latency=None):
+    """
+    统计 src 中待翻译的内容并估算请求数、token 数和耗时：不联网、不写任何文件。
+    组批方式与 run_batch_pipeline 相同（扫描顺序、openai_batch_size / openai_batch_tokens），
+    延迟取自最近一次运行报告的 api_latency，也可用 --latency 指定
+    """
+    from cache_store import read_caches
+
+    global _memories, _glossary
+    started = time.perf_counter()
+    caches = read_caches(config, PROMPT_VERSION)
+    _memories = build_memories(config, caches)
+    _glossary = load_configured_glossary(config, persist=False)
+    langs = [lang for lang, _ in target_langs(config)]
+    translate_mode = config.get("translate_mode", "api").lower()
+    batch_mode = translate_mode == "openai" and int(config.get("openai_batch_size", 1) or 1) > 1
 
-    # Count total files to process
-    print("\n[3/4] Scanning files...")
     total_files = 0
-    file_paths = []
-    for root, _, files in os.walk(RESULT_DIR):
+    translated_files = 0
+    needs = 0
+    unique = {lang: set() for lang in langs}
+    local = {lang: set() for lang in langs}
+    uncached = {lang: set() for lang in langs}
+    # 需要请求接口的文本（扫描顺序，去重）-> 缺失的目标语言
+    pending = {}
+    for root, _, files in os.walk(src_dir):
         for filename in files:
-            if filename == "qet_directory" or filename.lower().endswith(".elmt"):
-                file_paths.append(os.path.join(root, filename))
-                total_files += 1
-    print(f"✓ Found {total_files} files to process")
+            if not is_element_file(filename):
+                continue
+            total_files += 1
+            header, _ = read_element(os.path.join(root, filename), config)
+            block = scan_names_block(header)
+            if block is not None and not missing_target_langs(block, config):
+                translated_files += 1
+            source_text, missing = extract_missing(header, config)
+            if not source_text:
+                continue
+            needs += 1
+            for lang in missing:
+                if source_text in unique[lang]:
+                    continue
+                unique[lang].add(source_text)
+                if source_text in caches[lang]:
+                    continue
+                if local_translation(source_text, config, lang):
+                    local[lang].add(source_text)
+                    continue
+                uncached[lang].add(source_text)
+                pending.setdefault(source_text, [])
+                if lang not in pending[source_text]:
+                    pending[source_text].append(lang)
+
+    input_tokens = 0
+    output_tokens = 0
+    batch_sizes = []
+    if batch_mode:
+        packer = BatchPacker(config, len(langs))
+        batches = []
+        for text in pending:
+            batches.extend(packer.add(text))
+        if packer.items:
+            batches.append(packer.flush())
+        for batch in batches:
+            batch_langs = [lang for lang in langs if any(lang in pending[text] for text in batch)]
+            payload = openai_batch_payload(batch, config, batch_langs)
+            input_tokens += estimate_tokens("".join(message["content"] for message in payload["messages"]))
+            # 输出为 JSON 数组，每条译文另有引号、逗号等约 2 个 token
+            output_tokens += sum((estimate_tokens(text) + 2) * len(batch_langs) for text in batch)
+            batch_sizes.append(len(batch))
+        requests = len(batches)
+    else:
+        requests = 0
+        for text, text_langs in pending.items():
+            for lang in text_langs:
+                requests += 1
+                if translate_mode == "openai":
+                    payload = openai_text_payload(text, config, lang)
+                    input_tokens += estimate_tokens("".join(message["content"] for message in payload["messages"]))
+                else:
+                    input_tokens += estimate_tokens(text)
+                output_tokens += estimate_tokens(text)
+
+    mode = describe_mode(config)
+    report = latest_run_report(config) if latency is None else None
+    latency_source = "--latency"
+    if report is not None and report.get("api_latency", {}).get("count"):
+        latency = report["api_latency"]["mean"]
+        latency_source = f"{report['path']} ({report['api_latency']['count']} requests, mode {report.get('mode')})"
+    wall_time, bottleneck = (None, None)
+    if latency is not None:
+        wall_time, bottleneck = estimate_wall_time(config, requests, input_tokens + output_tokens, latency)
+
+    print(f"\n源目录: {src_dir}")
+    print(f"  元件文件: {total_files}")
+    print(f"  已包含全部目标语言的文件: {translated_files}")
+    print(f"  需要插入译文的文件: {needs}")
+    for lang in langs:
+        hits = len(unique[lang]) - len(local[lang]) - len(uncached[lang])
+        print(
+            f"  [{lang}] 不同源文本 {len(unique[lang])}，已缓存 {hits}，"
+            f"本地可译（术语表/翻译记忆） {len(local[lang])}，需要翻译 {len(uncached[lang])}"
+        )
+    print(f"\n翻译方式: {mode}")
+    if batch_mode:
+        average = sum(batch_sizes) / len(batch_sizes) if batch_sizes else 0
+        print(f"  请求数: {requests} 批（平均 {average:.1f} 条/批，最大 {max(batch_sizes or [0])} 条）")
+    else:
+        print(f"  请求数: {requests}")
+    print(f"  估算 token: 输入 {input_tokens}，输出 {output_tokens}")
+    if wall_time is None:
+        print("  预计耗时: 未知（没有运行报告中的延迟数据，可用 --latency 秒 指定）")
+    else:
+        print(f"  单个请求延迟: {latency:.3f}s，来源 {latency_source}")
+        if report is not None and report.get("mode") != mode:
+            print("  ⚠ 运行报告的翻译方式与当前配置不同，延迟仅供参考")
+        print(f"  预计耗时: {wall_time:.1f}s（约 {wall_time / 60:.1f} 分钟，瓶颈: {bottleneck}）")
+    print(f"  统计耗时: {time.perf_counter() - started:.1f}s")
+    return {
+        "total_files": total_files,
+        "translated_files": translated_files,
+        "files_to_update": needs,
+        "unique_texts": {lang: len(texts) for lang, texts in unique.items()},
+        "local_texts": {lang: len(texts) for lang, texts in local.items()},
+        "uncached_texts": {lang: len(texts) for lang, texts in uncached.items()},
+        "requests": requests,
+        "batch_sizes": batch_sizes,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "latency": latency,
+        "wall_time": wall_time,
+    }
 
-    # Process files with progress
-    max_workers = config.get("max_workers", 0)
-    translate_mode = config.get("translate_mode", "api").lower()
-    openai_batch_size = int(config.get("openai_batch_size", 1) or 1)
-    api_save_every = int(config.get("api_save_every", 10) or 0)
-    save_state = None
-    if translate_mode != "openai":
-        save_state = CacheSaveState(cache_path, api_save_every)
 
-    print(f"\n[4/4] Processing and translating...")
-    if translate_mode == "openai" and openai_batch_size > 1:
-        print(f"Mode: OpenAI Batch (batch_size={openai_batch_size})")
-    elif max_workers > 0:
-        print(f"Mode: Parallel (workers={max_workers})")
+def verify_tree(config, src_dir, result_dir, check_xml=False):
+    """
+    检查 result：每个 src 元件文件都有对应文件、没有缺少目标语言的名称、
+    没有残留的临时文件；check_xml 时完整解析每个文件。返回问题数
+    """
+    import xml.etree.ElementTree as ET
+
+    problems = []
+    checked = 0
+    for root, _, files in os.walk(src_dir):
+        for filename in files:
+            if not is_element_file(filename):
+                continue
+            rel_path = os.path.relpath(os.path.join(root, filename), src_dir)
+            result_file = os.path.join(result_dir, rel_path)
+            checked += 1
+            if not os.path.isfile(result_file):
+                problems.append(f"missing: {rel_path}")
+                continue
+            header, _ = read_element(result_file, config)
+            source_text, missing = extract_missing(header, config)
+            if source_text:
+                problems.append(f"untranslated ({', '.join(missing)}): {rel_path}")
+            if check_xml:
+                try:
+                    ET.parse(result_file)
+                except ET.ParseError as e:
+                    problems.append(f"invalid xml ({e}): {rel_path}")
+
+    for root, _, files in os.walk(result_dir):
+        for filename in files:
+            if filename.endswith((".tmp", ".sync-tmp")):
+                problems.append(f"leftover temp file: {os.path.relpath(os.path.join(root, filename), result_dir)}")
+
+    for problem in problems[:50]:
+        print(f"  ✗ {problem}")
+    if len(problems) > 50:
+        print(f"  ... {len(problems) - 50} more")
+    if problems:
+        print(f"\n❌ {len(problems)} problems in {checked} files")
     else:
-        print(f"Mode: Serial")
+        print(f"✓ {checked} files verified")
+    return len(problems)
 
-    updated_count = 0
-    processed_count = 0
-    start_time = time.time()
-    cache_lock = threading.Lock()
 
-    if translate_mode == "openai" and openai_batch_size > 1:
-        print("\n  Collecting texts for batch translation...")
-        file_texts = []
-        missing_texts = []
-        seen_texts = set()
+def add_common_arguments(parser, defaults=True):
+    """defaults=False 用于子命令：未写出的参数不覆盖写在子命令前面的值"""
+    def default(value):
+        return value if defaults else argparse.SUPPRESS
+
+    parser.add_argument("--config", default=default(CONFIG_PATH), help=f"配置文件（默认 {CONFIG_PATH}）")
+    parser.add_argument("--src", default=default(SRC_DIR), help=f"src 目录（默认 {SRC_DIR}）")
+    parser.add_argument("--result", default=default(RESULT_DIR), help=f"输出目录（默认 {RESULT_DIR}）")
+    parser.add_argument(
+        "--elements", default=default(None), help="QElectroTech 的 elements 目录，指定后不再自动检测"
+    )
+    parser.add_argument("--cache", default=default(None), help="翻译缓存文件，覆盖配置中的 cache_file")
+    parser.add_argument(
+        "--archive",
+        default=default(None),
+        help="把结果直接写成压缩包（.zip / .tar.gz / .tar.xz 等），不生成 result 目录",
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        default=default(False),
+        help="配合 --archive：只打包插入了译文的文件",
+    )
+    parser.add_argument(
+        "--non-interactive",
+        action="store_true",
+        default=default(False),
+        help="从不等待输入；无法确定路径时直接失败",
+    )
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="QElectroTech 元件库同步与翻译；不带子命令时依次执行 sync 和 translate"
+    )
+    add_common_arguments(parser)
+    subparsers = parser.add_subparsers(dest="command")
+    commands = [
+        ("sync", "只同步 elements 到 src"),
+        ("translate", "只把 src 翻译到 result（不同步）"),
+        ("plan", "统计待翻译内容，不联网、不写文件"),
+        ("verify", "检查 result 是否完整"),
+        ("watch", "同步并翻译一次后常驻监视 elements，只翻译新增/修改的文件"),
+        ("apply", "把 --archive 生成的压缩包原子地安装到 elements 目录"),
+    ]
+    for name, help_text in commands:
+        subparser = subparsers.add_parser(name, help=help_text)
+        add_common_arguments(subparser, defaults=False)
+        if name == "verify":
+            subparser.add_argument("--xml", action="store_true", help="同时完整解析每个文件，检查 XML 格式")
+        if name == "apply":
+            subparser.add_argument("package", metavar="ARCHIVE", help="translate --archive 生成的压缩包")
+            subparser.add_argument("--force", action="store_true", help="目标文件在打包后被修改过时仍然覆盖")
+        if name == "watch":
+            subparser.add_argument("--interval", type=float, default=None, help="检查间隔秒数（默认 watch_interval）")
+            subparser.add_argument("--debounce", type=float, default=None, help="目录安静多少秒后处理（默认 watch_debounce）")
+        if name == "plan":
+            subparser.add_argument(
+                "--latency", type=float, default=None, help="单个请求的延迟（秒），默认取最近一次运行报告"
+            )
+    args = parser.parse_args(argv)
+    if args.delta and not args.archive:
+        parser.error("--delta 只能与 --archive 一起使用")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_config(args.config)
+    if args.cache:
+        config["cache_file"] = args.cache
+    try:
+        target_langs(config)
+    except ValueError as e:
+        print(f"❌ 配置错误: {e}")
+        return 1
+    reset_metrics()
+
+    if args.command == "plan":
+        plan_tree(config, args.src, args.latency)
+        return 0
+    if args.command == "verify":
+        return 1 if verify_tree(config, args.src, args.result, args.xml) else 0
+    if args.command == "apply":
+        return apply_archive(args, config)
+
+    print("="*60)
+    print(f"QET Directory & Element Translator")
+    print(f"Start time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print("="*60)
+
+    if args.command == "watch":
+        return watch(args, config)
+
+    if args.command == "translate":
+        manifest_path = config.get("sync_manifest_file", "sync_manifest.json")
+        sync_report = load_sync_report(manifest_path) if os.path.isdir(args.src) else None
+        if sync_report is None:
+            print(f"❌ 未找到已同步的 src 目录或同步清单: {args.src} / {manifest_path}")
+            print("   请先运行 `python scripts/translate_to_result.py sync`（或不带子命令执行“同步 + 翻译”）")
+            return 1
+    else:
+        sync_report = run_sync(args, config)
+        if sync_report is None:
+            return 1
+        if args.command == "sync":
+            return 0
+
+    if args.archive:
+        package_tree(config, args.src, args.archive, args.delta, sync_report)
+    else:
+        translate_tree(config, args.src, args.result, sync_report)
+    return 0
 
+
+def watch(args, config):
+    """watch 子命令：先记录 elements 的基准并完整同步、翻译一次，再进入常驻监视"""
+    from watcher import TreeWatcher
+
+    qet_path = locate_elements(args, config)
+    if not qet_path:
+        return 1
+    if not os.path.isdir(qet_path):
+        print(f"❌ 路径不存在: {qet_path}")
+        return 1
+    interval = args.interval if args.interval is not None else config.get("watch_interval", 1.0)
+    debounce = args.debounce if args.debounce is not None else config.get("watch_debounce", 0.5)
+    # 在首次同步之前记录基准，同步和翻译期间的变化会在第一次检查时处理
+    watcher = TreeWatcher(qet_path, interval, debounce, config.get("watch_max_delay", 10.0))
+    sync_report = run_sync(args, config, qet_path)
+    if sync_report is None:
+        return 1
+    translate_tree(config, args.src, args.result, sync_report)
+    watch_tree(config, watcher, qet_path, args.src, args.result)
+    return 0
+
+
+def close_transport():
+    """关闭共享的 HTTP 连接池、限流器和后端注册表，返回 HTTP 统计"""
+    global _http_client, _providers
+    with _http_client_lock:
+        client, _http_client = _http_client, None
+        _providers = None
+        _rate_limiters.clear()
+    if client is None:
+        return None
+    http_stats = client.stats()
+    client.close()
+    return http_stats
+
+
+class SkipIndex:
+    """
+    持久化的逐文件跳过索引：result 相对路径 -> [源文件签名, 源文本, 缺失语言, 译文哈希]
+
+    源文件签名（同步清单中的内容哈希）和当前缓存中的译文都与上次写入时一致的文件
+    直接跳过，不再打开；手动修改缓存中的某条译文只会让用到它的文件重新生成
+    """
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        self.key = json.dumps(
+            [target_langs(config), config.get("source_lang_priority", ["en", "fr"])],
+            ensure_ascii=False,
+        )
+        data = load_sync_manifest(path)
+        self.entries = data.get("files", {}) if data.get("key") == self.key else {}
+        self.signatures = {}
+
+    @staticmethod
+    def source_signature(src_file, rel_path, sync_report):
+        if sync_report is not None and rel_path in sync_report.hashes:
+            return sync_report.hashes[rel_path]
+        st = os.stat(src_file)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    @staticmethod
+    def translation_digest(caches, source_text, langs):
+        """源文本对应的全部译文的哈希；有译文缺失时返回 None"""
+        if not source_text:
+            return ""
+        translations = [caches[lang].get(source_text) for lang in langs]
+        if not all(translations):
+            return None
+        payload = json.dumps(translations, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha1(payload).hexdigest()
+
+    def plan(self, file_paths, src_dir, result_dir, caches, stager, sync_report):
+        """
+        返回 (需要处理的文件, 跳过数, 重新暂存数)；
+        译文有变化或没有可用条目的文件先从 src 重新暂存，再按正常流程插入新译文
+        """
+        to_process = []
+        skipped = 0
+        restaged = 0
+        self.signatures = {}
+        kept = {}
         for file_path in file_paths:
-            with open(file_path, "r", encoding="utf-8") as f:
-                original = f.read()
-            source_text = extract_source_text(original, config)
-            if not source_text:
+            rel_path = os.path.relpath(file_path, result_dir).replace(os.sep, "/")
+            src_file = os.path.join(src_dir, rel_path)
+            if not os.path.isfile(src_file):
+                to_process.append(file_path)
                 continue
-            file_texts.append((file_path, source_text))
-            if source_text in cache or source_text in seen_texts:
+            signature = self.source_signature(src_file, rel_path, sync_report)
+            self.signatures[file_path] = (rel_path, src_file, signature)
+            # 刚从 src 放入的文件还没有译文，索引中的旧条目不能再用
+            entry = None if stager.rebuilt or rel_path in stager.placed else self.entries.get(rel_path)
+            if not entry or entry[0] != signature:
+                if not stager.rebuilt and rel_path not in stager.placed:
+                    # 没有可用的条目时无法判断 result 中已有的译文是否仍与缓存一致，从 src 重新放入
+                    stager.place(src_file, file_path)
+                to_process.append(file_path)
                 continue
-            seen_texts.add(source_text)
-            missing_texts.append(source_text)
-
-        total_batches = (len(missing_texts) + openai_batch_size - 1) // openai_batch_size
-        for batch_index in range(0, len(missing_texts), openai_batch_size):
-            batch = missing_texts[batch_index : batch_index + openai_batch_size]
-            batch_number = (batch_index // openai_batch_size) + 1
-            print(f"  Translating batch {batch_number}/{max(1, total_batches)}...")
-            translations = translate_texts_openai(batch, config)
-            for text, translated in zip(batch, translations):
-                cache[text] = translated
-            save_cache(cache_path, cache)
-
-        for file_path, source_text in file_texts:
-            with open(file_path, "r", encoding="utf-8") as f:
-                original = f.read()
-            translated = cache.get(source_text)
-            if not translated:
-                processed_count += 1
-                print_progress(processed_count, total_files, updated_count, start_time)
+            _, source_text, langs, digest = entry
+            if self.translation_digest(caches, source_text, langs) == digest:
+                kept[rel_path] = entry
+                skipped += 1
                 continue
-            translated = escape_xml(translated)
-            updated, changed = insert_zh_name_with_translation(original, translated)
+            stager.place(src_file, file_path)
+            restaged += 1
+            to_process.append(file_path)
+        self.entries = kept
+        return to_process, skipped, restaged
+
+    def track(self, file_paths, src_dir, result_dir, sync_report, removed=()):
+        """
+        watch 模式：只重新登记这些文件（其余条目保留），处理完后同样由 record() 记录；
+        removed 为已删除文件的相对路径
+        """
+        self.signatures = {}
+        for rel_path in removed:
+            self.entries.pop(rel_path, None)
+        for file_path in file_paths:
+            rel_path = os.path.relpath(file_path, result_dir).replace(os.sep, "/")
+            src_file = os.path.join(src_dir, rel_path)
+            self.entries.pop(rel_path, None)
+            self.signatures[file_path] = (rel_path, src_file, self.source_signature(src_file, rel_path, sync_report))
+
+    def record(self, file_paths, caches):
+        """
+        记录本次处理过的文件；result 中仍缺少译文（翻译失败或运行中断）的文件不记录，下次重试
+        """
+        for file_path in file_paths:
+            if file_path not in self.signatures:
+                continue
+            result_header, _ = read_element(file_path, self.config)
+            if extract_missing(result_header, self.config)[0]:
+                continue
+            rel_path, src_file, signature = self.signatures[file_path]
+            header, _ = read_element(src_file, self.config)
+            source_text, langs = extract_missing(header, self.config)
+            digest = self.translation_digest(caches, source_text, langs)
+            if digest is not None:
+                self.entries[rel_path] = [signature, source_text, langs, digest]
+
+    def save(self):
+        save_sync_manifest(self.path, {"version": 1, "key": self.key, "files": self.entries})
+
+
+_worker_state = {}
+
+
+def _init_rewrite_worker(config, snapshots):
+    _worker_state["config"] = config
+    _worker_state["caches"] = snapshots
+
+
+def rewrite_chunk(chunk):
+    """
+    进程池工作函数：只用缓存快照插入译文并写入，不发网络请求；
+    返回 (已处理数, 已更新数, 仍需翻译的文件, 计数器, 累计耗时)
+    """
+    config = _worker_state["config"]
+    caches = _worker_state["caches"]
+    metrics = reset_metrics()
+    processed = 0
+    updated = 0
+    pending = []
+    for file_path in chunk:
+        original, tail_offset = read_element(file_path, config)
+        source_text, missing = extract_missing(original, config)
+        if source_text:
+            translations = {lang: caches[lang].get(source_text) for lang in missing}
+            if not all(translations.values()):
+                pending.append(file_path)
+                continue
+            metrics.incr("cache_hits", len(missing))
+            new_text, changed = insert_names_with_translations(original, config, translations)
             if changed:
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write(updated)
-                updated_count += 1
-            processed_count += 1
-            print_progress(processed_count, total_files, updated_count, start_time)
+                write_element(file_path, new_text, tail_offset)
+                updated += 1
+        processed += 1
+    return processed, updated, pending, dict(metrics.counters), dict(metrics.timers)
+
+
+def process_worker_count(config):
+    workers = config.get("process_workers", 0)
+    if workers == "auto":
+        return os.cpu_count() or 1
+    return int(workers or 0)
+
+
+def rewrite_with_processes(file_paths, config, caches, workers, printer, start_time, counts):
+    """
+    缓存已命中的文件（纯解析 + 文件读写，不受网络限制）分块交给进程池处理，
+    每个进程持有一份只读缓存快照；返回缓存中缺少译文、仍需翻译的文件
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    total_files = len(file_paths)
+    snapshots = {lang: cache.snapshot() for lang, cache in caches.items()}
+    chunk_size = int(config.get("process_chunk_size", 0) or 0)
+    if chunk_size <= 0:
+        chunk_size = max(1, min(500, total_files // (workers * 4) + 1))
+    chunks = [file_paths[i:i + chunk_size] for i in range(0, total_files, chunk_size)]
+
+    remaining = []
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_rewrite_worker, initargs=(config, snapshots)
+    ) as executor:
+        for processed, updated, pending, counters, timers in executor.map(rewrite_chunk, chunks):
+            counts["processed"] += processed
+            counts["updated"] += updated
+            remaining.extend(pending)
+            for name, value in counters.items():
+                _metrics.incr(name, value)
+            for name, seconds in timers.items():
+                _metrics.add_time(name, seconds)
+            printer.update(counts["processed"], total_files, counts["updated"], start_time)
+    return remaining
+
+
+def describe_mode(config):
+    max_workers = config.get("max_workers", 0)
+    openai_batch_size = int(config.get("openai_batch_size", 1) or 1)
+    process_workers = process_worker_count(config)
+    suffix = f" + Processes (workers={process_workers})" if process_workers > 0 else ""
+    if config.get("translate_mode", "api").lower() == "openai" and openai_batch_size > 1:
+        return f"OpenAI Batch (batch_size={openai_batch_size}){suffix}"
+    if max_workers > 0:
+        return f"Parallel (workers={max_workers}){suffix}"
+    return f"Serial{suffix}"
+
+
+def translate_files(file_paths, config, caches, save_state, printer, start_time, counts):
+    """按配置选择串行 / 并行 / OpenAI 批量流水线处理文件，进度写入 counts"""
+    total_files = len(file_paths)
+    max_workers = config.get("max_workers", 0)
+    translate_mode = config.get("translate_mode", "api").lower()
+    openai_batch_size = int(config.get("openai_batch_size", 1) or 1)
+    cache_lock = TimedLock(_metrics, "cache_lock_wait")
+
+    process_workers = process_worker_count(config)
+    if process_workers > 0 and file_paths:
+        print(f"\n  Rewriting cached files with {process_workers} processes...")
+        file_paths = rewrite_with_processes(
+            file_paths, config, caches, process_workers, printer, start_time, counts
+        )
+        if not file_paths:
+            return
+        print(f"\n  {len(file_paths)} files need translation")
+
+    if translate_mode == "openai" and openai_batch_size > 1:
+        progress = PipelineProgress(total_files, start_time, printer)
+        progress.processed = counts["processed"]
+        progress.updated = counts["updated"]
+        try:
+            run_batch_pipeline(file_paths, config, caches, max_workers, progress)
+        finally:
+            counts["processed"] = progress.processed
+            counts["updated"] = progress.updated
     elif max_workers > 0:
-        # Parallel processing
+        # Parallel processing: translate each unique uncached text once, then rewrite files
+        print("\n  Collecting unique texts...")
+        _, missing = collect_missing_texts(file_paths, config, caches)
+        translate_unique_texts(missing, config, caches, cache_lock, save_state, max_workers)
+
         with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_file = {executor.submit(process_file_wrapper, fp, config, cache, cache_lock, save_state): fp for fp in file_paths}
+            future_to_file = {executor.submit(process_file_wrapper, fp, config, caches, cache_lock, save_state): fp for fp in file_paths}
 
             for future in as_completed(future_to_file):
-                processed_count += 1
+                counts["processed"] += 1
                 try:
                     if future.result():
-                        updated_count += 1
+                        counts["updated"] += 1
                 except Exception as e:
                     print(f"\nError processing file: {e}")
-                print_progress(processed_count, total_files, updated_count, start_time)
+                printer.update(counts["processed"], total_files, counts["updated"], start_time)
     else:
         # Serial processing
-        for idx, file_path in enumerate(file_paths, 1):
-            if process_file(file_path, config, cache, save_state):
-                updated_count += 1
-            print_progress(idx, total_files, updated_count, start_time)
+        for file_path in file_paths:
+            if process_file(file_path, config, caches, save_state):
+                counts["updated"] += 1
+            counts["processed"] += 1
+            printer.update(counts["processed"], total_files, counts["updated"], start_time)
+
 
-    save_cache(cache_path, cache)
+def translate_tree(config, src_dir, result_dir, sync_report=None):
+    """
+    生成 result 并翻译其中的元件文件（暂存 → 扫描 → 翻译写入），返回运行统计
+    """
+    global _memories, _glossary
+    caches = open_caches(config, PROMPT_VERSION)
+    namespaces = {lang: {"namespace": cache.namespace, "file": cache.path} for lang, cache in caches.items()}
+    _memories = build_memories(config, caches)
+    _glossary = load_configured_glossary(config)
+
+    # Stage src into result (links for unchanged files, src is never modified)
+    print("\n[2/4] Staging src into result directory...")
+    skip_index_file = config.get("skip_index_file", "skip_index.json")
+    with _metrics.phase("copy"):
+        # 没有跳过索引时无法知道哪些文件用到的译文变了，result 整体重建
+        stager = stage_result(
+            src_dir, result_dir, config.get("result_link_mode", "auto"), sync_report if skip_index_file else None
+        )
+        mark_staged(config.get("sync_manifest_file", "sync_manifest.json"))
+    print(f"✓ Staging completed ({stager.summary() or 'no changes'})")
+
+    # Count total files to process
+    print("\n[3/4] Scanning files...")
+    total_files = 0
+    file_paths = []
+    with _metrics.phase("scan"):
+        for root, _, files in os.walk(result_dir):
+            for filename in files:
+                if is_element_file(filename):
+                    file_paths.append(os.path.join(root, filename))
+                    total_files += 1
+
+        skip_index = None
+        skipped = 0
+        if skip_index_file:
+            skip_index = SkipIndex(skip_index_file, config)
+            file_paths, skipped, restaged = skip_index.plan(
+                file_paths, src_dir, result_dir, caches, stager, sync_report
+            )
+            _metrics.incr("files_skipped", skipped)
+            _metrics.incr("files_restaged", restaged)
+            if restaged:
+                print(f"  ↻ {restaged} files restaged because their cached translation changed")
+    print(f"✓ Found {total_files} files ({len(file_paths)} to process, {skipped} unchanged)")
+
+    # Process files with progress
+    api_save_every = int(config.get("api_save_every", 10) or 0)
+    save_state = None
+    if config.get("translate_mode", "api").lower() != "openai":
+        save_state = CacheSaveState(api_save_every)
+
+    print(f"\n[4/4] Processing and translating...")
+    print(f"Mode: {describe_mode(config)}")
+
+    start_time = time.time()
+    printer = ProgressPrinter(config.get("progress_interval", 0.2))
+    profiler = StageProfiler(config.get("profile"), config.get("profile_output"))
+    counts = {"processed": 0, "updated": 0}
+
+    try:
+        with _metrics.phase("translate"), profiler:
+            translate_files(file_paths, config, caches, save_state, printer, start_time, counts)
+    finally:
+        try:
+            if skip_index is not None:
+                with _metrics.phase("index"):
+                    skip_index.record(file_paths, caches)
+                    skip_index.save()
+        finally:
+            for cache in caches.values():
+                cache.close()
+            provider_stats = _providers.stats() if config.get("providers") and _providers else None
+            http_stats = close_transport()
+    updated_count = counts["updated"]
+    processed_count = counts["processed"]
     
     # Summary
     elapsed = time.time() - start_time
@@ -695,12 +2521,314 @@ def main():
     print(f"✓ Completed!")
     print(f"  Total files processed: {total_files}")
     print(f"  Files updated: {updated_count}")
+    if skipped:
+        print(f"  Files skipped (unchanged): {skipped}")
+    if _metrics.counters["api_calls_saved"]:
+        print(
+            f"  Translated locally: {_metrics.counters['api_calls_saved']} texts "
+            f"(glossary {_metrics.counters['glossary_local']}, memory "
+            f"{_metrics.counters['tm_exact'] + _metrics.counters['tm_fuzzy']}; API calls saved)"
+        )
     print(f"  Time elapsed: {elapsed:.1f}s")
     print(f"  End time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"  Cache file: {cache_path}")
-    print(f"  Output directory: {RESULT_DIR}")
+    for lang, namespace in namespaces.items():
+        print(f"  Cache ({lang}): {namespace['file']} [namespace {namespace['namespace']}]")
+    if http_stats:
+        print(
+            f"  HTTP: {http_stats['requests']} requests, "
+            f"{http_stats['connections']} connections, {http_stats['reused']} reused"
+        )
+    for name, stats in (provider_stats or {}).items():
+        print(
+            f"  Provider {name}: {stats.get('requests', 0)} requests, {stats.get('failures', 0)} failures, "
+            f"{stats.get('hedged', 0)} hedged ({stats.get('hedge_wins', 0)} won), circuit {stats['breaker']}"
+        )
+
+    report_path = config.get("run_report_file", "run_report.json")
+    if report_path:
+        report_path = _metrics.write_report(
+            report_path,
+            {
+                "mode": describe_mode(config),
+                "files": {
+                    "total": total_files,
+                    "processed": processed_count,
+                    "updated": updated_count,
+                    "skipped": skipped,
+                },
+                "staging": stager.counts,
+                "cache_namespaces": namespaces,
+                "elapsed": round(elapsed, 6),
+                "http": http_stats,
+                "providers": provider_stats,
+                "profile": profiler.summary,
+            },
+        )
+        print(f"  Run report: {report_path}")
+    if profiler.summary:
+        print(f"  Profile: {profiler.summary['output']}")
+    print(f"  Output directory: {result_dir}")
+    print(f"{'='*60}")
+
+    return {
+        "total_files": total_files,
+        "processed": processed_count,
+        "updated": updated_count,
+        "skipped": skipped,
+        "elapsed": elapsed,
+        "http": http_stats,
+    }
+
+
+def prefetch_translations(file_paths, config, caches):
+    """
+    只把 file_paths 中缺少的译文翻译进缓存，不写任何元件文件（打包输出用）；
+    OpenAI 批量模式按 openai_batch_size 组批，其他模式逐条翻译（max_workers 个线程）
+    """
+    _, missing = collect_missing_texts(file_paths, config, caches)
+    if not missing:
+        return
+    workers = max(1, int(config.get("max_workers", 0) or 0))
+    if config.get("translate_mode", "api").lower() != "openai" or int(config.get("openai_batch_size", 1) or 1) <= 1:
+        save_state = CacheSaveState(int(config.get("api_save_every", 10) or 0))
+        translate_unique_texts(missing, config, caches, TimedLock(_metrics, "cache_lock_wait"), save_state, workers)
+        return
+
+    all_langs = [lang for lang, _ in target_langs(config)]
+    pending = {}
+    for lang, text in missing:
+        translated = local_translation(text, config, lang)
+        if translated:
+            caches[lang][text] = translated
+            remember(lang, text, translated)
+        else:
+            pending.setdefault(text, []).append(lang)
+    packer = BatchPacker(config, len(all_langs))
+    batches = []
+    for text in pending:
+        batches.extend(packer.add(text))
+    if packer.items:
+        batches.append(packer.flush())
+
+    failures = []
+
+    def commit(text, translations):
+        for lang, translated in translations.items():
+            if translated:
+                caches[lang][text] = translated
+                remember(lang, text, translated)
+
+    def translate_batch(batch):
+        langs = [lang for lang in all_langs if any(lang in pending[text] for text in batch)]
+        translate_texts_bisect(batch, config, langs, failures, commit)
+
+    print(f"  Translating {len(pending)} unique texts in {len(batches)} batches with {workers} workers...")
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in as_completed([executor.submit(translate_batch, batch) for batch in batches]):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"\nError translating batch: {e}")
+    for cache in caches.values():
+        cache.flush()
+    log_failed_texts(config, failures)
+    if failures:
+        print(f"  ⚠ {len(failures)} texts failed and were skipped (see {config.get('failed_log_file', 'translate_failed.jsonl')})")
+
+
+def package_tree(config, src_dir, archive_path, delta=False, sync_report=None):
+    """
+    不生成 result 目录，把翻译结果直接流式写入压缩包（翻译缺失的文本 → 逐个文件写入）。
+    delta=True 时只包含插入了译文的文件；清单中记录每个文件及其原文件的 sha1，供 apply 校验
+    """
+    from package_output import ArchiveWriter
+
+    global _memories, _glossary
+    caches = open_caches(config, PROMPT_VERSION)
+    _memories = build_memories(config, caches)
+    _glossary = load_configured_glossary(config)
+    start_time = time.time()
+
+    print("\n[2/4] Scanning src...")
+    rel_paths = []
+    with _metrics.phase("scan"):
+        for root, dirs, files in os.walk(src_dir):
+            dirs.sort()
+            for filename in sorted(files):
+                rel_paths.append(os.path.relpath(os.path.join(root, filename), src_dir).replace(os.sep, "/"))
+    element_paths = [
+        os.path.join(src_dir, rel_path) for rel_path in rel_paths if is_element_file(rel_path.rsplit("/", 1)[-1])
+    ]
+    print(f"✓ Found {len(element_paths)} element files ({len(rel_paths)} files)")
+
+    print("\n[3/4] Translating missing texts...")
+    print(f"Mode: {describe_mode(config)}")
+    hashes = sync_report.hashes if sync_report is not None else {}
+    counts = {"translated": 0, "untranslated": 0, "copied": 0}
+    try:
+        with _metrics.phase("translate"):
+            prefetch_translations(element_paths, config, caches)
+
+        kind = "delta" if delta else "full"
+        print(f"\n[4/4] Writing {kind} archive {archive_path}...")
+        meta = {"to_lang": [lang for lang, _ in target_langs(config)], "source": os.path.abspath(src_dir)}
+        with _metrics.phase("package"), ArchiveWriter(archive_path, kind, meta) as archive:
+            for rel_path in rel_paths:
+                src_file = os.path.join(src_dir, rel_path)
+                if is_element_file(rel_path.rsplit("/", 1)[-1]):
+                    original, tail_offset = read_element(src_file, config)
+                    source_text, missing = extract_missing(original, config)
+                    if source_text:
+                        translations = {lang: caches[lang].get(source_text) for lang in missing}
+                        updated, changed = insert_names_with_translations(original, config, translations)
+                        if not all(translations.values()):
+                            counts["untranslated"] += 1
+                        if changed:
+                            base_sha1 = hashes.get(rel_path) or file_digest(src_file)
+                            archive.add_element(rel_path, updated, src_file, tail_offset, base_sha1)
+                            counts["translated"] += 1
+                            continue
+                if not delta:
+                    archive.add_file(rel_path, src_file)
+                    counts["copied"] += 1
+        _metrics.incr("bytes_written", archive.bytes)
+    finally:
+        for cache in caches.values():
+            cache.close()
+        http_stats = close_transport()
+
+    elapsed = time.time() - start_time
+    size = os.path.getsize(archive_path)
+    print(f"\n{'='*60}")
+    print("✓ Completed!")
+    print(f"  Files with inserted translations: {counts['translated']}")
+    if not delta:
+        print(f"  Files copied unchanged: {counts['copied']}")
+    if counts["untranslated"]:
+        print(f"  ⚠ Files still missing translations: {counts['untranslated']}")
+    print(f"  Archive: {archive_path} ({len(archive.files)} files, {archive.bytes / 1024 / 1024:.1f} MB -> {size / 1024 / 1024:.1f} MB)")
+    print(f"  Time elapsed: {elapsed:.1f}s")
+    report_path = config.get("run_report_file", "run_report.json")
+    if report_path:
+        report_path = _metrics.write_report(
+            report_path,
+            {
+                "mode": describe_mode(config),
+                "archive": {"path": archive_path, "kind": kind, "size": size, **counts},
+                "elapsed": round(elapsed, 6),
+                "http": http_stats,
+            },
+        )
+        print(f"  Run report: {report_path}")
+    print(f"  Install with: python scripts/translate_to_result.py apply {archive_path}")
     print(f"{'='*60}")
+    return counts
+
+
+def apply_archive(args, config):
+    """apply 子命令：把 translate --archive 生成的压缩包原子地安装到 elements 目录"""
+    from package_output import PackageError, apply_package
+
+    qet_path = locate_elements(args, config)
+    if not qet_path:
+        return 1
+    print(f"\n[apply] {args.package} -> {qet_path}")
+    try:
+        stats = apply_package(args.package, qet_path, force=args.force)
+    except (PackageError, OSError) as e:
+        print(f"❌ 安装失败，elements 目录未改动: {e}")
+        return 1
+    if stats["conflicts"]:
+        for rel_path in stats["conflicts"][:20]:
+            print(f"  ✗ 已被修改: {rel_path}")
+        print(
+            f"❌ {len(stats['conflicts'])} 个文件在打包之后被修改过，未安装任何文件；"
+            "重新同步并打包，或使用 --force 覆盖"
+        )
+        return 1
+    print(
+        f"✓ 安装完成：更新 {stats['installed']} 个文件（{stats['bytes'] / 1024 / 1024:.1f} MB），"
+        f"{stats['unchanged']} 个文件已是最新"
+    )
+    return 0
+
+
+def watch_tree(config, watcher, qet_path, src_dir, result_dir):
+    """
+    常驻监视 elements：新增/修改/删除的文件同步到 src 后只暂存并翻译这些文件到 result。
+    缓存、翻译记忆、术语表、HTTP 连接和限流器在事件之间一直保留，Ctrl+C 退出
+    """
+    global _memories, _glossary
+    # 每次只有少量文件，不启动进程池
+    config = dict(config, process_workers=0)
+    manifest_path = config.get("sync_manifest_file", "sync_manifest.json")
+    caches = open_caches(config, PROMPT_VERSION)
+    _memories = build_memories(config, caches)
+    _glossary = load_configured_glossary(config)
+    skip_index = None
+    if config.get("skip_index_file", "skip_index.json"):
+        skip_index = SkipIndex(config.get("skip_index_file", "skip_index.json"), config)
+    save_state = None
+    if config.get("translate_mode", "api").lower() != "openai":
+        save_state = CacheSaveState(int(config.get("api_save_every", 10) or 0))
+    printer = ProgressPrinter(config.get("progress_interval", 0.2))
+    totals = {"events": 0, "files": 0, "updated": 0}
+
+    print(f"\n[watch] 监视 {qet_path}（每 {watcher.interval:g}s 检查一次，安静 {watcher.debounce:g}s 后处理，Ctrl+C 退出）")
+    try:
+        while True:
+            added, changed, removed = watcher.wait()
+            start_time = time.time()
+            try:
+                sync_report = sync_changes(qet_path, src_dir, manifest_path, added + changed, removed)
+                if not sync_report.restage and not sync_report.unstage:
+                    continue
+                stage_result(src_dir, result_dir, config.get("result_link_mode", "auto"), sync_report)
+                file_paths = [
+                    os.path.join(result_dir, rel_path)
+                    for rel_path in sync_report.restage
+                    if is_element_file(rel_path.rsplit("/", 1)[-1])
+                ]
+                if skip_index is not None:
+                    skip_index.track(file_paths, src_dir, result_dir, sync_report, sync_report.unstage)
+                counts = {"processed": 0, "updated": 0}
+                if file_paths:
+                    translate_files(file_paths, config, caches, save_state, printer, start_time, counts)
+                for cache in caches.values():
+                    cache.flush()
+                if skip_index is not None:
+                    skip_index.record(file_paths, caches)
+                    skip_index.save()
+                # 多线程翻译时失败的文本只打印不抛出：result 中仍缺少译文的文件留在待暂存变更中，
+                # 下次变更或 translate 时重试
+                failed = [
+                    os.path.relpath(file_path, result_dir).replace(os.sep, "/")
+                    for file_path in file_paths
+                    if extract_missing(read_element(file_path, config)[0], config)[0]
+                ]
+                mark_staged(manifest_path, failed)
+            except Exception as e:
+                print(f"\n[watch] ❌ 处理变更失败（已记录到同步清单，稍后重试）: {e}")
+                continue
+            if failed:
+                print(f"\n[watch] ⚠ {len(failed)} 个元件文件仍缺少译文，已记录到同步清单，稍后重试")
+            totals["events"] += 1
+            totals["files"] += len(file_paths)
+            totals["updated"] += counts["updated"]
+            print(
+                f"\n[watch] {datetime.now().strftime('%H:%M:%S')} 新增 {len(sync_report.added)}，"
+                f"修改 {len(sync_report.changed)}，删除 {len(sync_report.removed)} → "
+                f"更新 {counts['updated']}/{len(file_paths)} 个元件文件，用时 {time.time() - start_time:.1f}s"
+            )
+    except KeyboardInterrupt:
+        print("\n[watch] 停止监视")
+    finally:
+        for cache in caches.values():
+            cache.close()
+        close_transport()
+    print(f"[watch] 共处理 {totals['events']} 次变更，{totals['files']} 个元件文件，更新 {totals['updated']} 个")
+    return totals
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+翻译记忆：在精确匹配的缓存之前复用已有译文
+
+- 规范化键：NFKC、忽略大小写、合并空白、去掉 + - / , ( ) 等符号两侧的空格，
+  "Single-pole source + PE +N" 和 "single-pole source+PE + N" 视为同一条
+- 字符三元组倒排索引，按 Dice 系数查找近似条目
+- 近似条目可直接复用（reuse，要求数字完全一致），或作为 few-shot 参考交给模型（context）
+"""
+
+import re
+import threading
+import unicodedata
+
+_SPACE_RE = re.compile(r"\s+")
+_PUNCT_SPACE_RE = re.compile(r"\s*([+\-/,;:()\[\]])\s*")
+_DIGITS_RE = re.compile(r"\d+")
+
+
+def normalize_key(text):
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = _SPACE_RE.sub(" ", text).strip()
+    text = _PUNCT_SPACE_RE.sub(r"\1", text)
+    return text.rstrip(".")
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TranslationMemory:
+    """
+    一个目标语言的翻译记忆，由该语言的缓存构建；新译文通过 add() 实时加入
+    """
+
+    def __init__(self, cache_items=(), threshold=0.85, max_candidates=200):
+        self.threshold = float(threshold)
+        self.max_candidates = max_candidates
+        self._entries = {}  # 规范化键 -> (原文, 译文)
+        self._grams = {}  # 规范化键 -> 三元组集合
+        self._index = {}  # 三元组 -> 规范化键集合
+        self._lock = threading.Lock()
+        for source, translated in cache_items:
+            self._add(source, translated)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, source, translated):
+        with self._lock:
+            self._add(source, translated)
+
+    def _add(self, source, translated):
+        if not translated:
+            return
+        key = normalize_key(source)
+        if key in self._entries:
+            return
+        grams = trigrams(key)
+        self._entries[key] = (source, translated)
+        self._grams[key] = grams
+        for gram in grams:
+            self._index.setdefault(gram, set()).add(key)
+
+    def exact(self, text):
+        """规范化后完全相同的条目的译文"""
+        entry = self._entries.get(normalize_key(text))
+        return entry[1] if entry else None
+
+    def similar(self, text, limit=3, threshold=None):
+        """
+        返回 [(相似度, 原文, 译文)]，按相似度从高到低，不含规范化后完全相同的条目
+        """
+        threshold = self.threshold if threshold is None else threshold
+        key = normalize_key(text)
+        grams = trigrams(key)
+        with self._lock:
+            shared = {}
+            for gram in grams:
+                for candidate in self._index.get(gram, ()):
+                    shared[candidate] = shared.get(candidate, 0) + 1
+            ranked = sorted(shared.items(), key=lambda item: -item[1])[: self.max_candidates]
+            matches = []
+            for candidate, count in ranked:
+                if candidate == key:
+                    continue
+                score = 2.0 * count / (len(grams) + len(self._grams[candidate]))
+                if score >= threshold:
+                    source, translated = self._entries[candidate]
+                    matches.append((score, source, translated))
+        matches.sort(key=lambda match: -match[0])
+        return matches[:limit]
+
+    def reusable(self, text):
+        """
+        可直接复用的译文：规范化后完全相同，或近似且数字部分完全一致
+        （"Motor 1" 与 "Motor 2" 相似度很高，但译文不能互换）
+        返回 (译文, 匹配方式)；没有时返回 (None, None)
+        """
+        translated = self.exact(text)
+        if translated:
+            return translated, "exact"
+        digits = _DIGITS_RE.findall(text)
+        for _, source, candidate in self.similar(text, limit=3):
+            if _DIGITS_RE.findall(source) == digits:
+                return candidate, "fuzzy"
+        return None, None
+
+
+def build_memories(config, caches):
+    """每个目标语言一份翻译记忆；translation_memory=false 时返回空字典"""
+    if not config.get("translation_memory", True):
+        return {}
+    threshold = config.get("tm_fuzzy_threshold", 0.85)
+    return {
+        lang: TranslationMemory(list(cache.items()), threshold)
+        for lang, cache in caches.items()
+    }
@@ -0,0 +1,88 @@
+"""
+监视 elements 目录的变化（watch 子命令）
+
+- 定期用 os.scandir 遍历目录，比较每个文件的大小和修改时间；标准库没有 inotify 接口，
+  而且需要同时支持 Windows，所以只用轮询，一万多个文件的目录遍历一次约几十毫秒
+- 发现变化后等目录安静 debounce 秒再返回（编辑器保存、批量复制时会连续产生多次变化），
+  持续变化超过 max_delay 秒时也返回，避免一直等待
+- 返回的是与上次返回时相比的净变化：保存过程中出现又消失的临时文件不会出现在结果中
+"""
+
+import os
+import time
+
+
+def scan_tree(root):
+    """{相对路径（/ 分隔）: (大小, 修改时间 ns)}"""
+    snapshot = {}
+    stack = [("", root)]
+    while stack:
+        prefix, folder = stack.pop()
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            # 目录在遍历过程中被删除或暂时无法访问，下次轮询再看
+            continue
+        for entry in entries:
+            rel_path = f"{prefix}{entry.name}"
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((f"{rel_path}/", entry.path))
+                elif entry.is_file():
+                    st = entry.stat()
+                    snapshot[rel_path] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                continue
+    return snapshot
+
+
+def diff_snapshots(old, new):
+    """返回 (新增, 修改, 删除) 三个排好序的相对路径列表"""
+    added = sorted(path for path in new if path not in old)
+    changed = sorted(path for path in new if path in old and new[path] != old[path])
+    removed = sorted(path for path in old if path not in new)
+    return added, changed, removed
+
+
+class TreeWatcher:
+    def __init__(self, root, interval=1.0, debounce=0.5, max_delay=10.0):
+        self.root = root
+        self.interval = max(0.05, float(interval))
+        self.debounce = max(0.0, float(debounce))
+        self.max_delay = max(self.debounce, float(max_delay))
+        # 创建时记录基准，之后（包括首次完整同步期间）的变化都会在第一次 wait() 时返回
+        self.snapshot = scan_tree(root)
+
+    def poll(self):
+        """立即检查一次，不等待目录安静；返回 (新增, 修改, 删除)"""
+        current = scan_tree(self.root)
+        changes = diff_snapshots(self.snapshot, current)
+        self.snapshot = current
+        return changes
+
+    def wait(self):
+        """阻塞到有变化且目录安静 debounce 秒，返回 (新增, 修改, 删除)"""
+        while True:
+            time.sleep(self.interval)
+            current = scan_tree(self.root)
+            if current == self.snapshot:
+                continue
+            current = self._settle(current)
+            changes = diff_snapshots(self.snapshot, current)
+            self.snapshot = current
+            if any(changes):
+                return changes
+
+    def _settle(self, current):
+        first_change = last_change = time.monotonic()
+        step = min(self.interval, self.debounce / 2) if self.debounce else 0
+        while self.debounce:
+            now = time.monotonic()
+            if now - last_change >= self.debounce or now - first_change >= self.max_delay:
+                break
+            time.sleep(step)
+            latest = scan_tree(self.root)
+            if latest != current:
+                current = latest
+                last_change = time.monotonic()
+        return current
@@ -0,0 +1,69 @@
+"""测试共用：把 scripts 加入导入路径，生成合成元件库并启动本地模拟翻译服务"""
+
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+import benchmark  # noqa: E402
+import translate_to_result as ttr  # noqa: E402
+
+
+class Workspace:
+    """临时工作目录：elements（合成元件库）、src、result 和指向模拟服务的配置"""
+
+    def __init__(self, files=30, unique=10, zh_ratio=0.0, **config):
+        self.root = tempfile.mkdtemp(prefix="qet-test-")
+        self.elements = os.path.join(self.root, "elements")
+        self.src = os.path.join(self.root, "src")
+        self.result = os.path.join(self.root, "result")
+        benchmark.generate_library(self.elements, files=files, unique_names=unique, zh_ratio=zh_ratio, body_size=500)
+        self.server = benchmark.MockTranslationServer()
+        self.server.start()
+        self.config = {
+            "endpoint": f"{self.server.base_url}/translate",
+            "translate_mode": "api",
+            "to_lang": "zh-CHS",
+            "max_workers": 0,
+            "sleep_seconds": 0,
+            "cache_file": self.path("translate_cache.json"),
+            "failed_log_file": self.path("translate_failed.jsonl"),
+            "sync_manifest_file": self.path("sync_manifest.json"),
+            "skip_index_file": self.path("skip_index.json"),
+            "glossary_file": self.path("glossary.json"),
+            "run_report_file": "",
+        }
+        self.config.update(config)
+
+    def path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    def sync(self):
+        with quiet():
+            return ttr.sync_elements(self.elements, self.src, self.config["sync_manifest_file"])
+
+    def translate(self):
+        ttr.reset_metrics()
+        with quiet():
+            return ttr.translate_tree(self.config, self.src, self.result, self.sync_report())
+
+    def sync_report(self):
+        return ttr.load_sync_report(self.config["sync_manifest_file"])
+
+    def verify(self):
+        with quiet():
+            return ttr.verify_tree(self.config, self.src, self.result)
+
+    def close(self):
+        self.server.stop()
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
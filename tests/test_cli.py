@@ -0,0 +1,49 @@
+import json
+import os
+import unittest
+
+from support import Workspace, quiet, ttr
+
+
+class TranslateCommandTest(unittest.TestCase):
+    def setUp(self):
+        self.ws = Workspace(files=5, unique=3)
+        self.config_file = self.ws.path("translate_config.json")
+        with open(self.config_file, "w", encoding="utf-8") as f:
+            json.dump(self.ws.config, f)
+
+    def tearDown(self):
+        self.ws.close()
+
+    def run_translate(self):
+        with quiet():
+            return ttr.main(
+                ["translate", "--config", self.config_file, "--src", self.ws.src, "--result", self.ws.result]
+            )
+
+    def test_translate_without_sync_fails(self):
+        self.assertEqual(self.run_translate(), 1)
+        self.assertFalse(os.path.exists(self.ws.result))
+
+    def test_translate_without_manifest_fails(self):
+        self.ws.sync()
+        os.remove(self.ws.config["sync_manifest_file"])
+        self.assertEqual(self.run_translate(), 1)
+        self.assertFalse(os.path.exists(self.ws.result))
+
+    def test_conflicting_target_languages_fail(self):
+        self.ws.sync()
+        self.ws.config["to_lang"] = ["zh-CHS", "zh-TW"]
+        with open(self.config_file, "w", encoding="utf-8") as f:
+            json.dump(self.ws.config, f)
+        self.assertEqual(self.run_translate(), 1)
+        self.assertFalse(os.path.exists(self.ws.result))
+
+    def test_translate_after_sync(self):
+        self.ws.sync()
+        self.assertEqual(self.run_translate(), 0)
+        self.assertEqual(self.ws.verify(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
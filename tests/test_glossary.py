@@ -0,0 +1,53 @@
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+from support import ttr
+
+import glossary  # noqa: E402  support 已把 scripts 加入导入路径
+
+
+class GlossaryCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="qet-test-")
+        self.path = os.path.join(self.root, "glossary.json")
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"Ground": "接地", "Chassis": "机壳", "Chassis ground": "机壳接地"}, f, ensure_ascii=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_cache_is_json_and_reloads(self):
+        first = ttr.load_glossary(self.path, "zh-CHS")
+        with open(f"{self.path}.cache", encoding="utf-8") as f:
+            cached = json.load(f)
+        self.assertEqual(cached["version"], glossary.GLOSSARY_CACHE_VERSION)
+
+        second = ttr.load_glossary(self.path, "zh-CHS")
+        self.assertEqual(second.automaton.goto, first.automaton.goto)
+        self.assertEqual(second.translate("Chassis ground / Ground", "zh-CHS"), "机壳接地 / 接地")
+
+    def test_pickle_cache_is_never_unpickled(self):
+        with open(f"{self.path}.cache", "wb") as f:
+            pickle.dump({"version": glossary.GLOSSARY_CACHE_VERSION}, f)
+        loaded = ttr.load_glossary(self.path, "zh-CHS")
+        self.assertEqual(loaded.translate("Ground", "zh-CHS"), "接地")
+        with open(f"{self.path}.cache", encoding="utf-8") as f:
+            self.assertEqual(json.load(f)["version"], glossary.GLOSSARY_CACHE_VERSION)
+
+    def test_malformed_tables_are_rebuilt(self):
+        ttr.load_glossary(self.path, "zh-CHS")
+        with open(f"{self.path}.cache", encoding="utf-8") as f:
+            cached = json.load(f)
+        cached["automaton"]["fail"][1] = 10 ** 6
+        with open(f"{self.path}.cache", "w", encoding="utf-8") as f:
+            json.dump(cached, f)
+        loaded = ttr.load_glossary(self.path, "zh-CHS")
+        self.assertEqual(loaded.translate("Chassis", "zh-CHS"), "机壳")
+
+
+if __name__ == "__main__":
+    unittest.main()
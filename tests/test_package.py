@@ -0,0 +1,96 @@
+import contextlib
+import io
+import os
+import shutil
+import unittest
+from unittest import mock
+
+from support import Workspace, quiet, ttr
+
+import package_output  # noqa: E402  support 已把 scripts 加入导入路径
+
+
+class ApplyPackageTest(unittest.TestCase):
+    def setUp(self):
+        self.ws = Workspace(files=6, unique=6)
+        self.ws.sync()
+        self.archive = self.ws.path("out", "zh.zip")
+        with quiet():
+            ttr.package_tree(self.ws.config, self.ws.src, self.archive, False, self.ws.sync_report())
+        self.target = self.ws.path("target")
+        shutil.copytree(self.ws.elements, self.target)
+        # 目标中缺少一个分类目录，安装时需要新建
+        shutil.rmtree(os.path.join(self.target, "20_logic"))
+
+    def tearDown(self):
+        self.ws.close()
+
+    def apply(self, force=False):
+        with quiet():
+            return package_output.apply_package(self.archive, self.target, force)
+
+    def listing(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.target)
+            for root, dirs, files in os.walk(self.target)
+            for name in dirs + files
+        )
+
+    def test_conflict_leaves_target_untouched(self):
+        with open(os.path.join(self.target, "10_electric", "000", "element_000000.elmt"), "a", encoding="utf-8") as f:
+            f.write("\n")
+        before = self.listing()
+
+        stats = self.apply()
+
+        self.assertIn("10_electric/000/element_000000.elmt", stats["conflicts"])
+        self.assertEqual(stats["installed"], 0)
+        self.assertEqual(self.listing(), before)
+
+    def test_corrupt_archive_leaves_target_untouched(self):
+        with open(self.archive, "r+b") as f:
+            f.seek(-200, os.SEEK_END)
+            f.write(b"\0" * 50)
+        before = self.listing()
+
+        with self.assertRaises(Exception):
+            self.apply()
+
+        self.assertEqual(self.listing(), before)
+
+    def test_failed_commit_removes_created_directories(self):
+        before = self.listing()
+        replace = os.replace
+        calls = []
+
+        def fail_late(src, dst):
+            calls.append(dst)
+            if len(calls) == 6:
+                raise OSError("disk full")
+            return replace(src, dst)
+
+        with mock.patch("os.replace", side_effect=fail_late), self.assertRaises(OSError):
+            self.apply(force=True)
+
+        self.assertEqual(self.listing(), before)
+
+    def test_apply_creates_missing_directories(self):
+        stats = self.apply(force=True)
+
+        self.assertFalse(stats["conflicts"])
+        with open(os.path.join(self.target, "20_logic", "000", "element_000001.elmt"), encoding="utf-8") as f:
+            self.assertIn('<name lang="zh">', f.read())
+        self.assertFalse([name for name in os.listdir(self.target) if name.startswith(package_output.STAGING_PREFIX)])
+        self.assertFalse(os.path.exists(os.path.join(self.target, package_output.APPLY_JOURNAL)))
+
+
+class ArgumentsTest(unittest.TestCase):
+    def test_delta_requires_archive(self):
+        with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit) as raised:
+            ttr.parse_args(["translate", "--delta"])
+        self.assertEqual(raised.exception.code, 2)
+        self.assertTrue(ttr.parse_args(["translate", "--archive", "out.zip", "--delta"]).delta)
+
+
+if __name__ == "__main__":
+    unittest.main()
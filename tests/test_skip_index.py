@@ -0,0 +1,66 @@
+import os
+import unittest
+
+from support import Workspace, ttr
+
+
+class SkipIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.ws = Workspace()
+        self.ws.sync()
+        self.ws.translate()
+
+    def tearDown(self):
+        self.ws.close()
+
+    def element_paths(self):
+        return sorted(
+            os.path.join(root, name)
+            for root, _, files in os.walk(self.ws.result)
+            for name in files
+            if name.endswith(".elmt")
+        )
+
+    def test_unchanged_rerun_skips_everything(self):
+        stats = self.ws.translate()
+        self.assertEqual(stats["processed"], 0)
+        self.assertEqual(stats["skipped"], stats["total_files"])
+        self.assertEqual(self.ws.verify(), 0)
+
+    def test_deleted_result_file_is_translated_again(self):
+        victim = self.element_paths()[2]
+        os.remove(victim)
+
+        stats = self.ws.translate()
+
+        self.assertEqual(stats["processed"], 1)
+        with open(victim, encoding="utf-8") as f:
+            self.assertIn('<name lang="zh">', f.read())
+        self.assertEqual(self.ws.verify(), 0)
+
+    def test_corrected_cache_translation_reaches_translated_files(self):
+        self.assert_correction_applied()
+
+    def test_corrected_translation_without_skip_index(self):
+        self.ws.config["skip_index_file"] = ""
+        self.assert_correction_applied()
+
+    def assert_correction_applied(self):
+        victim = self.element_paths()[0]
+        header, _ = ttr.read_element(os.path.join(self.ws.src, os.path.relpath(victim, self.ws.result)), self.ws.config)
+        source_text = ttr.extract_source_text(header, self.ws.config)
+        caches = ttr.open_caches(self.ws.config, ttr.PROMPT_VERSION)
+        caches["zh-CHS"][source_text] = "修正后的译文"
+        for cache in caches.values():
+            cache.close()
+
+        self.ws.translate()
+
+        with open(victim, encoding="utf-8") as f:
+            content = f.read()
+        self.assertIn('<name lang="zh">修正后的译文</name>', content)
+        self.assertEqual(content.count('<name lang="zh">'), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,21 @@
+import unittest
+
+from support import ttr
+
+
+class TargetLangsTest(unittest.TestCase):
+    def test_default_codes(self):
+        config = {"to_lang": ["zh-CHS", "pt-BR", "es"]}
+        self.assertEqual(ttr.target_langs(config), [("zh-CHS", "zh"), ("pt-BR", "pt_BR"), ("es", "es")])
+
+    def test_languages_with_same_qet_code_are_rejected(self):
+        with self.assertRaisesRegex(ValueError, "qet_lang_map"):
+            ttr.target_langs({"to_lang": ["zh-CHS", "zh-TW"]})
+
+    def test_qet_lang_map_resolves_conflict(self):
+        config = {"to_lang": ["zh-CHS", "zh-TW"], "qet_lang_map": {"zh-TW": "zh_TW"}}
+        self.assertEqual(ttr.target_langs(config), [("zh-CHS", "zh"), ("zh-TW", "zh_TW")])
+
+
+if __name__ == "__main__":
+    unittest.main()
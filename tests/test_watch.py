@@ -0,0 +1,101 @@
+import os
+import unittest
+from unittest import mock
+
+from support import Workspace, quiet, ttr
+
+
+class ScriptedWatcher:
+    """按顺序返回预先给定的变更（也可以是返回变更的函数），用完后模拟 Ctrl+C"""
+
+    interval = 0
+    debounce = 0
+
+    def __init__(self, events):
+        self.events = list(events)
+
+    def wait(self):
+        if not self.events:
+            raise KeyboardInterrupt
+        event = self.events.pop(0)
+        return event() if callable(event) else event
+
+
+class WatchTest(unittest.TestCase):
+    def setUp(self):
+        self.ws = Workspace(files=6, unique=6)
+        self.ws.sync()
+        self.ws.translate()
+        self.rel_path = "10_electric/000/element_000000.elmt"
+        path = os.path.join(self.ws.elements, *self.rel_path.split("/"))
+        with open(path, encoding="utf-8") as f:
+            content = f.read()
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content.replace('<name lang="en">', '<name lang="en">Renamed ', 1))
+
+    def tearDown(self):
+        self.ws.close()
+
+    def watch(self, events):
+        with quiet():
+            ttr.watch_tree(self.ws.config, ScriptedWatcher(events), self.ws.elements, self.ws.src, self.ws.result)
+
+    def result_text(self):
+        with open(os.path.join(self.ws.result, *self.rel_path.split("/")), encoding="utf-8") as f:
+            return f.read()
+
+    def test_failed_event_stays_pending(self):
+        with mock.patch.object(ttr, "stage_result", side_effect=OSError("disk full")):
+            self.watch([([], [self.rel_path], [])])
+
+        self.assertIn(self.rel_path, self.ws.sync_report().restage)
+        self.assertNotIn("Renamed", self.result_text())
+
+    def test_failed_event_is_retried_on_next_event(self):
+        original = ttr.stage_result
+        calls = []
+
+        def fail_once(*args):
+            calls.append(args)
+            if len(calls) == 1:
+                raise OSError("disk full")
+            return original(*args)
+
+        with mock.patch.object(ttr, "stage_result", side_effect=fail_once):
+            self.watch([([], [self.rel_path], []), ([], ["10_electric/qet_directory"], [])])
+
+        self.assertEqual(self.ws.sync_report().restage, [])
+        content = self.result_text()
+        self.assertIn("Renamed", content)
+        self.assertEqual(content.count('<name lang="zh">'), 1)
+        self.assertEqual(self.ws.verify(), 0)
+
+    def test_failed_translation_in_parallel_mode_is_retried(self):
+        self.ws.config["max_workers"] = 4
+        original = ttr._translate_uncached
+        failing = [True]
+
+        def flaky(*args, **kwargs):
+            if failing[0]:
+                raise OSError("connection reset")
+            return original(*args, **kwargs)
+
+        def unrelated_event():
+            # 第一次变更翻译失败后文件仍在清单中，恢复后端后由下一次无关的变更重试
+            self.assertIn(self.rel_path, self.ws.sync_report().restage)
+            self.assertNotIn('<name lang="zh">', self.result_text())
+            failing[0] = False
+            return [], ["10_electric/qet_directory"], []
+
+        with mock.patch.object(ttr, "_translate_uncached", side_effect=flaky):
+            self.watch([([], [self.rel_path], []), unrelated_event])
+
+        self.assertEqual(self.ws.sync_report().restage, [])
+        content = self.result_text()
+        self.assertIn("Renamed", content)
+        self.assertEqual(content.count('<name lang="zh">'), 1)
+        self.assertEqual(self.ws.verify(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()